@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+ARQUIVO_LOCK = os.environ.get('AGENDADOR_LOCK', '/tmp/solarpro_agendador.lock')
+
+
+class Tarefa:
+    def __init__(self, nome, intervalo, funcao):
+        self.nome = nome
+        self.intervalo = intervalo
+        self.funcao = funcao
+        self.proxima_execucao = 0
+        self.ultima_execucao = None
+        self.ultima_duracao = None
+        self.ultimo_erro = None
+
+
+class Agendador:
+    """Executa tarefas periódicas em uma thread de segundo plano.
+
+    Com vários workers do Gunicorn cada processo chama iniciar(), mas só o
+    que conseguir o lock do arquivo executa as tarefas. Os demais continuam
+    tentando, assumindo se o dono do lock morrer.
+    """
+
+    def __init__(self, arquivo_lock=ARQUIVO_LOCK, intervalo_verificacao=5):
+        self.arquivo_lock = arquivo_lock
+        self.intervalo_verificacao = intervalo_verificacao
+        self.tarefas = {}
+        self._app = None
+        self._thread = None
+        self._parar = threading.Event()
+        self._fd_lock = None
+
+    def init_app(self, app):
+        """Tarefas passam a rodar dentro do contexto da aplicação"""
+        self._app = app
+
+    def tarefa(self, intervalo, nome=None):
+        """Decorator para registrar uma função como tarefa periódica (intervalo em segundos)"""
+        def decorator(funcao):
+            self.registrar(nome or funcao.__name__, intervalo, funcao)
+            return funcao
+        return decorator
+
+    def registrar(self, nome, intervalo, funcao):
+        self.tarefas[nome] = Tarefa(nome, intervalo, funcao)
+
+    def _obter_lock(self):
+        if self._fd_lock is not None:
+            return True
+        if fcntl is None:
+            self._fd_lock = -1
+            return True
+        fd = os.open(self.arquivo_lock, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd_lock = fd
+        print(f"[Agendador] Lock obtido pelo processo {os.getpid()}")
+        return True
+
+    def _liberar_lock(self):
+        if self._fd_lock not in (None, -1):
+            fcntl.flock(self._fd_lock, fcntl.LOCK_UN)
+            os.close(self._fd_lock)
+        self._fd_lock = None
+
+    def executar(self, tarefa):
+        inicio = time.perf_counter()
+        try:
+            if self._app is not None:
+                with self._app.app_context():
+                    tarefa.funcao()
+            else:
+                tarefa.funcao()
+            tarefa.ultimo_erro = None
+        except Exception as e:
+            tarefa.ultimo_erro = str(e)
+            print(f"[Agendador] Erro na tarefa {tarefa.nome}: {e}")
+        tarefa.ultima_duracao = time.perf_counter() - inicio
+        tarefa.ultima_execucao = datetime.now()
+        tarefa.proxima_execucao = time.monotonic() + tarefa.intervalo
+
+    def executar_agora(self, nome):
+        self.executar(self.tarefas[nome])
+
+    def _loop(self):
+        while not self._parar.is_set():
+            if self._obter_lock():
+                agora = time.monotonic()
+                for tarefa in list(self.tarefas.values()):
+                    if self._parar.is_set():
+                        break
+                    if agora >= tarefa.proxima_execucao:
+                        self.executar(tarefa)
+            self._parar.wait(self.intervalo_verificacao)
+        self._liberar_lock()
+
+    def iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._loop, name='agendador', daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.intervalo_verificacao + 1)
+        self._thread = None
+
+    def get_status(self):
+        return {
+            'ativo': self._thread is not None and self._thread.is_alive(),
+            'lider': self._fd_lock is not None,
+            'tarefas': [{
+                'nome': t.nome,
+                'intervalo': t.intervalo,
+                'ultima_execucao': t.ultima_execucao.isoformat() if t.ultima_execucao else None,
+                'ultima_duracao': t.ultima_duracao,
+                'ultimo_erro': t.ultimo_erro
+            } for t in self.tarefas.values()]
+        }
+
+
+agendador = Agendador()
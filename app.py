@@ -1,20 +1,55 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, g, Response
+from flask import before_render_template, template_rendered, send_file, send_from_directory, abort
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask_mail import Mail
 from werkzeug.utils import secure_filename
-import sqlite3
+from werkzeug.middleware.proxy_fix import ProxyFix
 import json
 from datetime import datetime, timedelta
 from functools import wraps
 import os
 import uuid
+import time
+import hashlib
+import metricas
 from gemini_service import gemini_service
-from database import init_db
-
-# Inicializar banco de dados ao importar o app (necessário para Gunicorn/Render)
-init_db()
+from pagamento_service import pagamento_service
+from agendador import agendador
+from email_service import email_service
+from cache_templates import configurar_cache_bytecode, aquecer_templates
+from catalogo import mapa_precos, invalidar_catalogo, listagem, versao_catalogo, preco_efetivo, CAMPOS_API
+from respostas import resposta_json, nao_modificado, campos_pedidos, filtrar_campos
+from frete import buscar_cep, cotar_frete
+from replica import replica, REPLICA_INTERVALO
+from feed import feed, FEED_INTERVALO, ARQUIVOS_FEED
+from sitemap import sitemap, SITEMAP_INTERVALO
+from recomendacoes import recomendador, RECOMENDACOES_INTERVALO
+from database import preparar_banco, get_db_connection
+from repositorio import get_config, get_configs, set_config
+import repositorio
+from usuarios import User, cache_usuarios
+from limites import limitador, tempo_na_fila_ms, interpretar_limite, ENDPOINTS_DESCARTAVEIS, FILA_MAX_MS
+from limites import REGRAS as REGRAS_LIMITE
+from sessoes import sessoes, SESSAO_LIMPEZA
+from precos import precos, descricao_cupom
+from importacao import ImportacaoInterrompida, importador, ler_arquivo
+from promocoes import agenda_promocoes, TIPOS_PROMOCAO, PROMOCOES_INTERVALO
+from senhas import senhas, SenhasOcupado, tentativas_login, LOGIN_MAX_FALHAS_IP, LOGIN_MAX_FALHAS_EMAIL
+
+# Inicializar banco de dados ao importar o app (necessário para Gunicorn/Render).
+# Só executa o schema completo quando a versão gravada no banco estiver desatualizada.
+preparar_banco()
 
 app = Flask(__name__)
+configurar_cache_bytecode(app)
+
+# Proxies na frente do app que acrescentam X-Forwarded-For/-Proto (no Render, o
+# balanceador). Sem isso request.remote_addr seria o do balanceador para todos os
+# clientes, e o limite de falhas de login e os limites por rota valeriam para a
+# loja inteira. Fora do Render o padrão é 0: sem proxy, o cabeçalho é forjável
+PROXIES_CONFIAVEIS = int(os.environ.get('PROXIES_CONFIAVEIS', 1 if os.environ.get('RENDER') else 0))
+if PROXIES_CONFIAVEIS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXIES_CONFIAVEIS, x_proto=PROXIES_CONFIAVEIS)
 app.config['UPLOAD_FOLDER'] = 'static/images/products'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -23,6 +58,21 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 app.secret_key = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+# Sessões guardadas no servidor (SESSAO_ARMAZENAMENTO=cookie volta ao cookie assinado do Flask)
+if sessoes is not None:
+    app.session_interface = sessoes
+app.config['SITE_URL'] = os.environ.get('SITE_URL', 'http://localhost:5000').rstrip('/')
+
+# Email (Flask-Mail) - envio desativado enquanto MAIL_SERVER não for definido
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', '')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
+app.config['MAIL_USE_SSL'] = os.environ.get('MAIL_USE_SSL', '0') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'contato@solarpro.com')
+mail = Mail(app)
+email_service.init_app(app, mail)
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -30,31 +80,9 @@ login_manager.login_view = 'login'
 login_manager.login_message = 'Faça login para continuar.'
 login_manager.login_message_category = 'info'
 
-class User(UserMixin):
-    def __init__(self, id, nome, email, tipo, telefone=None, cpf=None, endereco=None, cidade=None, estado=None, cep=None):
-        self.id = id
-        self.nome = nome
-        self.email = email
-        self.tipo = tipo
-        self.telefone = telefone
-        self.cpf = cpf
-        self.endereco = endereco
-        self.cidade = cidade
-        self.estado = estado
-        self.cep = cep
-    
-    def is_admin(self):
-        return self.tipo == 'admin'
-
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM usuarios WHERE id = ? AND ativo = 1', (user_id,)).fetchone()
-    conn.close()
-    if user:
-        return User(user['id'], user['nome'], user['email'], user['tipo'],
-                   user['telefone'], user['cpf'], user['endereco'], user['cidade'], user['estado'], user['cep'])
-    return None
+    return cache_usuarios.obter(user_id)
 
 def admin_required(f):
     @wraps(f)
@@ -73,6 +101,11 @@ def format_price_filter(value):
     except (ValueError, TypeError):
         return "R$ 0,00"
 
+@app.template_filter('preco_efetivo')
+def preco_efetivo_filter(produto):
+    """Preço de venda (promocional ou campanha) para cards montados direto das linhas de produtos"""
+    return preco_efetivo(produto)
+
 @app.template_filter('from_json')
 def from_json_filter(value):
     try:
@@ -92,24 +125,6 @@ def format_date_filter(value):
         pass
     return value
 
-def get_db_connection():
-    conn = sqlite3.connect('solarpro.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_config(chave, default=''):
-    conn = get_db_connection()
-    config = conn.execute('SELECT valor FROM configuracoes WHERE chave = ?', (chave,)).fetchone()
-    conn.close()
-    return config['valor'] if config else default
-
-def set_config(chave, valor):
-    conn = get_db_connection()
-    conn.execute('''INSERT OR REPLACE INTO configuracoes (chave, valor, data_atualizacao)
-                    VALUES (?, ?, ?)''', (chave, valor, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-    conn.commit()
-    conn.close()
-
 def log_admin_action(usuario_id, acao, detalhes=''):
     conn = get_db_connection()
     conn.execute('''INSERT INTO logs_admin (usuario_id, acao, detalhes, ip, data)
@@ -125,10 +140,7 @@ def utility_processor():
     
     def get_cart_count():
         if current_user.is_authenticated:
-            conn = get_db_connection()
-            carrinho = conn.execute('SELECT produtos_json FROM carrinhos WHERE usuario_id = ? AND status = "ativo"', 
-                                   (current_user.id,)).fetchone()
-            conn.close()
+            carrinho = repositorio.buscar_carrinho_ativo(current_user.id)
             if carrinho and carrinho['produtos_json']:
                 produtos = json.loads(carrinho['produtos_json'])
                 return sum(p.get('quantidade', 0) for p in produtos)
@@ -136,11 +148,7 @@ def utility_processor():
     
     def get_loja_config():
         """Retorna todas as configurações da loja para usar nos templates"""
-        conn = get_db_connection()
-        configs = conn.execute('SELECT chave, valor FROM configuracoes WHERE chave LIKE "loja_%"').fetchall()
-        conn.close()
-        config_dict = {c['chave']: c['valor'] for c in configs}
-        return config_dict
+        return repositorio.configuracoes_loja()
     
     return dict(
         product_image_url=product_image_url, 
@@ -148,14 +156,44 @@ def utility_processor():
         loja=get_loja_config()
     )
 
+# ============== EMAILS ==============
+# As rotas só enfileiram (email_service); o envio acontece no agendador.
+
+def enfileirar_confirmacao_contato(conn, nome, email):
+    loja_nome = get_config('loja_nome', 'SolarPro')
+    corpo = (f"Olá, {nome}!\n\n"
+             f"Recebemos sua mensagem e entraremos em contato em breve.\n\n"
+             f"Equipe {loja_nome}")
+    email_service.enfileirar(email, f'{loja_nome}: recebemos sua mensagem', corpo, 'contato', conn=conn)
+
+def enfileirar_confirmacao_pedido(conn, pedido_id, nome, email, produtos, total):
+    loja_nome = get_config('loja_nome', 'SolarPro')
+    itens = '\n'.join(f"- {p['quantidade']}x {p['nome']}: {format_price_filter(p['subtotal'])}" for p in produtos)
+    corpo = (f"Olá, {nome}!\n\n"
+             f"Recebemos seu pedido #{pedido_id}:\n{itens}\n\n"
+             f"Total: {format_price_filter(total)}\n"
+             f"Acompanhe em: {app.config['SITE_URL']}/pedido/{pedido_id}\n\n"
+             f"Equipe {loja_nome}")
+    email_service.enfileirar(email, f'{loja_nome}: pedido #{pedido_id} recebido', corpo, 'pedido', conn=conn)
+
+def enfileirar_status_pagamento(conn, pedido_id, nome, email, status):
+    loja_nome = get_config('loja_nome', 'SolarPro')
+    descricao = {
+        'aprovado': 'foi aprovado! Em breve seu pedido será preparado para envio.',
+        'pendente': 'está pendente. Avisaremos assim que for confirmado.'
+    }.get(status, f'mudou para: {status}.')
+    corpo = (f"Olá, {nome}!\n\n"
+             f"O pagamento do pedido #{pedido_id} {descricao}\n"
+             f"Acompanhe em: {app.config['SITE_URL']}/pedido/{pedido_id}\n\n"
+             f"Equipe {loja_nome}")
+    email_service.enfileirar(email, f'{loja_nome}: pagamento do pedido #{pedido_id}', corpo, 'pagamento', conn=conn)
+
 # ============== ROTAS PÚBLICAS ==============
 
 @app.route('/')
 def index():
     conn = get_db_connection()
-    produtos_destaque = conn.execute('SELECT * FROM produtos WHERE ativo = 1 AND destaque = 1 ORDER BY RANDOM() LIMIT 6').fetchall()
-    if len(produtos_destaque) < 6:
-        produtos_destaque = conn.execute('SELECT * FROM produtos WHERE ativo = 1 ORDER BY RANDOM() LIMIT 6').fetchall()
+    produtos_destaque = repositorio.produtos_destaque(6, conn)
     depoimentos = conn.execute('SELECT * FROM depoimentos ORDER BY data DESC LIMIT 4').fetchall()
     projetos = conn.execute('SELECT * FROM projetos ORDER BY data DESC LIMIT 4').fetchall()
     conn.close()
@@ -166,76 +204,57 @@ def index():
 
 @app.route('/produtos')
 def produtos():
-    conn = get_db_connection()
     categoria = request.args.get('categoria', '')
     ordem = request.args.get('ordem', 'nome')
     busca = request.args.get('busca', '')
     
-    query = 'SELECT * FROM produtos WHERE ativo = 1'
-    params = []
-    
-    if categoria:
-        query += ' AND categoria = ?'
-        params.append(categoria)
-    
-    if busca:
-        query += ' AND (nome LIKE ? OR descricao LIKE ?)'
-        params.extend([f'%{busca}%', f'%{busca}%'])
-    
-    if ordem == 'preco_asc':
-        query += ' ORDER BY preco ASC'
-    elif ordem == 'preco_desc':
-        query += ' ORDER BY preco DESC'
-    elif ordem == 'potencia_desc':
-        query += ' ORDER BY potencia_watts DESC'
-    elif ordem == 'vendas':
-        query += ' ORDER BY vendas DESC'
-    else:
-        query += ' ORDER BY nome ASC'
-    
-    produtos_lista = conn.execute(query, params).fetchall()
-    categorias = conn.execute('SELECT DISTINCT categoria FROM produtos WHERE ativo = 1').fetchall()
-    conn.close()
+    projecao = listagem()
+    produtos_lista = projecao.listar(categoria, busca, ordem)
     
     return render_template('produtos.html', 
                          produtos=produtos_lista, 
-                         categorias=categorias,
+                         categorias=projecao.categorias,
                          categoria_atual=categoria,
                          ordem_atual=ordem,
                          busca=busca)
 
+AVALIACOES_POR_PAGINA = 10
+
 @app.route('/produto/<int:id>')
 def produto(id):
     conn = get_db_connection()
-    produto = conn.execute('SELECT * FROM produtos WHERE id = ? AND ativo = 1', (id,)).fetchone()
+    produto = repositorio.buscar_produto(id, conn)
     
     if not produto:
         conn.close()
         return redirect(url_for('produtos'))
     
-    produtos_relacionados = conn.execute(
-        'SELECT * FROM produtos WHERE categoria = ? AND id != ? AND ativo = 1 LIMIT 4', 
-        (produto['categoria'], id)
-    ).fetchall()
+    produtos_relacionados = repositorio.produtos_relacionados(produto['categoria'], id, 4, conn)
     
-    avaliacoes = conn.execute('''
-        SELECT a.*, u.nome as usuario_nome FROM avaliacoes a 
-        JOIN usuarios u ON a.usuario_id = u.id 
-        WHERE a.produto_id = ? AND a.aprovado = 1 ORDER BY a.data DESC
-    ''', (id,)).fetchall()
+    # Média, histograma e total de páginas saem do resumo, sem contar as avaliações a cada visita
+    resumo_avaliacoes = repositorio.resumo_avaliacoes(id, conn)
+    paginas_avaliacoes = -(-resumo_avaliacoes['quantidade'] // AVALIACOES_POR_PAGINA) if resumo_avaliacoes else 0
+    pagina_avaliacoes = min(max(request.args.get('avaliacoes', 1, type=int), 1), max(paginas_avaliacoes, 1))
+    avaliacoes = []
+    if resumo_avaliacoes:
+        avaliacoes = repositorio.avaliacoes_aprovadas(id, AVALIACOES_POR_PAGINA,
+                                                      (pagina_avaliacoes - 1) * AVALIACOES_POR_PAGINA, conn)
     
     na_lista_desejos = False
     if current_user.is_authenticated:
-        desejo = conn.execute('SELECT id FROM lista_desejos WHERE usuario_id = ? AND produto_id = ?',
-                             (current_user.id, id)).fetchone()
-        na_lista_desejos = desejo is not None
+        na_lista_desejos = repositorio.na_lista_desejos(current_user.id, id, conn)
     
     conn.close()
     
     return render_template('produto.html', 
                          produto=produto, 
+                         preco_venda=preco_efetivo(produto),
                          relacionados=produtos_relacionados,
                          avaliacoes=avaliacoes,
+                         resumo_avaliacoes=resumo_avaliacoes,
+                         pagina_avaliacoes=pagina_avaliacoes,
+                         paginas_avaliacoes=paginas_avaliacoes,
+                         aba_avaliacoes='avaliacoes' in request.args,
                          na_lista_desejos=na_lista_desejos)
 
 @app.route('/calculadora')
@@ -315,6 +334,7 @@ def contato():
                      request.form.get('assunto', 'Geral'),
                      request.form['mensagem'],
                      datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        enfileirar_confirmacao_contato(conn, request.form['nome'], request.form['email'])
         conn.commit()
         conn.close()
         flash('Mensagem enviada com sucesso! Entraremos em contato em breve.', 'success')
@@ -334,21 +354,38 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email', '').strip().lower()
         senha = request.form.get('senha', '')
+        chave_ip = f'ip:{request.remote_addr}'
+        chave_email = f'email:{email}'
         
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM usuarios WHERE email = ? AND ativo = 1', (email,)).fetchone()
-        conn.close()
+        # Tentativas bloqueadas nem chegam a calcular hash
+        espera = max(tentativas_login.bloqueado(chave_ip, LOGIN_MAX_FALHAS_IP),
+                     tentativas_login.bloqueado(chave_email, LOGIN_MAX_FALHAS_EMAIL))
+        if espera:
+            flash(f'Muitas tentativas de login. Tente novamente em {espera // 60 + 1} minuto(s).', 'error')
+            resposta = app.make_response((render_template('auth/login.html'), 429))
+            resposta.headers['Retry-After'] = str(espera)
+            return resposta
         
-        if user and check_password_hash(user['senha_hash'], senha):
-            user_obj = User(user['id'], user['nome'], user['email'], user['tipo'],
-                           user['telefone'], user['cpf'], user['endereco'], user['cidade'], user['estado'], user['cep'])
+        user = repositorio.buscar_usuario_por_email(email)
+        
+        try:
+            senha_ok = senhas.verificar(user['senha_hash'] if user else None, senha)
+        except SenhasOcupado:
+            return _servico_senhas_ocupado('auth/login.html')
+        
+        if senha_ok:
+            tentativas_login.limpar(chave_email)
+            user_obj = User.da_linha(user)
+            cache_usuarios.guardar(user_obj)
             login_user(user_obj, remember=True)
             
-            conn = get_db_connection()
-            conn.execute('UPDATE usuarios SET ultimo_acesso = ? WHERE id = ?',
-                        (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), user['id']))
-            conn.commit()
-            conn.close()
+            repositorio.registrar_acesso(user['id'])
+            if senhas.precisa_atualizar(user['senha_hash']):
+                # SENHA_METODO mudou desde que o hash foi gerado: aproveita a senha em mãos
+                try:
+                    repositorio.atualizar_senha_hash(user['id'], senhas.gerar(senha))
+                except SenhasOcupado:
+                    pass
             
             flash(f'Bem-vindo(a), {user["nome"]}!', 'success')
             
@@ -360,10 +397,18 @@ def login():
                 return redirect(url_for('admin_dashboard'))
             return redirect(url_for('index'))
         else:
+            tentativas_login.registrar_falha(chave_ip)
+            tentativas_login.registrar_falha(chave_email)
             flash('Email ou senha incorretos.', 'error')
     
     return render_template('auth/login.html')
 
+def _servico_senhas_ocupado(template):
+    flash('Estamos com muitos acessos no momento. Tente novamente em alguns segundos.', 'error')
+    resposta = app.make_response((render_template(template), 503))
+    resposta.headers['Retry-After'] = '5'
+    return resposta
+
 @app.route('/cadastro', methods=['GET', 'POST'])
 def cadastro():
     if current_user.is_authenticated:
@@ -388,24 +433,18 @@ def cadastro():
             flash('A senha deve ter pelo menos 6 caracteres.', 'error')
             return render_template('auth/cadastro.html')
         
-        conn = get_db_connection()
-        existing = conn.execute('SELECT id FROM usuarios WHERE email = ?', (email,)).fetchone()
-        
-        if existing:
-            conn.close()
+        if repositorio.buscar_usuario_por_email(email, apenas_ativos=False):
             flash('Este email já está cadastrado.', 'error')
             return render_template('auth/cadastro.html')
         
-        senha_hash = generate_password_hash(senha)
-        conn.execute('''INSERT INTO usuarios (nome, email, telefone, senha_hash, tipo, data_cadastro)
-                       VALUES (?, ?, ?, ?, ?, ?)''',
-                    (nome, email, telefone, senha_hash, 'cliente', datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        conn.commit()
-        
-        user = conn.execute('SELECT * FROM usuarios WHERE email = ?', (email,)).fetchone()
-        conn.close()
+        try:
+            senha_hash = senhas.gerar(senha)
+        except SenhasOcupado:
+            return _servico_senhas_ocupado('auth/cadastro.html')
+        usuario_id = repositorio.criar_usuario(nome, email, telefone, senha_hash)
         
-        user_obj = User(user['id'], user['nome'], user['email'], user['tipo'])
+        user_obj = User(usuario_id, nome, email, 'cliente', telefone)
+        cache_usuarios.guardar(user_obj)
         login_user(user_obj, remember=True)
         
         flash('Cadastro realizado com sucesso! Bem-vindo(a)!', 'success')
@@ -426,32 +465,21 @@ def logout():
 @login_required
 def minha_conta():
     conn = get_db_connection()
-    pedidos = conn.execute('''SELECT * FROM pedidos WHERE usuario_id = ? ORDER BY data DESC LIMIT 5''',
-                          (current_user.id,)).fetchall()
-    lista_desejos = conn.execute('''
-        SELECT p.* FROM lista_desejos ld
-        JOIN produtos p ON ld.produto_id = p.id
-        WHERE ld.usuario_id = ? AND p.ativo = 1
-    ''', (current_user.id,)).fetchall()
+    pedidos = repositorio.pedidos_do_usuario(current_user.id, 5, conn)
+    lista_desejos = repositorio.lista_desejos(current_user.id, conn)
     conn.close()
     return render_template('cliente/minha_conta.html', pedidos=pedidos, lista_desejos=lista_desejos)
 
 @app.route('/meus-pedidos')
 @login_required
 def meus_pedidos():
-    conn = get_db_connection()
-    pedidos = conn.execute('SELECT * FROM pedidos WHERE usuario_id = ? ORDER BY data DESC',
-                          (current_user.id,)).fetchall()
-    conn.close()
+    pedidos = repositorio.pedidos_do_usuario(current_user.id)
     return render_template('cliente/meus_pedidos.html', pedidos=pedidos)
 
 @app.route('/pedido/<int:id>')
 @login_required
 def ver_pedido(id):
-    conn = get_db_connection()
-    pedido = conn.execute('SELECT * FROM pedidos WHERE id = ? AND usuario_id = ?',
-                         (id, current_user.id)).fetchone()
-    conn.close()
+    pedido = repositorio.buscar_pedido_do_usuario(id, current_user.id)
     if not pedido:
         flash('Pedido não encontrado.', 'error')
         return redirect(url_for('meus_pedidos'))
@@ -460,19 +488,8 @@ def ver_pedido(id):
 @app.route('/atualizar-perfil', methods=['POST'])
 @login_required
 def atualizar_perfil():
-    conn = get_db_connection()
-    conn.execute('''UPDATE usuarios SET nome = ?, telefone = ?, cpf = ?, endereco = ?, cidade = ?, estado = ?, cep = ?
-                    WHERE id = ?''',
-                (request.form.get('nome'),
-                 request.form.get('telefone'),
-                 request.form.get('cpf'),
-                 request.form.get('endereco'),
-                 request.form.get('cidade'),
-                 request.form.get('estado'),
-                 request.form.get('cep'),
-                 current_user.id))
-    conn.commit()
-    conn.close()
+    repositorio.atualizar_perfil(current_user.id, request.form)
+    cache_usuarios.invalidar(current_user.id)
     flash('Perfil atualizado com sucesso!', 'success')
     return redirect(url_for('minha_conta'))
 
@@ -507,44 +524,181 @@ def remover_lista_desejos(produto_id):
 def carrinho():
     return render_template('carrinho.html')
 
+def _quantidades_carrinho(produtos_json):
+    """Converte o produtos_json salvo em {produto_id: quantidade}"""
+    quantidades = {}
+    for item in json.loads(produtos_json) if produtos_json else []:
+        try:
+            produto_id = int(item.get('id'))
+            quantidades[produto_id] = quantidades.get(produto_id, 0) + int(item.get('quantidade', 0))
+        except (TypeError, ValueError):
+            continue
+    return quantidades
+
+def _montar_carrinho(quantidades):
+    """Monta os itens e o total do carrinho com os preços do servidor (nunca os do cliente)"""
+    itens, total, _ = precos.itens(quantidades, mapa_precos())
+    produtos = [{
+        'id': produto_id,
+        'nome': info['nome'],
+        'preco': info['preco'],
+        'imagem': info['imagem'],
+        'quantidade': quantidade
+    } for produto_id, info, quantidade in itens]
+    return produtos, total
+
+def _aplicar_operacoes(quantidades, operacoes):
+    for operacao in operacoes:
+        tipo = operacao.get('op')
+        produto_id = int(operacao.get('id'))
+        
+        if tipo == 'adicionar':
+            quantidades[produto_id] = quantidades.get(produto_id, 0) + int(operacao.get('quantidade', 1))
+        elif tipo == 'definir':
+            quantidades[produto_id] = int(operacao.get('quantidade', 0))
+        elif tipo == 'remover':
+            quantidades.pop(produto_id, None)
+        else:
+            raise ValueError(f'Operação inválida: {tipo}')
+        
+        if quantidades.get(produto_id, 1) <= 0:
+            quantidades.pop(produto_id, None)
+    return quantidades
+
+def _resposta_carrinho(carrinho, status=200, sucesso=True):
+    produtos = json.loads(carrinho['produtos_json']) if carrinho and carrinho['produtos_json'] else []
+    return jsonify({
+        'sucesso': sucesso,
+        'versao': carrinho['versao'] if carrinho else 0,
+        'produtos': produtos,
+        'total': carrinho['total'] if carrinho else 0
+    }), status
+
+CAMPOS_ITEM_CARRINHO = ('id', 'nome', 'preco', 'imagem', 'quantidade')
+
 @app.route('/api/carrinho', methods=['GET'])
 def api_get_carrinho():
-    if current_user.is_authenticated:
-        conn = get_db_connection()
-        carrinho = conn.execute('SELECT produtos_json FROM carrinhos WHERE usuario_id = ? AND status = "ativo"',
-                               (current_user.id,)).fetchone()
-        conn.close()
-        if carrinho and carrinho['produtos_json']:
-            return jsonify(json.loads(carrinho['produtos_json']))
-    return jsonify([])
+    try:
+        campos = campos_pedidos(CAMPOS_ITEM_CARRINHO)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    sufixo = '-' + ','.join(campos) if campos else ''
+    if not current_user.is_authenticated:
+        return resposta_json(b'[]', etag='carrinho-vazio' + sufixo, privado=True)
+    
+    carrinho = repositorio.buscar_carrinho_ativo(current_user.id)
+    if not carrinho:
+        return resposta_json(b'[]', etag='carrinho-vazio' + sufixo, privado=True)
+    
+    # id + versão identificam o conteúdo: toda alteração incrementa a versão
+    versao = carrinho['versao'] or 0
+    etag = f"carrinho-{carrinho['id']}-{versao}{sufixo}"
+    resposta = nao_modificado(etag)
+    if resposta is None:
+        produtos = json.loads(carrinho['produtos_json']) if carrinho['produtos_json'] else []
+        resposta = resposta_json(filtrar_campos(produtos, campos), etag=etag, privado=True)
+    resposta.headers['X-Carrinho-Versao'] = str(versao)
+    return resposta
 
 @app.route('/api/carrinho', methods=['POST'])
 def api_salvar_carrinho():
+    """Sincronização completa (legado). Preferir /api/carrinho/itens."""
     data = request.get_json()
     produtos = data.get('produtos', [])
     
     if current_user.is_authenticated:
-        conn = get_db_connection()
-        total = sum(p.get('preco', 0) * p.get('quantidade', 0) for p in produtos)
+        produtos, total = _montar_carrinho(_quantidades_carrinho(json.dumps(produtos)))
         
-        existing = conn.execute('SELECT id FROM carrinhos WHERE usuario_id = ? AND status = "ativo"',
-                               (current_user.id,)).fetchone()
+        conn = get_db_connection()
+        existing = repositorio.buscar_carrinho_ativo(current_user.id, conn)
         
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         if existing:
-            conn.execute('''UPDATE carrinhos SET produtos_json = ?, total = ?, data_atualizacao = ?
-                           WHERE id = ?''', (json.dumps(produtos), total, now, existing['id']))
+            # Cliente voltou: carrinho abandonado volta a ficar ativo e pode ser lembrado de novo
+            conn.execute('''UPDATE carrinhos SET produtos_json = ?, total = ?, data_atualizacao = ?,
+                           status = 'ativo', data_abandono = NULL, notificado = 0, versao = versao + 1
+                           WHERE id = ?''',
+                        (json.dumps(produtos), total, now, existing['id']))
         else:
-            conn.execute('''INSERT INTO carrinhos (usuario_id, produtos_json, total, status, data_criacao, data_atualizacao)
-                           VALUES (?, ?, ?, ?, ?, ?)''',
-                        (current_user.id, json.dumps(produtos), total, 'ativo', now, now))
+            conn.execute('''INSERT INTO carrinhos (usuario_id, produtos_json, total, status, data_criacao, data_atualizacao, versao)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        (current_user.id, json.dumps(produtos), total, 'ativo', now, now, 1))
         
         conn.commit()
         conn.close()
     
     return jsonify({'success': True})
 
+@app.route('/api/carrinho/itens', methods=['POST'])
+def api_carrinho_itens():
+    """Aplica operações item a item no carrinho salvo.
+
+    Corpo: {"versao": 3, "operacoes": [{"op": "adicionar", "id": 1, "quantidade": 1},
+                                       {"op": "definir", "id": 2, "quantidade": 4},
+                                       {"op": "remover", "id": 5}]}
+    Se "versao" for informada e não for a atual, nada é alterado e a resposta
+    é 409 com o carrinho atual, para o cliente reenviar sobre a nova versão.
+    """
+    data = request.get_json(silent=True) or {}
+    operacoes = data.get('operacoes')
+    versao_cliente = data.get('versao')
+    
+    if not isinstance(operacoes, list) or not operacoes:
+        return jsonify({'sucesso': False, 'erro': 'Nenhuma operação informada'}), 400
+    if versao_cliente is not None:
+        try:
+            versao_cliente = int(versao_cliente)
+        except (TypeError, ValueError):
+            return jsonify({'sucesso': False, 'erro': 'Versão inválida'}), 400
+    
+    if not current_user.is_authenticated:
+        return jsonify({'sucesso': True, 'versao': None})
+    
+    conn = get_db_connection()
+    carrinho = repositorio.buscar_carrinho_ativo(current_user.id, conn)
+    versao_atual = (carrinho['versao'] or 0) if carrinho else 0
+    
+    if versao_cliente is not None and versao_cliente != versao_atual:
+        conn.close()
+        return _resposta_carrinho(carrinho, 409, sucesso=False)
+    
+    try:
+        quantidades = _quantidades_carrinho(carrinho['produtos_json']) if carrinho else {}
+        quantidades = _aplicar_operacoes(quantidades, operacoes)
+    except (TypeError, ValueError, AttributeError) as e:
+        conn.close()
+        return jsonify({'sucesso': False, 'erro': str(e) or 'Operação inválida'}), 400
+    
+    produtos, total = _montar_carrinho(quantidades)
+    produtos_json = json.dumps(produtos)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    if carrinho:
+        cursor = conn.execute('''UPDATE carrinhos SET produtos_json = ?, total = ?, data_atualizacao = ?,
+                                 status = 'ativo', data_abandono = NULL, notificado = 0, versao = versao + 1
+                                 WHERE id = ? AND versao = ?''',
+                              (produtos_json, total, now, carrinho['id'], versao_atual))
+        if cursor.rowcount == 0:
+            # Outra requisição alterou o carrinho entre a leitura e a escrita
+            carrinho = repositorio.buscar_carrinho_ativo(current_user.id, conn)
+            conn.close()
+            return _resposta_carrinho(carrinho, 409, sucesso=False)
+    else:
+        conn.execute('''INSERT INTO carrinhos (usuario_id, produtos_json, total, status, data_criacao, data_atualizacao, versao)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (current_user.id, produtos_json, total, 'ativo', now, now, 1))
+    
+    conn.commit()
+    conn.close()
+    
+    return jsonify({
+        'sucesso': True,
+        'versao': versao_atual + 1,
+        'produtos': produtos,
+        'total': total
+    })
+
 # ============== CHECKOUT ==============
 
 @app.route('/checkout')
@@ -553,6 +707,27 @@ def checkout():
     public_key = get_config('mercadopago_public_key', '')
     return render_template('checkout.html', mercadopago_public_key=public_key)
 
+@app.route('/api/cep/<cep>')
+def api_cep(cep):
+    """Cidade/UF a partir da base local de faixas de CEP (sem serviço externo)"""
+    local = buscar_cep(cep)
+    if not local:
+        return jsonify({'erro': 'CEP não encontrado'}), 404
+    return jsonify({'cep': local['cep'], 'uf': local['uf'], 'cidade': local['cidade']})
+
+@app.route('/api/frete', methods=['POST'])
+def api_frete():
+    data = request.get_json(silent=True) or {}
+    try:
+        quantidades = _quantidades_carrinho(json.dumps(data.get('produtos', [])))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'erro': 'Dados inválidos'}), 400
+    
+    cotacao = cotar_frete(data.get('cep'), quantidades, get_config('frete_gratis_acima', '0'))
+    if not cotacao:
+        return jsonify({'erro': 'CEP inválido'}), 400
+    return jsonify(cotacao)
+
 @app.route('/processar-pedido', methods=['POST'])
 @login_required
 def processar_pedido():
@@ -571,86 +746,72 @@ def processar_pedido():
             if not data.get(field):
                 return jsonify({'sucesso': False, 'erro': f'Campo obrigatório: {field}'}), 400
         
-        conn = get_db_connection()
+        try:
+            quantidades = _quantidades_carrinho(json.dumps(produtos_cliente))
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({'sucesso': False, 'erro': 'Dados inválidos'}), 400
         
-        total_servidor = 0
-        produtos_validados = []
+        conn = get_db_connection()
         
-        for item in produtos_cliente:
-            produto_id = int(item.get('id', 0))
-            quantidade = int(item.get('quantidade', 0))
-            
-            produto_db = conn.execute('SELECT * FROM produtos WHERE id = ? AND ativo = 1', (produto_id,)).fetchone()
-            
-            if not produto_db:
-                conn.close()
-                return jsonify({'sucesso': False, 'erro': f'Produto não encontrado'}), 400
-            
-            if produto_db['estoque'] < quantidade:
-                conn.close()
-                return jsonify({'sucesso': False, 'erro': f'Estoque insuficiente para {produto_db["nome"]}'}), 400
-            
-            preco = produto_db['preco_promocional'] if produto_db['preco_promocional'] else produto_db['preco']
-            subtotal = float(preco) * quantidade
-            total_servidor += subtotal
-            
-            produtos_validados.append({
-                'id': produto_id,
-                'nome': produto_db['nome'],
-                'quantidade': quantidade,
-                'preco_unitario': float(preco),
-                'subtotal': subtotal
-            })
-        
-        # Aplicar cupom se existir
-        desconto = 0
+        # Produtos (uma consulta), cupom e frete calculados juntos, com preços e estoque do banco
         cupom_codigo = data.get('cupom', '').strip().upper()
-        if cupom_codigo:
-            cupom = conn.execute('''SELECT * FROM cupons WHERE codigo = ? AND ativo = 1 
-                                   AND (data_inicio IS NULL OR date(data_inicio) <= date('now'))
-                                   AND (data_fim IS NULL OR date(data_fim) >= date('now'))
-                                   AND (quantidade_total IS NULL OR quantidade_usada < quantidade_total)''',
-                               (cupom_codigo,)).fetchone()
-            if cupom and total_servidor >= cupom['valor_minimo']:
-                if cupom['tipo'] == 'percentual':
-                    desconto = total_servidor * (cupom['valor'] / 100)
-                else:
-                    desconto = cupom['valor']
-                
-                conn.execute('UPDATE cupons SET quantidade_usada = quantidade_usada + 1 WHERE id = ?', (cupom['id'],))
-        
-        total_final = total_servidor - desconto
+        orcamento = precos.orcamento(quantidades, cupom_codigo, data['cep'], conn=conn)
+        if orcamento['erro']:
+            conn.close()
+            return jsonify({'sucesso': False, 'erro': orcamento['erro']}), 400
+        if not orcamento['itens']:
+            conn.close()
+            return jsonify({'sucesso': False, 'erro': 'Carrinho vazio'}), 400
+        
+        produtos_validados = orcamento['itens']
+        total_servidor = orcamento['subtotal']
+        desconto = orcamento['desconto']
+        frete = orcamento['frete']
+        total_final = orcamento['total']
+        
+        if orcamento['cupom']:
+            conn.execute('UPDATE cupons SET quantidade_usada = quantidade_usada + 1 WHERE id = ?',
+                        (orcamento['cupom']['id'],))
         
         # Criar pedido
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        conn.execute('''INSERT INTO pedidos 
+        pedido_id = conn.execute('''INSERT INTO pedidos 
                        (usuario_id, nome_cliente, email, telefone, cpf, endereco, cidade, estado, cep, 
-                        produtos_json, subtotal, desconto, total, cupom_usado, status_pedido, data)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                        produtos_json, subtotal, desconto, frete, total, cupom_usado, status_pedido, data)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) RETURNING id''',
                     (current_user.id, current_user.nome, current_user.email, 
                      data.get('telefone', current_user.telefone),
                      data.get('cpf', current_user.cpf),
                      data['endereco'], data['cidade'], data['estado'], data['cep'],
-                     json.dumps(produtos_validados), total_servidor, desconto, total_final,
-                     cupom_codigo if desconto > 0 else None, 'aguardando_pagamento', now))
-        
-        pedido_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
-        
-        # Atualizar estoque
-        for item in produtos_validados:
-            conn.execute('UPDATE produtos SET estoque = estoque - ?, vendas = vendas + ? WHERE id = ?',
-                        (item['quantidade'], item['quantidade'], item['id']))
+                     json.dumps(produtos_validados), total_servidor, desconto, frete, total_final,
+                     cupom_codigo if desconto > 0 else None, 'aguardando_pagamento', now)).fetchone()[0]
+        
+        # Atualizar estoque; a condição em estoque protege contra outro pedido concorrente
+        # que tenha levado as últimas unidades depois da leitura
+        cursor = conn.executemany('''UPDATE produtos SET estoque = estoque - ?, vendas = vendas + ?
+                                     WHERE id = ? AND estoque >= ?''',
+                                  [(item['quantidade'], item['quantidade'], item['id'], item['quantidade'])
+                                   for item in produtos_validados])
+        if cursor.rowcount != len(produtos_validados):
+            conn.rollback()
+            conn.close()
+            return jsonify({'sucesso': False, 'erro': 'Estoque insuficiente para um dos produtos'}), 400
         
         # Limpar carrinho
-        conn.execute('UPDATE carrinhos SET status = "convertido" WHERE usuario_id = ? AND status = "ativo"',
+        conn.execute('''UPDATE carrinhos SET status = 'convertido'
+                       WHERE usuario_id = ? AND status IN ('ativo', 'abandonado')''',
                     (current_user.id,))
         
+        enfileirar_confirmacao_pedido(conn, pedido_id, current_user.nome, current_user.email,
+                                      produtos_validados, total_final)
+        
         conn.commit()
         conn.close()
         
         return jsonify({
             'sucesso': True,
             'pedido_id': pedido_id,
+            'frete': frete,
             'total': total_final
         })
         
@@ -661,33 +822,28 @@ def processar_pedido():
 def validar_cupom():
     data = request.get_json()
     codigo = data.get('codigo', '').strip().upper()
-    total = float(data.get('total', 0))
-    
-    conn = get_db_connection()
-    cupom = conn.execute('''SELECT * FROM cupons WHERE codigo = ? AND ativo = 1 
-                           AND (data_inicio IS NULL OR date(data_inicio) <= date('now'))
-                           AND (data_fim IS NULL OR date(data_fim) >= date('now'))
-                           AND (quantidade_total IS NULL OR quantidade_usada < quantidade_total)''',
-                       (codigo,)).fetchone()
-    conn.close()
-    
-    if not cupom:
+    if not codigo:
         return jsonify({'valido': False, 'erro': 'Cupom inválido ou expirado'})
     
-    if total < cupom['valor_minimo']:
-        return jsonify({'valido': False, 'erro': f'Valor mínimo: R$ {cupom["valor_minimo"]:.2f}'})
-    
-    if cupom['tipo'] == 'percentual':
-        desconto = total * (cupom['valor'] / 100)
-        descricao = f'{cupom["valor"]}% de desconto'
+    if 'produtos' in data:
+        # Subtotal recalculado com os preços do servidor, como no checkout
+        try:
+            quantidades = _quantidades_carrinho(json.dumps(data['produtos']))
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({'valido': False, 'erro': 'Dados inválidos'}), 400
+        _, total, _ = precos.itens(quantidades, mapa_precos())
     else:
-        desconto = cupom['valor']
-        descricao = f'R$ {cupom["valor"]:.2f} de desconto'
+        # Clientes antigos enviam só o total
+        total = float(data.get('total', 0))
+    
+    cupom, desconto, erro = precos.aplicar_cupom(codigo, total)
+    if erro:
+        return jsonify({'valido': False, 'erro': erro})
     
     return jsonify({
         'valido': True,
         'desconto': desconto,
-        'descricao': descricao
+        'descricao': descricao_cupom(cupom)
     })
 
 # ============== MERCADO PAGO ==============
@@ -695,15 +851,14 @@ def validar_cupom():
 @app.route('/criar-pagamento', methods=['POST'])
 @login_required
 def criar_pagamento():
-    access_token = get_config('mercadopago_access_token')
+    configs = get_configs('mercadopago_access_token', 'mercadopago_sandbox')
+    access_token = configs.get('mercadopago_access_token')
+    sandbox = configs.get('mercadopago_sandbox', '1') == '1'
     
     if not access_token:
         return jsonify({'erro': 'Pagamento não configurado. Entre em contato com a loja.'}), 400
     
     try:
-        import mercadopago
-        sdk = mercadopago.SDK(access_token)
-        
         data = request.get_json()
         pedido_id = data.get('pedido_id')
         
@@ -715,6 +870,15 @@ def criar_pagamento():
         if not pedido:
             return jsonify({'erro': 'Pedido não encontrado'}), 404
         
+        # Reaproveitar preferência já criada para este pedido (cliente clicou de novo)
+        if pedido['mercadopago_preference_id']:
+            init_point = pedido['mercadopago_sandbox_init_point'] if sandbox else pedido['mercadopago_init_point']
+            if init_point:
+                return jsonify({
+                    'id': pedido['mercadopago_preference_id'],
+                    'init_point': init_point
+                })
+        
         # Criar preferência de pagamento
         preference_data = {
             "items": [{
@@ -736,10 +900,14 @@ def criar_pagamento():
             "external_reference": str(pedido_id)
         }
         
-        preference_response = sdk.preference().create(preference_data)
-        preference = preference_response["response"]
+        preference = pagamento_service.criar_preferencia(access_token, preference_data)
         
-        sandbox = get_config('mercadopago_sandbox', '1') == '1'
+        conn = get_db_connection()
+        conn.execute('''UPDATE pedidos SET mercadopago_preference_id = ?, mercadopago_init_point = ?,
+                        mercadopago_sandbox_init_point = ? WHERE id = ?''',
+                    (preference['id'], preference.get('init_point'), preference.get('sandbox_init_point'), pedido_id))
+        conn.commit()
+        conn.close()
         
         return jsonify({
             'id': preference['id'],
@@ -755,17 +923,21 @@ def pagamento_sucesso(pedido_id):
     payment_id = request.args.get('payment_id')
     
     conn = get_db_connection()
-    # Atualiza status de pagamento e status do pedido para "pago"
-    conn.execute('''UPDATE pedidos SET status_pagamento = ?, status_pedido = ?, mercadopago_id = ?, mercadopago_status = ?, data_pagamento = ?
-                    WHERE id = ? AND usuario_id = ?''',
-                ('aprovado', 'pago', payment_id, 'approved', datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                 pedido_id, current_user.id))
+    # Atualiza status de pagamento e status do pedido para "pago". Só a primeira visita
+    # a esta página muda o pedido (recarregar não reenvia o email) e só pedidos do próprio usuário
+    cursor = conn.execute('''UPDATE pedidos SET status_pagamento = ?, status_pedido = ?, mercadopago_id = ?, mercadopago_status = ?, data_pagamento = ?
+                              WHERE id = ? AND usuario_id = ? AND COALESCE(status_pagamento, '') != 'aprovado' ''',
+                          ('aprovado', 'pago', payment_id, 'approved', datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                           pedido_id, current_user.id))
+    aprovado_agora = cursor.rowcount == 1
+    if aprovado_agora:
+        enfileirar_status_pagamento(conn, pedido_id, current_user.nome, current_user.email, 'aprovado')
     conn.commit()
+    conn.close()
     
     # Log da ação
-    log_admin_action(current_user.id, f'Pagamento aprovado para pedido #{pedido_id}', f'MercadoPago ID: {payment_id}')
-    
-    conn.close()
+    if aprovado_agora:
+        log_admin_action(current_user.id, f'Pagamento aprovado para pedido #{pedido_id}', f'MercadoPago ID: {payment_id}')
     
     flash('Pagamento realizado com sucesso!', 'success')
     return redirect(url_for('ver_pedido', id=pedido_id))
@@ -780,8 +952,14 @@ def pagamento_falha(pedido_id):
 @login_required
 def pagamento_pendente(pedido_id):
     conn = get_db_connection()
-    conn.execute('UPDATE pedidos SET status_pagamento = ? WHERE id = ? AND usuario_id = ?',
-                ('pendente', pedido_id, current_user.id))
+    # Pedidos já nascem com status_pagamento 'pendente': o retorno pendente do Mercado Pago fica
+    # marcado em mercadopago_status, para o email sair uma vez só e nunca depois da aprovação
+    cursor = conn.execute('''UPDATE pedidos SET status_pagamento = ?, mercadopago_status = ?
+                              WHERE id = ? AND usuario_id = ? AND COALESCE(status_pagamento, '') != 'aprovado'
+                              AND COALESCE(mercadopago_status, '') != 'pending' ''',
+                          ('pendente', 'pending', pedido_id, current_user.id))
+    if cursor.rowcount == 1:
+        enfileirar_status_pagamento(conn, pedido_id, current_user.nome, current_user.email, 'pendente')
     conn.commit()
     conn.close()
     
@@ -793,7 +971,9 @@ def pagamento_pendente(pedido_id):
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
-    conn = get_db_connection()
+    # Relatórios leem da cópia do banco para não disputar lock com o checkout
+    dados_atualizados_em = replica.atualizada_em()
+    conn = replica.conexao()
     
     # Estatísticas gerais - contabiliza apenas pedidos pagos
     total_pedidos = conn.execute('''SELECT COUNT(*) FROM pedidos 
@@ -853,8 +1033,8 @@ def admin_dashboard():
     margem_lucro = (lucro_liquido_total / faturamento_total * 100) if faturamento_total > 0 else 0
     margem_lucro_mes = (lucro_liquido_mes / faturamento_mes * 100) if faturamento_mes > 0 else 0
     
-    total_clientes = conn.execute('SELECT COUNT(*) FROM usuarios WHERE tipo = "cliente"').fetchone()[0]
-    clientes_mes = conn.execute('''SELECT COUNT(*) FROM usuarios WHERE tipo = "cliente" 
+    total_clientes = conn.execute("SELECT COUNT(*) FROM usuarios WHERE tipo = 'cliente'").fetchone()[0]
+    clientes_mes = conn.execute('''SELECT COUNT(*) FROM usuarios WHERE tipo = 'cliente' 
                                   AND strftime('%Y-%m', data_cadastro) = strftime('%Y-%m', 'now')''').fetchone()[0]
     
     # Produtos com estoque baixo
@@ -866,15 +1046,13 @@ def admin_dashboard():
                                       LEFT JOIN usuarios u ON p.usuario_id = u.id
                                       ORDER BY p.data DESC LIMIT 10''').fetchall()
     
-    # Carrinhos abandonados
-    horas_abandono = int(get_config('carrinho_abandono_horas', '24'))
-    data_limite = (datetime.now() - timedelta(hours=horas_abandono)).strftime('%Y-%m-%d %H:%M:%S')
+    # Carrinhos abandonados (marcados pela tarefa marcar_carrinhos_abandonados)
     carrinhos_abandonados = conn.execute('''
         SELECT c.*, u.nome as cliente_nome, u.email, u.telefone FROM carrinhos c
         LEFT JOIN usuarios u ON c.usuario_id = u.id
-        WHERE c.status = 'ativo' AND c.data_atualizacao < ?
+        WHERE c.status = 'abandonado'
         ORDER BY c.total DESC LIMIT 10
-    ''', (data_limite,)).fetchall()
+    ''').fetchall()
     
     # Contatos não respondidos
     contatos_pendentes = conn.execute('SELECT COUNT(*) FROM contatos WHERE respondido = 0').fetchone()[0]
@@ -889,6 +1067,7 @@ def admin_dashboard():
     conn.close()
     
     return render_template('admin/dashboard.html',
+                          dados_atualizados_em=dados_atualizados_em,
                           total_pedidos=total_pedidos,
                           pedidos_hoje=pedidos_hoje,
                           faturamento_mes=faturamento_mes,
@@ -945,12 +1124,13 @@ def admin_produto_novo():
                 imagens_list.append(img)
         imagens_json = json.dumps(imagens_list) if imagens_list else None
         imagem_principal = imagens_list[0] if imagens_list else request.form.get('imagem')
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         conn = get_db_connection()
         conn.execute('''INSERT INTO produtos (nome, descricao, custo, preco, preco_promocional, potencia_watts, 
                        eficiencia, garantia, estoque, estoque_minimo, imagem, imagens, categoria, especificacoes, 
-                       ativo, destaque, data_cadastro)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                       ativo, destaque, data_cadastro, data_atualizacao)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                     (request.form['nome'], request.form.get('descricao'),
                      float(request.form['custo']) if request.form.get('custo') else 0,
                      float(request.form['preco']), 
@@ -960,7 +1140,8 @@ def admin_produto_novo():
                      int(request.form.get('estoque_minimo', 5)), imagem_principal, imagens_json,
                      request.form['categoria'], request.form.get('especificacoes'),
                      1 if request.form.get('ativo') else 0, 1 if request.form.get('destaque') else 0,
-                     datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                     agora, agora))
+        invalidar_catalogo(conn)
         conn.commit()
         conn.close()
         log_admin_action(current_user.id, 'Produto criado', request.form['nome'])
@@ -969,6 +1150,29 @@ def admin_produto_novo():
     
     return render_template('admin/produto_form.html', produto=None)
 
+@app.route('/admin/produtos/importar', methods=['GET', 'POST'])
+@admin_required
+def admin_produtos_importar():
+    resultado = None
+    if request.method == 'POST':
+        arquivo = request.files.get('arquivo')
+        if not arquivo or not arquivo.filename:
+            flash('Selecione um arquivo CSV ou JSONL.', 'error')
+            return redirect(url_for('admin_produtos_importar'))
+        
+        # O arquivo é lido em fluxo e gravado em lotes; o log e a invalidação do catálogo saem uma vez só
+        try:
+            resultado = importador.importar(ler_arquivo(arquivo.stream, arquivo.filename),
+                                            simular=bool(request.form.get('simular')),
+                                            usuario_id=current_user.id, ip=request.remote_addr,
+                                            origem=secure_filename(arquivo.filename))
+        except ImportacaoInterrompida as e:
+            # Lotes já confirmados continuam gravados; o resumo parcial mostra quantos
+            resultado = e.resultado
+            flash(f'Importação interrompida ({e}). As linhas até o último lote gravado foram mantidas.', 'error')
+    
+    return render_template('admin/produtos_importar.html', resultado=resultado)
+
 @app.route('/admin/produto/<int:id>', methods=['GET', 'POST'])
 @admin_required
 def admin_produto_editar(id):
@@ -985,7 +1189,8 @@ def admin_produto_editar(id):
         
         conn.execute('''UPDATE produtos SET nome = ?, descricao = ?, custo = ?, preco = ?, preco_promocional = ?,
                        potencia_watts = ?, eficiencia = ?, garantia = ?, estoque = ?, estoque_minimo = ?,
-                       imagem = ?, imagens = ?, categoria = ?, especificacoes = ?, ativo = ?, destaque = ?
+                       imagem = ?, imagens = ?, categoria = ?, especificacoes = ?, ativo = ?, destaque = ?,
+                       data_atualizacao = ?
                        WHERE id = ?''',
                     (request.form['nome'], request.form.get('descricao'),
                      float(request.form['custo']) if request.form.get('custo') else 0,
@@ -995,7 +1200,9 @@ def admin_produto_editar(id):
                      int(request.form['garantia']), int(request.form['estoque']),
                      int(request.form.get('estoque_minimo', 5)), imagem_principal, imagens_json,
                      request.form['categoria'], request.form.get('especificacoes'),
-                     1 if request.form.get('ativo') else 0, 1 if request.form.get('destaque') else 0, id))
+                     1 if request.form.get('ativo') else 0, 1 if request.form.get('destaque') else 0,
+                     datetime.now().strftime('%Y-%m-%d %H:%M:%S'), id))
+        invalidar_catalogo(conn)
         conn.commit()
         conn.close()
         log_admin_action(current_user.id, 'Produto atualizado', request.form['nome'])
@@ -1057,7 +1264,7 @@ def admin_atualizar_status_pedido(id):
 @app.route('/admin/clientes')
 @admin_required
 def admin_clientes():
-    conn = get_db_connection()
+    conn = replica.conexao()
     clientes = conn.execute('''SELECT u.*, 
                               (SELECT COUNT(*) FROM pedidos WHERE usuario_id = u.id) as total_pedidos,
                               (SELECT COALESCE(SUM(total), 0) FROM pedidos WHERE usuario_id = u.id AND status_pagamento = 'aprovado') as total_gasto,
@@ -1069,16 +1276,13 @@ def admin_clientes():
 @app.route('/admin/carrinhos-abandonados')
 @admin_required
 def admin_carrinhos_abandonados():
-    conn = get_db_connection()
-    horas_abandono = int(get_config('carrinho_abandono_horas', '24'))
-    data_limite = (datetime.now() - timedelta(hours=horas_abandono)).strftime('%Y-%m-%d %H:%M:%S')
-    
+    conn = replica.conexao()
     carrinhos = conn.execute('''
         SELECT c.*, u.nome as cliente_nome, u.email, u.telefone FROM carrinhos c
         LEFT JOIN usuarios u ON c.usuario_id = u.id
-        WHERE c.status = 'ativo' AND c.data_atualizacao < ?
+        WHERE c.status = 'abandonado'
         ORDER BY c.total DESC
-    ''', (data_limite,)).fetchall()
+    ''').fetchall()
     conn.close()
     return render_template('admin/carrinhos_abandonados.html', carrinhos=carrinhos)
 
@@ -1101,6 +1305,14 @@ def admin_configuracoes():
         sandbox = '1' if request.form.get('mercadopago_sandbox') else '0'
         set_config('mercadopago_sandbox', sandbox)
         
+        for chave, _, padrao in REGRAS_LIMITE.values():
+            valor = request.form.get(chave, '').strip()
+            if valor and interpretar_limite(valor) is None and valor != '0':
+                flash(f'Limite inválido em {chave}: use requisições/segundos, como {padrao}.', 'error')
+                continue
+            set_config(chave, valor or padrao)
+        limitador.recarregar()
+        
         log_admin_action(current_user.id, 'Configurações atualizadas')
         flash('Configurações salvas com sucesso!', 'success')
         return redirect(url_for('admin_configuracoes'))
@@ -1112,7 +1324,10 @@ def admin_configuracoes():
     # Converter para dict para facilitar acesso no template
     config = {c['chave']: c['valor'] for c in configs_list}
     
-    return render_template('admin/configuracoes.html', config=config)
+    descricoes = {c['chave']: c['descricao'] for c in configs_list}
+    limites = [(chave, config.get(chave) or padrao, padrao, descricoes.get(chave) or endpoint)
+               for endpoint, (chave, _, padrao) in REGRAS_LIMITE.items()]
+    return render_template('admin/configuracoes.html', config=config, limites=limites)
 
 @app.route('/admin/cupons')
 @admin_required
@@ -1141,6 +1356,100 @@ def admin_cupom_novo():
         return redirect(url_for('admin_cupons'))
     return render_template('admin/cupom_form.html', cupom=None)
 
+@app.route('/admin/promocoes')
+@admin_required
+def admin_promocoes():
+    conn = get_db_connection()
+    promocoes = conn.execute('''SELECT pr.*, p.nome AS produto_nome FROM promocoes pr
+                                LEFT JOIN produtos p ON pr.produto_id = p.id
+                                ORDER BY pr.inicio DESC, pr.id DESC''').fetchall()
+    em_campanha = {row['promocao_id']: row['total'] for row in conn.execute(
+        '''SELECT promocao_id, COUNT(*) AS total FROM produtos
+           WHERE promocao_id IS NOT NULL GROUP BY promocao_id''')}
+    conn.close()
+    return render_template('admin/promocoes.html', promocoes=promocoes, em_campanha=em_campanha,
+                         agora=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), tipos=TIPOS_PROMOCAO)
+
+def _dados_promocao(form):
+    """Valores do formulário de promoção na ordem das colunas; ValueError com a mensagem para o admin"""
+    tipo = form.get('tipo')
+    if tipo not in TIPOS_PROMOCAO:
+        raise ValueError('Tipo de promoção inválido.')
+    try:
+        valor = float(form['valor'])
+        # datetime-local envia 2025-01-31T18:00
+        inicio = datetime.strptime(form['inicio'], '%Y-%m-%dT%H:%M')
+        fim = datetime.strptime(form['fim'], '%Y-%m-%dT%H:%M') if form.get('fim') else None
+    except (KeyError, ValueError):
+        raise ValueError('Informe valor e datas válidos.')
+    if valor <= 0 or (tipo == 'percentual' and valor >= 100):
+        raise ValueError('Valor fora do intervalo permitido.')
+    if fim is not None and fim <= inicio:
+        raise ValueError('O fim deve ser depois do início.')
+    
+    alvo = form.get('alvo')
+    produto_id = form.get('produto_id', type=int) if alvo == 'produto' else None
+    categoria = (form.get('categoria') or None) if alvo == 'categoria' else None
+    if alvo == 'produto' and not produto_id:
+        raise ValueError('Informe o ID do produto.')
+    if alvo == 'categoria' and not categoria:
+        raise ValueError('Escolha a categoria.')
+    return (form.get('nome', '').strip() or 'Promoção', produto_id, categoria, tipo, valor,
+            inicio.strftime('%Y-%m-%d %H:%M:%S'), fim.strftime('%Y-%m-%d %H:%M:%S') if fim else None,
+            1 if form.get('ativo') else 0, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+@app.route('/admin/promocao/nova', methods=['GET', 'POST'])
+@app.route('/admin/promocao/<int:id>', methods=['GET', 'POST'])
+@admin_required
+def admin_promocao_form(id=None):
+    conn = get_db_connection()
+    promocao = conn.execute('SELECT * FROM promocoes WHERE id = ?', (id,)).fetchone() if id else None
+    if id and not promocao:
+        conn.close()
+        flash('Promoção não encontrada.', 'error')
+        return redirect(url_for('admin_promocoes'))
+    
+    if request.method == 'POST':
+        try:
+            dados = _dados_promocao(request.form)
+        except ValueError as e:
+            conn.close()
+            flash(str(e), 'error')
+            return redirect(request.url)
+        if id:
+            conn.execute('''UPDATE promocoes SET nome = ?, produto_id = ?, categoria = ?, tipo = ?, valor = ?,
+                           inicio = ?, fim = ?, ativo = ?, data_atualizacao = ? WHERE id = ?''', dados + (id,))
+        else:
+            conn.execute('''INSERT INTO promocoes (nome, produto_id, categoria, tipo, valor, inicio, fim, ativo,
+                           data_atualizacao) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', dados)
+        conn.commit()
+        conn.close()
+        # Aplica já, sem esperar a próxima execução do agendador
+        alterados = agenda_promocoes.aplicar(forcar=True)
+        log_admin_action(current_user.id, 'Promoção atualizada' if id else 'Promoção criada',
+                         f'{dados[0]} ({alterados} preço(s) alterado(s))')
+        flash('Promoção salva com sucesso!', 'success')
+        return redirect(url_for('admin_promocoes'))
+    
+    conn.close()
+    return render_template('admin/promocao_form.html', promocao=promocao, tipos=TIPOS_PROMOCAO,
+                         categorias=listagem().categorias)
+
+@app.route('/admin/promocao/<int:id>/excluir', methods=['POST'])
+@admin_required
+def admin_promocao_excluir(id):
+    conn = get_db_connection()
+    promocao = conn.execute('SELECT nome FROM promocoes WHERE id = ?', (id,)).fetchone()
+    if promocao:
+        conn.execute('DELETE FROM promocoes WHERE id = ?', (id,))
+        conn.commit()
+    conn.close()
+    if promocao:
+        agenda_promocoes.aplicar(forcar=True)
+        log_admin_action(current_user.id, 'Promoção excluída', promocao['nome'])
+        flash('Promoção excluída.', 'success')
+    return redirect(url_for('admin_promocoes'))
+
 @app.route('/admin/contatos')
 @admin_required
 def admin_contatos():
@@ -1172,6 +1481,40 @@ def admin_atualizar_status_contato(contato_id):
     flash(f'Status do contato atualizado para {status}.', 'success')
     return redirect(url_for('admin_contatos'))
 
+AVALIACOES_ADMIN_POR_PAGINA = 50
+
+@app.route('/admin/avaliacoes')
+@admin_required
+def admin_avaliacoes():
+    aprovadas = request.args.get('status') == 'aprovadas'
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    # Uma linha a mais só para saber se existe a próxima página
+    avaliacoes = repositorio.avaliacoes_para_moderar(1 if aprovadas else 0, AVALIACOES_ADMIN_POR_PAGINA + 1,
+                                                     (pagina - 1) * AVALIACOES_ADMIN_POR_PAGINA)
+    return render_template('admin/avaliacoes.html',
+                         avaliacoes=avaliacoes[:AVALIACOES_ADMIN_POR_PAGINA],
+                         aprovadas=aprovadas,
+                         pagina=pagina,
+                         tem_proxima=len(avaliacoes) > AVALIACOES_ADMIN_POR_PAGINA)
+
+
+@app.route('/admin/avaliacao/<int:avaliacao_id>/moderar', methods=['POST'])
+@admin_required
+def admin_moderar_avaliacao(avaliacao_id):
+    acao = request.form.get('acao')
+    if acao == 'remover':
+        produto_id = repositorio.remover_avaliacao(avaliacao_id)
+    else:
+        produto_id = repositorio.moderar_avaliacao(avaliacao_id, acao == 'aprovar')
+    
+    if produto_id is None:
+        flash('Avaliação não encontrada.', 'error')
+    else:
+        log_admin_action(current_user.id, f'Avaliação #{avaliacao_id}: {acao}', f'Produto #{produto_id}')
+        flash({'aprovar': 'Avaliação aprovada.', 'reprovar': 'Avaliação reprovada.',
+               'remover': 'Avaliação removida.'}.get(acao, 'Avaliação atualizada.'), 'success')
+    return redirect(request.referrer or url_for('admin_avaliacoes'))
+
 # ============== ASSISTENTE IA ==============
 
 @app.route('/admin/assistente')
@@ -1189,7 +1532,7 @@ def admin_assistente_chat():
             return jsonify({'erro': 'Mensagem vazia'}), 400
         
         # Obter dados da loja para contexto
-        conn = get_db_connection()
+        conn = replica.conexao()
         
         # Estatísticas
         total_pedidos = conn.execute('SELECT COUNT(*) FROM pedidos').fetchone()[0]
@@ -1200,13 +1543,11 @@ def admin_assistente_chat():
         produtos_baixo_estoque = conn.execute('''SELECT nome, estoque FROM produtos 
                                                 WHERE ativo = 1 AND estoque <= estoque_minimo''').fetchall()
         
-        horas_abandono = int(get_config('carrinho_abandono_horas', '24'))
-        data_limite = (datetime.now() - timedelta(hours=horas_abandono)).strftime('%Y-%m-%d %H:%M:%S')
         carrinhos_abandonados = conn.execute('''
             SELECT c.total, u.nome, u.email, u.telefone FROM carrinhos c
             LEFT JOIN usuarios u ON c.usuario_id = u.id
-            WHERE c.status = 'ativo' AND c.data_atualizacao < ?
-        ''', (data_limite,)).fetchall()
+            WHERE c.status = 'abandonado'
+        ''').fetchall()
         
         pedidos_pendentes = conn.execute('''SELECT COUNT(*) FROM pedidos 
                                            WHERE status_pedido = 'aguardando_pagamento' ''').fetchone()[0]
@@ -1253,38 +1594,189 @@ Seja específico, prático e forneça sugestões acionáveis."""
         print(f"[Admin Assistente] Erro: {e}")
         return jsonify({'erro': f'Erro ao processar sua mensagem: {str(e)}'}), 500
 
+# ============== MÉTRICAS ==============
+
+@app.before_request
+def iniciar_metricas_requisicao():
+    g.inicio_requisicao = time.perf_counter()
+    metricas.iniciar_requisicao()
+
+@app.teardown_request
+def registrar_metricas_requisicao(exc):
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    consultas, tempo_sql = metricas.finalizar_requisicao()
+    endpoint = request.endpoint or 'nao_encontrado'
+
+    metricas.histograma('http_requisicao_segundos', 'Duração das requisições por rota',
+                        endpoint=endpoint, metodo=request.method).observar(duracao)
+    metricas.histograma('sql_consultas_por_requisicao', 'Comandos SQL executados por requisição',
+                        buckets=metricas.BUCKETS_CONTAGEM, endpoint=endpoint).observar(consultas)
+    metricas.histograma('sql_segundos_por_requisicao', 'Tempo gasto em SQL por requisição',
+                        endpoint=endpoint).observar(tempo_sql)
+
+# ============== LIMITES DE REQUISIÇÕES ==============
+# Registrado depois de iniciar_metricas_requisicao: recusas também entram nas métricas.
+
+def _resposta_limite(status, espera, mensagem):
+    if request.path.startswith('/api/') or request.is_json:
+        resposta = jsonify({'erro': mensagem})
+        resposta.status_code = status
+    else:
+        # Sem template: renderizar base.html consultaria o banco (configurações da loja, carrinho)
+        resposta = Response(mensagem, status=status, mimetype='text/plain')
+    resposta.headers['Retry-After'] = str(espera)
+    return resposta
+
+_aviso_proxy = []
+
+def _avisar_proxy_nao_configurado():
+    """Atrás de um proxy sem PROXIES_CONFIAVEIS, todos os anônimos dividem o mesmo balde"""
+    if not _aviso_proxy:
+        _aviso_proxy.append(True)
+        print(f"[Limites] X-Forwarded-For recebido com PROXIES_CONFIAVEIS=0: visitantes anônimos "
+              f"estão sendo contados pelo IP do proxy ({request.remote_addr})")
+
+@app.before_request
+def limitar_requisicoes():
+    endpoint = request.endpoint
+    if endpoint is None or endpoint == 'static':
+        return None
+    
+    if endpoint in ENDPOINTS_DESCARTAVEIS:
+        fila_ms = tempo_na_fila_ms(request.headers.get('X-Request-Start'))
+        if fila_ms is not None and fila_ms > FILA_MAX_MS:
+            return _resposta_limite(503, 5, 'Servidor ocupado no momento. Tente novamente em instantes.')
+    
+    # Id do usuário direto da sessão, sem carregar o usuário do banco. Visitantes
+    # anônimos são contados pelo IP do cliente já resolvido pelo ProxyFix
+    usuario_id = session.get('_user_id')
+    identidade = f'u:{usuario_id}' if usuario_id else f'ip:{request.remote_addr}'
+    if not usuario_id and not PROXIES_CONFIAVEIS and 'X-Forwarded-For' in request.headers:
+        _avisar_proxy_nao_configurado()
+    espera = limitador.verificar(endpoint, request.method, identidade)
+    if espera:
+        return _resposta_limite(429, espera, f'Muitas requisições. Tente novamente em {espera} segundo(s).')
+    return None
+
+def _inicio_template(sender, template, context, **extra):
+    g.setdefault('inicios_template', []).append(time.perf_counter())
+
+def _fim_template(sender, template, context, **extra):
+    inicios = g.get('inicios_template')
+    if inicios:
+        metricas.histograma('template_render_segundos', 'Tempo de renderização dos templates',
+                            template=template.name or 'string').observar(time.perf_counter() - inicios.pop())
+
+before_render_template.connect(_inicio_template, app)
+template_rendered.connect(_fim_template, app)
+
+@app.route('/metrics')
+@admin_required
+def metrics():
+    return Response(metricas.exportar_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # ============== API ==============
 
 @app.route('/api/produtos')
 def api_produtos():
-    conn = get_db_connection()
-    produtos = conn.execute('SELECT * FROM produtos WHERE ativo = 1').fetchall()
-    conn.close()
-    
-    produtos_list = []
-    for p in produtos:
-        produtos_list.append({
-            'id': p['id'],
-            'nome': p['nome'],
-            'preco': p['preco'],
-            'preco_promocional': p['preco_promocional'],
-            'potencia_watts': p['potencia_watts'],
-            'imagem': p['imagem'],
-            'estoque': p['estoque']
-        })
+    try:
+        campos = campos_pedidos(CAMPOS_API)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
     
-    return jsonify(produtos_list)
+    # JSON serializado uma vez por versão do catálogo (ver catalogo.ProjecaoListagem)
+    projecao = listagem()
+    etag = f'produtos-{projecao.etag}'
+    if campos:
+        etag += '-' + ','.join(campos)
+    return nao_modificado(etag) or resposta_json(projecao.json_campos(campos or CAMPOS_API), etag=etag)
+
+CAMPOS_BUSCA = ('id', 'nome', 'preco', 'imagem')
 
 @app.route('/api/buscar-produtos')
 def api_buscar_produtos():
     termo = request.args.get('q', '')
+    try:
+        campos = campos_pedidos(CAMPOS_BUSCA)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    # O resultado só muda com alterações de produtos, que incrementam a versão do catálogo
+    chave = hashlib.sha1(f"{termo}|{','.join(campos or ())}".encode('utf-8')).hexdigest()[:12]
+    etag = f'busca-{versao_catalogo()}-{chave}'
+    resposta = nao_modificado(etag)
+    if resposta is not None:
+        return resposta
+    
     conn = get_db_connection()
     produtos = conn.execute('''SELECT id, nome, preco, imagem FROM produtos 
                               WHERE ativo = 1 AND (nome LIKE ? OR categoria LIKE ?)
                               LIMIT 10''', (f'%{termo}%', f'%{termo}%')).fetchall()
     conn.close()
     
-    return jsonify([dict(p) for p in produtos])
+    return resposta_json(filtrar_campos([dict(p) for p in produtos], campos), etag=etag)
+
+# ============== FEEDS ==============
+
+TIPOS_FEED = {'.xml': 'application/xml', '.jsonl': 'application/x-ndjson'}
+
+def gerar_feeds(forcar=False):
+    return feed.gerar(app.config['SITE_URL'], get_config('loja_nome', 'SolarPro'), forcar=forcar)
+
+@app.route('/feeds/<arquivo>')
+def feed_produtos(arquivo):
+    """Feeds gerados em segundo plano; ETag e Last-Modified vêm do arquivo (304 se não mudou)"""
+    if arquivo not in ARQUIVOS_FEED:
+        abort(404)
+    caminho = feed.caminho(arquivo)
+    if not os.path.exists(caminho):
+        # Primeiro acesso antes da tarefa rodar
+        gerar_feeds()
+    resposta = send_file(caminho, mimetype=TIPOS_FEED[os.path.splitext(arquivo)[1]],
+                         conditional=True, etag=True, max_age=0)
+    resposta.headers['Cache-Control'] = 'public, no-cache'
+    return resposta
+
+# ============== SITEMAP E ROBOTS ==============
+
+ARQUIVO_ROBOTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'robots.txt')
+
+def gerar_sitemaps(forcar=False):
+    return sitemap.gerar(app.config['SITE_URL'], forcar=forcar)
+
+@app.route('/robots.txt')
+def robots_txt():
+    with open(ARQUIVO_ROBOTS, encoding='utf-8') as f:
+        linhas = [linha.rstrip('\n') for linha in f]
+    # O endereço do sitemap acompanha SITE_URL
+    linhas = [f"Sitemap: {app.config['SITE_URL']}/sitemap.xml" if linha.startswith('Sitemap:') else linha
+              for linha in linhas]
+    resposta = Response('\n'.join(linhas) + '\n', mimetype='text/plain')
+    resposta.headers['Cache-Control'] = 'public, max-age=86400'
+    return resposta
+
+@app.route('/sitemap.xml')
+def sitemap_indice():
+    """Índice dos sitemaps, gerado em segundo plano (versão .gz para quem aceita gzip)"""
+    if not os.path.exists(sitemap.caminho('sitemap.xml')):
+        gerar_sitemaps()
+    comprimir = 'gzip' in request.accept_encodings
+    arquivo = 'sitemap.xml.gz' if comprimir else 'sitemap.xml'
+    resposta = send_file(sitemap.caminho(arquivo), mimetype='application/xml',
+                         conditional=True, etag=True, max_age=3600)
+    if comprimir:
+        resposta.headers['Content-Encoding'] = 'gzip'
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    return resposta
+
+@app.route('/sitemaps/<arquivo>')
+def sitemap_arquivo(arquivo):
+    if not (arquivo.startswith('sitemap-') and arquivo.endswith('.xml.gz')):
+        abort(404)
+    return send_from_directory(sitemap.diretorio, arquivo, mimetype='application/gzip', max_age=3600)
 
 # ============== GEMINI AI CHAT ==============
 
@@ -1353,6 +1845,121 @@ def api_chat_economia():
 def api_chat_status():
     return jsonify(gemini_service.get_status())
 
+# ============== TAREFAS EM SEGUNDO PLANO ==============
+
+LOTE_CARRINHOS = 500
+# Intervalo (segundos) da reconciliação dos resumos de avaliações com a tabela avaliacoes
+AVALIACOES_RECONCILIACAO = int(os.environ.get('AVALIACOES_RECONCILIACAO', 86400))
+
+@agendador.tarefa(intervalo=REPLICA_INTERVALO)
+def atualizar_replica_leitura():
+    """Atualiza a cópia do banco usada pelos relatórios do admin"""
+    replica.atualizar()
+
+@agendador.tarefa(intervalo=300)
+def marcar_carrinhos_abandonados():
+    """Marca em lotes os carrinhos ativos sem atualização há mais de N horas"""
+    horas_abandono = int(get_config('carrinho_abandono_horas', '24'))
+    data_limite = (datetime.now() - timedelta(hours=horas_abandono)).strftime('%Y-%m-%d %H:%M:%S')
+    agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    conn = get_db_connection()
+    total = 0
+    while True:
+        cursor = conn.execute('''UPDATE carrinhos SET status = 'abandonado', data_abandono = ?
+                                WHERE id IN (SELECT id FROM carrinhos
+                                             WHERE status = 'ativo' AND data_atualizacao < ? LIMIT ?)''',
+                             (agora, data_limite, LOTE_CARRINHOS))
+        conn.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < LOTE_CARRINHOS:
+            break
+    conn.close()
+    
+    if total:
+        print(f"[Agendador] {total} carrinho(s) marcado(s) como abandonado(s)")
+
+@agendador.tarefa(intervalo=900)
+def notificar_carrinhos_abandonados():
+    """Enfileira em lote os lembretes de recuperação de carrinhos abandonados"""
+    loja_nome = get_config('loja_nome', 'SolarPro')
+    link_carrinho = f"{app.config['SITE_URL']}/carrinho"
+    
+    conn = get_db_connection()
+    total = 0
+    while True:
+        carrinhos = conn.execute('''
+            SELECT c.id, c.total, u.nome, u.email FROM carrinhos c
+            JOIN usuarios u ON c.usuario_id = u.id
+            WHERE c.status = 'abandonado' AND c.notificado = 0
+            LIMIT ?
+        ''', (LOTE_CARRINHOS,)).fetchall()
+        if not carrinhos:
+            break
+        
+        for c in carrinhos:
+            corpo = (f"Olá, {c['nome']}!\n\n"
+                     f"Você deixou itens no carrinho (total de {format_price_filter(c['total'])}).\n"
+                     f"Finalize sua compra em: {link_carrinho}\n\n"
+                     f"Equipe {loja_nome}")
+            email_service.enfileirar(c['email'], f'{loja_nome}: seus produtos ainda estão no carrinho',
+                                     corpo, 'carrinho_abandonado', conn=conn)
+        
+        ids = [c['id'] for c in carrinhos]
+        conn.execute(f'UPDATE carrinhos SET notificado = 1 WHERE id IN ({", ".join("?" for _ in ids)})', ids)
+        conn.commit()
+        total += len(ids)
+    conn.close()
+    
+    if total:
+        print(f"[Agendador] {total} lembrete(s) de carrinho abandonado enfileirado(s)")
+
+@agendador.tarefa(intervalo=FEED_INTERVALO)
+def atualizar_feeds():
+    """Refaz os feeds de produtos quando o catálogo ou a disponibilidade mudam"""
+    gerar_feeds()
+
+@agendador.tarefa(intervalo=SITEMAP_INTERVALO)
+def atualizar_sitemaps():
+    """Refaz os sitemaps quando produtos ou projetos mudam"""
+    gerar_sitemaps()
+
+@agendador.tarefa(intervalo=RECOMENDACOES_INTERVALO)
+def atualizar_recomendacoes():
+    """Recalcula os produtos relacionados a partir dos pedidos novos e das listas de desejos"""
+    recomendador.atualizar()
+
+@agendador.tarefa(intervalo=PROMOCOES_INTERVALO)
+def aplicar_promocoes():
+    """Abre e fecha as janelas de promoção, gravando o preço de campanha nos produtos"""
+    agenda_promocoes.aplicar()
+
+@agendador.tarefa(intervalo=AVALIACOES_RECONCILIACAO)
+def reconciliar_avaliacoes():
+    """Refaz os resumos de avaliações, cobrindo alterações feitas direto no banco"""
+    total = repositorio.recalcular_resumos_avaliacoes()
+    print(f"[Agendador] Resumo de avaliações recalculado para {total} produto(s)")
+
+@agendador.tarefa(intervalo=SESSAO_LIMPEZA)
+def limpar_sessoes():
+    """Remove as sessões guardadas no servidor que já expiraram"""
+    if sessoes is not None:
+        sessoes.limpar_expiradas()
+
+@agendador.tarefa(intervalo=30)
+def enviar_emails():
+    email_service.enviar_pendentes()
+
+# Compilar templates agora para que a primeira requisição não pague o custo
+if os.environ.get('AQUECER_TEMPLATES', '1') == '1':
+    aquecer_templates(app)
+
+agendador.init_app(app)
+# Com preload_app (gunicorn.conf.py) o app é importado no mestre antes do fork;
+# nesse caso o agendador é iniciado em cada worker pelo hook post_fork
+if os.environ.get('AGENDADOR_ATIVO', '1') == '1' and os.environ.get('SOLARPRO_PRELOAD') != '1':
+    agendador.iniciar()
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
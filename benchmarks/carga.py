@@ -0,0 +1,381 @@
+"""Benchmark de carga dos fluxos de vitrine e checkout.
+
+Uso:
+    python benchmarks/semear_banco.py --banco /tmp/solarpro_bench.db
+    python benchmarks/carga.py --banco /tmp/solarpro_bench.db [--modo cliente|gunicorn|ambos]
+        [--requisicoes 200] [--concorrencia 8] [--workers 2] [--threads 1] [--cenarios produtos,busca,...]
+        [--perfil sync|gthread|gevent]
+
+Cada execução trabalha sobre uma cópia do banco informado, para que os
+pedidos e carrinhos criados pelos cenários não alterem a base entre
+rodadas. O resultado (vazão e latências p50/p95/p99 por cenário) é
+impresso e gravado em JSON com o hash do commit, em
+benchmarks/resultados/ por padrão.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRETORIO_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados')
+
+CATEGORIAS = ('Residencial', 'Comercial', 'Kit Completo', 'Inversor')
+ORDENS = ('nome', 'preco_asc', 'preco_desc', 'potencia_desc', 'vendas')
+TERMOS_BUSCA = ('Bifacial', 'Half-Cell', '550W', 'Inversor', 'Off-Grid', 'Monocristalino')
+CEPS = ('01310100', '13010001', '20040002', '30130001', '80010000')
+
+ADMIN = ('admin@solarpro.com', 'admin123')
+SENHA_BENCH = 'bench123'
+# Chaves de limites.REGRAS, repetidas aqui: importar limites carregaria database com o DB_PATH padrão
+# antes de rodar_cliente apontar SOLARPRO_DB para a cópia, e o modo cliente usaria o solarpro.db real
+CHAVES_LIMITES = ('limite_login', 'limite_api_chat', 'limite_calcular_roi', 'limite_buscar_produtos',
+                  'limite_validar_cupom')
+
+
+# ---------- Clientes ----------
+
+class ClienteTeste:
+    """Flask test client, no mesmo processo (sem rede nem servidor WSGI)"""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def get(self, caminho):
+        return self.cliente.get(caminho).status_code
+
+    def post_form(self, caminho, dados):
+        return self.cliente.post(caminho, data=dados).status_code
+
+    def post_json(self, caminho, dados):
+        return self.cliente.post(caminho, json=dados).status_code
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class ClienteHTTP:
+    """Cliente HTTP com cookies próprios, contra um servidor local"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SemRedirecionar())
+
+    def _abrir(self, requisicao):
+        try:
+            with self.opener.open(requisicao, timeout=60) as resposta:
+                resposta.read()
+                return resposta.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, caminho):
+        return self._abrir(urllib.request.Request(self.base_url + caminho))
+
+    def post_form(self, caminho, dados):
+        corpo = urllib.parse.urlencode(dados).encode()
+        return self._abrir(urllib.request.Request(self.base_url + caminho, data=corpo))
+
+    def post_json(self, caminho, dados):
+        return self._abrir(urllib.request.Request(self.base_url + caminho, data=json.dumps(dados).encode(),
+                                                  headers={'Content-Type': 'application/json'}))
+
+
+# ---------- Cenários ----------
+# Cada cenário recebe (cliente, rnd, contexto) e retorna o status HTTP.
+
+def cenario_produtos(cliente, rnd, contexto):
+    categoria = rnd.choice(('',) + CATEGORIAS)
+    ordem = rnd.choice(ORDENS)
+    return cliente.get(f'/produtos?categoria={urllib.parse.quote(categoria)}&ordem={ordem}')
+
+
+def cenario_busca(cliente, rnd, contexto):
+    termo = urllib.parse.quote(rnd.choice(TERMOS_BUSCA))
+    if rnd.random() < 0.5:
+        return cliente.get(f'/produtos?busca={termo}')
+    return cliente.get(f'/api/buscar-produtos?q={termo}')
+
+
+def cenario_produto(cliente, rnd, contexto):
+    return cliente.get(f'/produto/{rnd.randint(1, contexto["produtos"])}')
+
+
+def cenario_carrinho(cliente, rnd, contexto):
+    operacao = {'op': 'adicionar', 'id': rnd.randint(1, contexto['produtos']), 'quantidade': 1}
+    return cliente.post_json('/api/carrinho/itens', {'operacoes': [operacao]})
+
+
+def cenario_pedido(cliente, rnd, contexto):
+    itens = [{'id': rnd.randint(1, contexto['produtos']), 'quantidade': rnd.randint(1, 2)}
+             for _ in range(rnd.randint(1, 3))]
+    return cliente.post_json('/processar-pedido', {
+        'produtos': itens,
+        'endereco': 'Rua do Benchmark, 100',
+        'cidade': 'São Paulo',
+        'estado': 'SP',
+        'cep': rnd.choice(CEPS),
+        'metodo_pagamento': 'pix'
+    })
+
+
+def cenario_admin_dashboard(cliente, rnd, contexto):
+    return cliente.get('/admin')
+
+
+# nome -> (função, precisa de login: None | 'cliente' | 'admin')
+CENARIOS = {
+    'produtos': (cenario_produtos, None),
+    'busca': (cenario_busca, None),
+    'produto': (cenario_produto, None),
+    'carrinho': (cenario_carrinho, 'cliente'),
+    'processar_pedido': (cenario_pedido, 'cliente'),
+    'admin_dashboard': (cenario_admin_dashboard, 'admin'),
+}
+
+
+# ---------- Execução ----------
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    # Método do posto mais próximo
+    indice = min(len(ordenados) - 1, max(0, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def _login(cliente, perfil, numero):
+    if perfil == 'admin':
+        email, senha = ADMIN
+    else:
+        email, senha = f'bench{numero}@solarpro.com', SENHA_BENCH
+    status = cliente.post_form('/login', {'email': email, 'senha': senha})
+    if status != 302:
+        raise SystemExit(f'Falha no login de {email} (status {status})')
+
+
+def executar_cenario(nome, criar_cliente, requisicoes, concorrencia, aquecimento, contexto, semente):
+    funcao, perfil = CENARIOS[nome]
+    clientes = []
+    for i in range(concorrencia):
+        cliente = criar_cliente()
+        if perfil:
+            _login(cliente, perfil, contexto['proximo_usuario']())
+        clientes.append(cliente)
+
+    for i in range(aquecimento):
+        funcao(clientes[i % concorrencia], random.Random(semente - i - 1), contexto)
+
+    latencias = []
+    erros = []
+    lock = threading.Lock()
+    por_thread = [requisicoes // concorrencia + (1 if i < requisicoes % concorrencia else 0)
+                  for i in range(concorrencia)]
+
+    def trabalhar(indice):
+        rnd = random.Random(semente * 1000 + indice)
+        locais = []
+        falhas = 0
+        for _ in range(por_thread[indice]):
+            inicio = time.perf_counter()
+            try:
+                status = funcao(clientes[indice], rnd, contexto)
+            except Exception:
+                status = None
+            locais.append(time.perf_counter() - inicio)
+            if status is None or status >= 400:
+                falhas += 1
+        with lock:
+            latencias.extend(locais)
+            erros.append(falhas)
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhar, args=(i,)) for i in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        'requisicoes': len(latencias),
+        'erros': sum(erros),
+        'concorrencia': concorrencia,
+        'duracao_s': round(duracao, 3),
+        'rps': round(len(latencias) / duracao, 1) if duracao else None,
+        'p50_ms': ms(percentil(latencias, 50)),
+        'p95_ms': ms(percentil(latencias, 95)),
+        'p99_ms': ms(percentil(latencias, 99)),
+        'media_ms': ms(sum(latencias) / len(latencias)) if latencias else None,
+        'max_ms': ms(latencias[-1]) if latencias else None,
+    }
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _ambiente(banco):
+    return dict(os.environ, SOLARPRO_DB=banco, AGENDADOR_ATIVO='0', PYTHONPATH=RAIZ)
+
+
+def _contar(banco):
+    import sqlite3
+    conn = sqlite3.connect(banco)
+    totais = {tabela: conn.execute(f'SELECT COUNT(*) FROM {tabela}').fetchone()[0]
+              for tabela in ('produtos', 'usuarios', 'pedidos', 'carrinhos')}
+    conn.close()
+    return totais
+
+
+def _desligar_limites(banco):
+    """Todos os clientes do benchmark vêm do mesmo IP; os limites por rota atrapalhariam a medição"""
+    import sqlite3
+    conn = sqlite3.connect(banco)
+    conn.executemany("INSERT OR REPLACE INTO configuracoes (chave, valor) VALUES (?, '0')",
+                     [(chave,) for chave in CHAVES_LIMITES])
+    conn.commit()
+    conn.close()
+
+
+def rodar_cliente(banco, cenarios, args, contexto):
+    os.environ.update(_ambiente(banco))
+    sys.path.insert(0, RAIZ)
+    from app import app
+
+    return {nome: executar_cenario(nome, lambda: ClienteTeste(app), args.requisicoes, 1,
+                                   args.aquecimento, contexto, args.semente)
+            for nome in cenarios}
+
+
+def rodar_gunicorn(banco, cenarios, args, contexto):
+    porta = _porta_livre()
+    ambiente = _ambiente(banco)
+    if args.perfil:
+        # Mesma configuração da produção (gunicorn.conf.py), só trocando perfil e tamanho
+        comando = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{porta}',
+                   '--log-level', 'warning', 'app:app']
+        ambiente.update(GUNICORN_PERFIL=args.perfil, WEB_CONCURRENCY=str(args.workers),
+                        GUNICORN_THREADS=str(args.threads))
+    else:
+        comando = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{porta}',
+                   '--workers', str(args.workers), '--threads', str(args.threads),
+                   '--timeout', '120', '--log-level', 'warning', 'app:app']
+    processo = subprocess.Popen(comando, cwd=RAIZ, env=ambiente)
+    base_url = f'http://127.0.0.1:{porta}'
+    try:
+        limite = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(base_url + '/sobre', timeout=5).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if processo.poll() is not None or time.monotonic() > limite:
+                    raise SystemExit('Gunicorn não iniciou')
+                time.sleep(0.2)
+
+        return {nome: executar_cenario(nome, lambda: ClienteHTTP(base_url), args.requisicoes,
+                                       args.concorrencia, args.aquecimento, contexto, args.semente)
+                for nome in cenarios}
+    finally:
+        processo.terminate()
+        processo.wait(timeout=30)
+
+
+def _commit():
+    def git(*comando):
+        resultado = subprocess.run(['git', *comando], cwd=RAIZ, capture_output=True, text=True)
+        return resultado.stdout.strip() if resultado.returncode == 0 else None
+    return {'hash': git('rev-parse', 'HEAD'), 'alterado': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--banco', default=os.environ.get('SOLARPRO_DB_BENCH', '/tmp/solarpro_bench.db'))
+    parser.add_argument('--modo', choices=('cliente', 'gunicorn', 'ambos'), default='ambos')
+    parser.add_argument('--cenarios', default=','.join(CENARIOS))
+    parser.add_argument('--requisicoes', type=int, default=200, help='por cenário')
+    parser.add_argument('--aquecimento', type=int, default=10, help='requisições descartadas por cenário')
+    parser.add_argument('--concorrencia', type=int, default=8, help='clientes simultâneos (modo gunicorn)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--perfil', choices=('sync', 'gthread', 'gevent'),
+                        help='sobe o Gunicorn com gunicorn.conf.py neste perfil (modo gunicorn)')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='arquivo JSON (padrão: benchmarks/resultados/<data>_<commit>.json)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.banco):
+        raise SystemExit(f'Banco {args.banco} não encontrado; gere com benchmarks/semear_banco.py')
+    cenarios = [c.strip() for c in args.cenarios.split(',') if c.strip()]
+    for nome in cenarios:
+        if nome not in CENARIOS:
+            raise SystemExit(f'Cenário desconhecido: {nome} (disponíveis: {", ".join(CENARIOS)})')
+
+    totais = _contar(args.banco)
+    # Cada cliente logado usa um usuário sintético diferente
+    contador = iter(range(1, totais['usuarios']))
+    contexto = {'produtos': totais['produtos'], 'proximo_usuario': lambda: next(contador)}
+
+    resultado = {
+        'commit': _commit(),
+        'data': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'banco': totais,
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('banco', 'saida')},
+        'modos': {}
+    }
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        modos = ('gunicorn', 'cliente') if args.modo == 'ambos' else (args.modo,)
+        for modo in modos:
+            # Cópia nova a cada modo: os cenários criam pedidos e carrinhos
+            copia = os.path.join(diretorio, f'{modo}.db')
+            shutil.copyfile(args.banco, copia)
+            _desligar_limites(copia)
+            print(f"[Bench] Modo {modo}...")
+            executar = rodar_gunicorn if modo == 'gunicorn' else rodar_cliente
+            resultado['modos'][modo] = executar(copia, cenarios, args, contexto)
+
+    for modo, cenarios_modo in resultado['modos'].items():
+        print(f"\n{modo}")
+        print(f"  {'cenário':<18}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>7}")
+        for nome, r in cenarios_modo.items():
+            print(f"  {nome:<18}{r['rps']:>9}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['erros']:>7}")
+
+    saida = args.saida
+    if not saida:
+        os.makedirs(DIRETORIO_RESULTADOS, exist_ok=True)
+        hash_curto = (resultado['commit']['hash'] or 'sem-git')[:8]
+        saida = os.path.join(DIRETORIO_RESULTADOS, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{hash_curto}.json")
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(f"\n[Bench] Resultado gravado em {saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Mede o custo dos métodos de hash de senha nesta máquina e sugere SENHA_METODO.
+
+Uso:
+    python benchmarks/custo_senha.py [--alvo-ms 100] [--repeticoes 5] [--threads 2]
+
+Para cada candidato mostra o tempo (mediana) de um hash, a vazão com
+--threads hashes simultâneos (o SENHA_WORKERS da aplicação) e a memória do
+scrypt. A sugestão é o método mais forte cujo hash fica dentro do alvo.
+Depois de trocar SENHA_METODO, os hashes antigos são refeitos no login.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# Do mais fraco para o mais forte dentro de cada família
+CANDIDATOS = (
+    'scrypt:8192:8:1',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+    'scrypt:65536:8:1',
+    'scrypt:131072:8:1',
+    'pbkdf2:sha256:300000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:1000000',
+)
+
+
+def medir(metodo, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        generate_password_hash('senha-de-teste', metodo)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def vazao(metodo, threads, total):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        inicio = time.perf_counter()
+        list(executor.map(lambda _: generate_password_hash('senha-de-teste', metodo), range(total)))
+        return total / (time.perf_counter() - inicio)
+
+
+def memoria_mb(metodo):
+    if not metodo.startswith('scrypt:'):
+        return None
+    _, n, r, _ = metodo.split(':')
+    return 128 * int(n) * int(r) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--alvo-ms', type=float, default=100)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SENHA_WORKERS', 2)))
+    args = parser.parse_args()
+
+    print(f"{'método':<24} {'hash (ms)':>10} {f'hashes/s ({args.threads} thr)':>20} {'memória':>9}")
+    sugestao = {}
+    for metodo in CANDIDATOS:
+        try:
+            tempo = medir(metodo, args.repeticoes)
+        except ValueError as e:
+            # scrypt acima do limite de memória do OpenSSL
+            print(f'{metodo:<24} indisponível ({e})')
+            continue
+        por_segundo = vazao(metodo, args.threads, args.threads * args.repeticoes)
+        memoria = memoria_mb(metodo)
+        memoria_txt = f'{memoria:.0f} MB' if memoria else '-'
+        print(f'{metodo:<24} {tempo * 1000:>10.1f} {por_segundo:>20.1f} {memoria_txt:>9}')
+
+        familia = metodo.split(':')[0]
+        if tempo * 1000 <= args.alvo_ms:
+            sugestao[familia] = (metodo, tempo, por_segundo)
+
+    if not sugestao:
+        print(f'\nNenhum método ficou abaixo de {args.alvo_ms:.0f} ms; aumente --alvo-ms.')
+        return
+
+    metodo, tempo, por_segundo = sugestao.get('scrypt') or sugestao['pbkdf2']
+    print(f'\nSugestão: SENHA_METODO={metodo}')
+    print(f'  {tempo * 1000:.0f} ms por login; com SENHA_WORKERS={args.threads}, '
+          f'cerca de {por_segundo:.0f} logins/s por processo antes de a fila (SENHA_FILA) encher.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Gera um banco sintético (schema de database.py) para os benchmarks.
+
+Uso:
+    python benchmarks/semear_banco.py --banco /tmp/solarpro_bench.db \\
+        [--produtos 10000] [--pedidos 1000000] [--carrinhos 100000] [--semente 42]
+
+Os dados são determinísticos para a mesma semente, o que permite comparar
+resultados entre commits. Usuários criados:
+    admin@solarpro.com / admin123    (admin padrão do init_db)
+    bench1@solarpro.com ... benchN@solarpro.com / bench123
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import database  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+CATEGORIAS = ('Residencial', 'Comercial', 'Kit Completo', 'Inversor')
+MODELOS = ('Monocristalino', 'Policristalino', 'Half-Cell', 'Bifacial', 'String', 'Híbrido', 'Off-Grid', 'Microinversor')
+ESTADOS_CIDADES = (('SP', 'São Paulo', '01310100'), ('SP', 'Campinas', '13010001'), ('RJ', 'Rio de Janeiro', '20040002'),
+                   ('MG', 'Belo Horizonte', '30130001'), ('PR', 'Curitiba', '80010000'), ('BA', 'Salvador', '40020000'))
+STATUS_PEDIDO = ('aguardando_pagamento', 'pago', 'enviado', 'entregue', 'cancelado')
+LOTE = 10000
+# O admin padrão do init_db ocupa o id 1; bench1 recebe o id 2 e assim por diante
+ID_PRIMEIRO_USUARIO = 2
+
+SENHA_BENCH = 'bench123'
+
+
+def _lotes(gerador, tamanho=LOTE):
+    lote = []
+    for item in gerador:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _data(rnd, inicio, dias):
+    return (inicio + timedelta(seconds=rnd.randrange(dias * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def gerar_produtos(rnd, quantidade, agora):
+    for i in range(1, quantidade + 1):
+        categoria = CATEGORIAS[i % len(CATEGORIAS)]
+        potencia = rnd.choice((330, 400, 450, 550, 600, 3000, 5000, 10000))
+        preco = round(rnd.uniform(300, 50000), 2)
+        promocional = round(preco * 0.9, 2) if rnd.random() < 0.2 else None
+        especificacoes = json.dumps({
+            'dimensoes': f'{rnd.randint(1500, 2400)} x {rnd.randint(900, 1300)} x 35 mm',
+            'peso': f'{rnd.uniform(10, 40):.1f} kg',
+            'tipo_celula': rnd.choice(MODELOS)
+        })
+        yield (f'Painel Solar {potencia}W {rnd.choice(MODELOS)} {i}',
+               f'Produto sintético {i} da categoria {categoria} para testes de carga.',
+               preco, promocional, potencia, round(rnd.uniform(15, 23), 1), rnd.choice((10, 12, 25)),
+               1000000, 5, 'painel-550w.jpg', categoria, especificacoes, 1, 1 if rnd.random() < 0.01 else 0,
+               rnd.randint(0, 5000), agora, round(preco * 0.6, 2))
+
+
+def gerar_usuarios(quantidade, senha_hash, agora):
+    for i in range(1, quantidade + 1):
+        estado, cidade, cep = ESTADOS_CIDADES[i % len(ESTADOS_CIDADES)]
+        yield (f'Cliente Bench {i}', f'bench{i}@solarpro.com', senha_hash, '11999990000', None,
+               f'Rua Sintética, {i}', cidade, estado, cep, 'cliente', 1, agora)
+
+
+def gerar_pedidos(rnd, quantidade, usuarios, produtos):
+    inicio = datetime.now() - timedelta(days=730)
+    for _ in range(quantidade):
+        i = rnd.randint(1, usuarios)
+        estado, cidade, cep = ESTADOS_CIDADES[i % len(ESTADOS_CIDADES)]
+        itens = []
+        subtotal = 0.0
+        for _ in range(rnd.randint(1, 3)):
+            produto_id = rnd.randint(1, produtos)
+            quantidade_item = rnd.randint(1, 4)
+            preco = round(rnd.uniform(300, 50000), 2)
+            itens.append({'id': produto_id, 'nome': f'Produto {produto_id}', 'quantidade': quantidade_item,
+                          'preco_unitario': preco, 'subtotal': preco * quantidade_item})
+            subtotal += preco * quantidade_item
+        frete = round(rnd.uniform(80, 600), 2)
+        status = rnd.choice(STATUS_PEDIDO)
+        pagamento = 'aprovado' if status in ('pago', 'enviado', 'entregue') else 'pendente'
+        yield (ID_PRIMEIRO_USUARIO + i - 1, f'Cliente Bench {i}', f'bench{i}@solarpro.com', '11999990000',
+               f'Rua Sintética, {i}', cidade, estado, cep, json.dumps(itens), subtotal, 0, frete,
+               subtotal + frete, pagamento, status, _data(rnd, inicio, 730))
+
+
+def gerar_carrinhos(rnd, quantidade, usuarios, produtos):
+    inicio = datetime.now() - timedelta(days=60)
+    # Um carrinho por usuário, a partir do último (os primeiros ficam livres para os cenários)
+    for i in range(min(quantidade, usuarios)):
+        usuario_id = ID_PRIMEIRO_USUARIO + usuarios - 1 - i
+        produto_id = rnd.randint(1, produtos)
+        quantidade_item = rnd.randint(1, 3)
+        preco = round(rnd.uniform(300, 50000), 2)
+        itens = [{'id': produto_id, 'nome': f'Produto {produto_id}', 'preco': preco,
+                  'quantidade': quantidade_item, 'imagem': 'painel-550w.jpg'}]
+        data = _data(rnd, inicio, 60)
+        status = 'abandonado' if rnd.random() < 0.4 else 'ativo'
+        yield (usuario_id, json.dumps(itens), preco * quantidade_item, status, data, data,
+               data if status == 'abandonado' else None, 1)
+
+
+def inserir(conn, nome, sql, gerador):
+    inicio = time.perf_counter()
+    total = 0
+    for lote in _lotes(gerador):
+        conn.executemany(sql, lote)
+        conn.commit()
+        total += len(lote)
+    print(f"[Bench] {total} {nome} em {time.perf_counter() - inicio:.1f}s")
+
+
+def semear(banco, produtos, pedidos, carrinhos, usuarios, semente=42):
+    if os.path.exists(banco):
+        os.remove(banco)
+    database.DB_PATH = banco
+    database.preparar_banco()
+
+    rnd = random.Random(semente)
+    agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # Um único hash para todos os usuários sintéticos (hashear milhares de senhas levaria minutos)
+    senha_hash = generate_password_hash(SENHA_BENCH)
+
+    conn = sqlite3.connect(banco)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    # Remove os produtos de exemplo para que os ids sintéticos comecem em 1
+    conn.execute('DELETE FROM produtos')
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'produtos'")
+    conn.commit()
+
+    inserir(conn, 'produtos', '''INSERT INTO produtos
+        (nome, descricao, preco, preco_promocional, potencia_watts, eficiencia, garantia, estoque, estoque_minimo,
+         imagem, categoria, especificacoes, ativo, destaque, vendas, data_cadastro, custo)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', gerar_produtos(rnd, produtos, agora))
+
+    inserir(conn, 'usuarios', '''INSERT INTO usuarios
+        (nome, email, senha_hash, telefone, cpf, endereco, cidade, estado, cep, tipo, ativo, data_cadastro)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', gerar_usuarios(usuarios, senha_hash, agora))
+
+    inserir(conn, 'pedidos', '''INSERT INTO pedidos
+        (usuario_id, nome_cliente, email, telefone, endereco, cidade, estado, cep, produtos_json,
+         subtotal, desconto, frete, total, status_pagamento, status_pedido, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', gerar_pedidos(rnd, pedidos, usuarios, produtos))
+
+    inserir(conn, 'carrinhos', '''INSERT INTO carrinhos
+        (usuario_id, produtos_json, total, status, data_criacao, data_atualizacao, data_abandono, versao)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', gerar_carrinhos(rnd, carrinhos, usuarios, produtos))
+
+    conn.execute("UPDATE configuracoes SET valor = CAST(COALESCE(valor, '0') AS INTEGER) + 1 WHERE chave = 'catalogo_versao'")
+    conn.commit()
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--banco', default=os.environ.get('SOLARPRO_DB_BENCH', '/tmp/solarpro_bench.db'))
+    parser.add_argument('--produtos', type=int, default=10000)
+    parser.add_argument('--pedidos', type=int, default=1000000)
+    parser.add_argument('--carrinhos', type=int, default=100000)
+    parser.add_argument('--usuarios', type=int, default=None,
+                        help='padrão: o maior entre 1000 e --carrinhos')
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    usuarios = args.usuarios or max(1000, args.carrinhos)
+    inicio = time.perf_counter()
+    semear(args.banco, args.produtos, args.pedidos, args.carrinhos, usuarios, args.semente)
+    print(f"[Bench] Banco {args.banco} gerado em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
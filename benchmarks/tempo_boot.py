@@ -0,0 +1,70 @@
+"""Verifica o tempo de boot de um worker (import de app.py) com python -X importtime.
+
+Uso:
+    python benchmarks/tempo_boot.py [--orcamento-ms 500]
+
+Falha (código de saída 1) se o import de app passar do orçamento ou se algum
+SDK pesado (Gemini, Mercado Pago, OpenAI) for importado durante o boot.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Devem ser importados apenas no primeiro uso
+MODULOS_PROIBIDOS = ('google.generativeai', 'mercadopago', 'openai')
+
+
+def medir_import(diretorio):
+    env = dict(os.environ, PYTHONPATH=RAIZ, AGENDADOR_ATIVO='0')
+    resultado = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                               cwd=diretorio, env=env, capture_output=True, text=True)
+    if resultado.returncode != 0:
+        print(resultado.stderr)
+        raise SystemExit('Falha ao importar app.py')
+
+    tempo_app_us = None
+    importados = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith('import time:') or '|' not in linha:
+            continue
+        partes = linha[len('import time:'):].split('|')
+        modulo = partes[2].strip()
+        importados.append(modulo)
+        if modulo == 'app':
+            tempo_app_us = int(partes[1])
+
+    return tempo_app_us, importados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orcamento-ms', type=float, default=float(os.environ.get('BOOT_ORCAMENTO_MS', 500)))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        # Primeira execução cria o banco; a segunda mede o boot normal de um worker
+        medir_import(diretorio)
+        tempo_app_us, importados = medir_import(diretorio)
+
+    erros = []
+    tempo_ms = tempo_app_us / 1000
+    print(f"import app: {tempo_ms:.0f} ms (orçamento {args.orcamento_ms:.0f} ms)")
+    if tempo_ms > args.orcamento_ms:
+        erros.append(f"boot acima do orçamento: {tempo_ms:.0f} ms")
+
+    for modulo in importados:
+        if modulo.startswith(MODULOS_PROIBIDOS):
+            erros.append(f"SDK importado no boot: {modulo}")
+            break
+
+    for erro in erros:
+        print(f"ERRO: {erro}")
+    sys.exit(1 if erros else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+# Diretório compartilhado pelos workers; o Jinja grava cada arquivo de forma
+# atômica e invalida sozinho quando o fonte do template muda.
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR',
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), '.jinja_cache'))
+
+
+def configurar_cache_bytecode(app, diretorio=JINJA_CACHE_DIR):
+    os.makedirs(diretorio, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(diretorio)
+
+
+def aquecer_templates(app, mostrar=5):
+    """Carrega todos os templates na inicialização e imprime os tempos de compilação.
+
+    Retorna uma lista de (nome, milissegundos) ordenada do mais lento ao mais rápido.
+    """
+    tempos = []
+    inicio_total = time.perf_counter()
+
+    for nome in app.jinja_env.list_templates():
+        inicio = time.perf_counter()
+        try:
+            app.jinja_env.get_template(nome)
+        except Exception as e:
+            print(f"[Templates] Erro ao compilar {nome}: {e}")
+            continue
+        tempos.append((nome, (time.perf_counter() - inicio) * 1000))
+
+    total_ms = (time.perf_counter() - inicio_total) * 1000
+    tempos.sort(key=lambda t: t[1], reverse=True)
+
+    print(f"[Templates] {len(tempos)} templates carregados em {total_ms:.0f} ms")
+    for nome, ms in tempos[:mostrar]:
+        print(f"[Templates]   {nome}: {ms:.1f} ms")
+
+    return tempos
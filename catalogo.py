@@ -0,0 +1,205 @@
+import hashlib
+import json
+import threading
+import time
+from operator import itemgetter
+
+from database import get_db_connection
+
+# Intervalo mínimo (segundos) entre leituras da versão do catálogo no banco.
+# Alterações feitas por outro worker levam no máximo esse tempo para aparecer.
+INTERVALO_VERIFICACAO = 1.0
+
+# Estoque e vendas mudam a cada pedido sem alterar a versão do catálogo;
+# a listagem é reconstruída também quando ficar mais velha que isso (segundos)
+LISTAGEM_MAX_IDADE = 60.0
+
+# Valor do parâmetro ?ordem= da listagem -> (campo, decrescente)
+ORDENACOES = {
+    'nome': ('nome', False),
+    'preco_asc': ('preco_efetivo', False),
+    'preco_desc': ('preco_efetivo', True),
+    'potencia_desc': ('potencia_watts', True),
+    'vendas': ('vendas', True),
+    'avaliacao': ('avaliacao_ordem', True),
+}
+
+# Média bayesiana da ordenação por avaliação: cada produto começa com AVALIACAO_PESO_PRIOR
+# notas AVALIACAO_MEDIA_PRIOR, para uma única nota 5 não passar na frente de 40 notas 4,8
+AVALIACAO_MEDIA_PRIOR = 3.0
+AVALIACAO_PESO_PRIOR = 5
+
+# Campos de /api/produtos, na ordem em que são serializados
+CAMPOS_API = ('id', 'nome', 'preco', 'preco_promocional', 'preco_efetivo', 'potencia_watts', 'imagem', 'estoque')
+
+_lock = threading.Lock()
+_versao = None
+_verificado_em = 0.0
+_mapa_precos = None
+_mapa_precos_versao = None
+_listagem = None
+
+
+def preco_efetivo(produto):
+    """Preço de venda: o promocional quando houver, senão o de tabela; a campanha
+    em vigor (promocoes.py, já materializada na linha) vale se for menor"""
+    preco = produto['preco_promocional'] or produto['preco']
+    campanha = produto['preco_campanha']
+    return float(campanha if campanha is not None and campanha < preco else preco)
+
+
+def versao_catalogo():
+    """Versão atual do catálogo (incrementada a cada alteração de produtos)"""
+    global _versao, _verificado_em
+    agora = time.monotonic()
+    if _versao is None or agora - _verificado_em >= INTERVALO_VERIFICACAO:
+        conn = get_db_connection()
+        row = conn.execute("SELECT valor FROM configuracoes WHERE chave = 'catalogo_versao'").fetchone()
+        conn.close()
+        _versao = int(row['valor']) if row and row['valor'] else 0
+        _verificado_em = agora
+    return _versao
+
+
+def invalidar_catalogo(conn=None):
+    """Incrementa a versão do catálogo, invalidando os caches de todos os workers.
+
+    Se conn for informado, a alteração entra na mesma transação (sem commit).
+    """
+    global _versao
+    conexao = conn or get_db_connection()
+    conexao.execute('''UPDATE configuracoes SET valor = CAST(CAST(COALESCE(valor, '0') AS INTEGER) + 1 AS TEXT)
+                       WHERE chave = 'catalogo_versao' ''')
+    if conn is None:
+        conexao.commit()
+        conexao.close()
+    _versao = None
+
+
+def mapa_precos():
+    """{produto_id: {nome, preco, imagem}} dos produtos ativos, com o preço efetivo.
+
+    Mantido em memória e reconstruído apenas quando a versão do catálogo muda.
+    """
+    global _mapa_precos, _mapa_precos_versao
+    versao = versao_catalogo()
+    if _mapa_precos is not None and _mapa_precos_versao == versao:
+        return _mapa_precos
+
+    with _lock:
+        if _mapa_precos is None or _mapa_precos_versao != versao:
+            conn = get_db_connection()
+            produtos = conn.execute('''SELECT id, nome, preco, preco_promocional, preco_campanha, imagem
+                                       FROM produtos WHERE ativo = 1''').fetchall()
+            conn.close()
+            _mapa_precos = {
+                p['id']: {
+                    'nome': p['nome'],
+                    'preco': preco_efetivo(p),
+                    'imagem': p['imagem']
+                } for p in produtos
+            }
+            _mapa_precos_versao = versao
+    return _mapa_precos
+
+
+class ProjecaoListagem:
+    """Produtos ativos pré-processados para a listagem e para /api/produtos.
+
+    Guarda só os campos dos cards, a ordem de cada opção de ?ordem= já
+    calculada (geral e por categoria) e o JSON da API já serializado. Uma
+    página da listagem vira uma busca em dicionário em vez de um SELECT *.
+    """
+
+    def __init__(self, linhas, versao):
+        self.versao = versao
+        self.criada_em = time.monotonic()
+        self.itens = []
+        self._textos_busca = []
+        for p in linhas:
+            descricao = p['descricao'] or ''
+            estoque = p['estoque'] or 0
+            avaliacoes = p['avaliacoes'] or 0
+            soma = p['avaliacoes_soma'] or 0
+            self.itens.append({
+                'id': p['id'],
+                'nome': p['nome'],
+                'categoria': p['categoria'],
+                'imagem': p['imagem'],
+                'preco': p['preco'],
+                'preco_promocional': p['preco_promocional'],
+                'preco_efetivo': preco_efetivo(p),
+                'potencia_watts': p['potencia_watts'],
+                'eficiencia': p['eficiencia'],
+                'garantia': p['garantia'],
+                'estoque': estoque,
+                'esgotado': estoque <= 0,
+                'ultimas_unidades': 0 < estoque < 10,
+                'vendas': p['vendas'] or 0,
+                'avaliacoes': avaliacoes,
+                'avaliacao_media': round(soma / avaliacoes, 1) if avaliacoes else None,
+                # Sem avaliações fica depois de todos os avaliados
+                'avaliacao_ordem': ((soma + AVALIACAO_MEDIA_PRIOR * AVALIACAO_PESO_PRIOR)
+                                    / (avaliacoes + AVALIACAO_PESO_PRIOR)) if avaliacoes else 0,
+                'resumo': descricao[:100] + ('...' if len(descricao) > 100 else ''),
+            })
+            self._textos_busca.append(f"{p['nome']} {descricao}".lower())
+
+        categorias = sorted({item['categoria'] for item in self.itens if item['categoria']})
+        # Mesmo formato das linhas de SELECT DISTINCT categoria usado no template
+        self.categorias = [{'categoria': categoria} for categoria in categorias]
+
+        # (categoria, ordem) -> posições em self.itens; categoria '' = todas
+        self._ordens = {}
+        for ordem, (campo, decrescente) in ORDENACOES.items():
+            # Desempate por id, para a ordem ser estável entre reconstruções
+            posicoes = sorted(range(len(self.itens)), key=lambda i: self.itens[i]['id'])
+            posicoes.sort(key=lambda i: self.itens[i][campo] or 0, reverse=decrescente)
+            self._ordens[('', ordem)] = posicoes
+            for categoria in categorias:
+                self._ordens[(categoria, ordem)] = [i for i in posicoes if self.itens[i]['categoria'] == categoria]
+
+        self._json_campos = {}
+        self.json_api = self.json_campos(CAMPOS_API)
+        # Versão do catálogo + resumo do conteúdo: reconstruções só por idade
+        # (estoque mudou) também geram uma ETag nova
+        self.etag = f'{versao}-{hashlib.sha1(self.json_api).hexdigest()[:12]}'
+
+    def json_campos(self, campos):
+        """JSON compacto da API só com os campos pedidos (subconjunto de CAMPOS_API)"""
+        campos = tuple(c for c in CAMPOS_API if c in campos)
+        corpo = self._json_campos.get(campos)
+        if corpo is None:
+            valores = itemgetter(*campos)
+            if len(campos) == 1:
+                linhas = [{campos[0]: valores(item)} for item in self.itens]
+            else:
+                linhas = [dict(zip(campos, valores(item))) for item in self.itens]
+            corpo = json.dumps(linhas, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self._json_campos[campos] = corpo
+        return corpo
+
+    def listar(self, categoria='', busca='', ordem='nome'):
+        if ordem not in ORDENACOES:
+            ordem = 'nome'
+        posicoes = self._ordens.get((categoria or '', ordem), [])
+        if busca:
+            termo = busca.lower()
+            posicoes = [i for i in posicoes if termo in self._textos_busca[i]]
+        return [self.itens[i] for i in posicoes]
+
+
+def listagem():
+    """Projeção da listagem, reconstruída quando o catálogo muda ou fica velha"""
+    global _listagem
+    versao = versao_catalogo()
+    atual = _listagem
+    if atual is not None and atual.versao == versao and time.monotonic() - atual.criada_em < LISTAGEM_MAX_IDADE:
+        return atual
+
+    with _lock:
+        atual = _listagem
+        if atual is None or atual.versao != versao or time.monotonic() - atual.criada_em >= LISTAGEM_MAX_IDADE:
+            from repositorio import produtos_para_listagem
+            _listagem = ProjecaoListagem(produtos_para_listagem(), versao)
+    return _listagem
@@ -1,10 +1,144 @@
 import sqlite3
 import json
+import os
+import time
 from datetime import datetime
 from werkzeug.security import generate_password_hash
 
-def init_db():
-    conn = sqlite3.connect('solarpro.db')
+import metricas
+import postgres
+
+# SOLARPRO_DB permite apontar para outro arquivo (ex.: banco sintético dos benchmarks)
+DB_PATH = os.environ.get('SOLARPRO_DB', 'solarpro.db')
+
+# Com DATABASE_URL=postgresql://... o PostgreSQL substitui o arquivo SQLite (ver postgres.py)
+DATABASE_URL = os.environ.get('DATABASE_URL', '')
+
+# Incrementar sempre que init_db/migrate_db mudarem, para que rodem
+# novamente na próxima inicialização (valor gravado em PRAGMA user_version)
+SCHEMA_VERSION = 9
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que mede o tempo de cada comando, incluindo a leitura das linhas.
+
+    Em SELECTs o SQLite faz boa parte do trabalho durante o fetch, então o
+    tempo de fetchone/fetchall é somado ao comando que o originou antes de
+    decidir se ele entra no log de consultas lentas.
+    """
+
+    def _medir(self, sql, parametros, inicio, nova_consulta):
+        duracao = time.perf_counter() - inicio
+        metricas.registrar_sql(duracao, nova_consulta)
+        if nova_consulta:
+            self._sql = sql
+            self._quantidade_parametros = len(parametros) if parametros else 0
+            self._duracao = duracao
+            self._registrado_lento = False
+        else:
+            self._duracao = getattr(self, '_duracao', 0.0) + duracao
+        if (not getattr(self, '_registrado_lento', True)
+                and self._duracao * 1000 >= metricas.SQL_LENTO_MS):
+            self._registrado_lento = True
+            metricas.registrar_sql_lento(self._sql, self._quantidade_parametros, self._duracao)
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._medir(sql, parametros, inicio, True)
+
+    def executemany(self, sql, sequencia):
+        sequencia = list(sequencia)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, sequencia)
+        finally:
+            self._medir(sql, sequencia, inicio, True)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._medir(None, None, inicio, False)
+
+    def fetchmany(self, *args):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchmany(*args)
+        finally:
+            self._medir(None, None, inicio, False)
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._medir(None, None, inicio, False)
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão cujos comandos alimentam as métricas de SQL por requisição"""
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+
+def usando_postgres():
+    return postgres.configurado(DATABASE_URL)
+
+
+def get_db_connection():
+    if usando_postgres():
+        return postgres.get_connection(DATABASE_URL)
+    conn = sqlite3.connect(DB_PATH, factory=ConexaoInstrumentada)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def preparar_banco():
+    """Cria/migra o schema e insere os dados iniciais apenas se a versão do banco estiver desatualizada.
+
+    Executado por todos os workers na inicialização: no caso comum custa uma
+    única leitura de PRAGMA. Se for preciso migrar, o BEGIN IMMEDIATE garante
+    que apenas um worker faça o trabalho enquanto os outros aguardam.
+    """
+    if usando_postgres():
+        return postgres.preparar_banco(SCHEMA_VERSION, DATABASE_URL)
+
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        # WAL fica gravado no arquivo: leitores (cópia de leitura, relatórios) não
+        # bloqueiam o checkout, e escritas não bloqueiam leitores
+        if conn.execute('PRAGMA journal_mode').fetchone()[0].lower() != 'wal':
+            conn.execute('PRAGMA journal_mode = WAL')
+
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return False
+
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            conn.rollback()
+            return False
+
+        init_db(conn)
+        migrate_db(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+def init_db(conn=None):
+    proprio = conn is None
+    if proprio:
+        conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
 
     # Tabela de usuários (clientes e admins)
@@ -28,10 +162,13 @@ def init_db():
     # Tabela de produtos
     c.execute('''CREATE TABLE IF NOT EXISTS produtos (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sku TEXT,
         nome TEXT NOT NULL,
         descricao TEXT,
         preco REAL NOT NULL,
         preco_promocional REAL,
+        preco_campanha REAL,
+        promocao_id INTEGER,
         potencia_watts INTEGER NOT NULL,
         eficiencia REAL NOT NULL,
         garantia INTEGER NOT NULL,
@@ -43,7 +180,8 @@ def init_db():
         ativo INTEGER DEFAULT 1,
         destaque INTEGER DEFAULT 0,
         vendas INTEGER DEFAULT 0,
-        data_cadastro TEXT
+        data_cadastro TEXT,
+        data_atualizacao TEXT
     )''')
 
     # Tabela de depoimentos
@@ -82,9 +220,13 @@ def init_db():
         data_atualizacao TEXT,
         data_abandono TEXT,
         notificado INTEGER DEFAULT 0,
+        versao INTEGER DEFAULT 0,
         FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
     )''')
 
+    c.execute('CREATE INDEX IF NOT EXISTS idx_carrinhos_status ON carrinhos (status, data_atualizacao)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_carrinhos_usuario ON carrinhos (usuario_id, status)')
+
     # Tabela de pedidos
     c.execute('''CREATE TABLE IF NOT EXISTS pedidos (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -108,6 +250,9 @@ def init_db():
         status_pedido TEXT DEFAULT 'aguardando_pagamento',
         mercadopago_id TEXT,
         mercadopago_status TEXT,
+        mercadopago_preference_id TEXT,
+        mercadopago_init_point TEXT,
+        mercadopago_sandbox_init_point TEXT,
         observacoes TEXT,
         data TEXT,
         data_pagamento TEXT,
@@ -189,6 +334,76 @@ def init_db():
         FOREIGN KEY (produto_id) REFERENCES produtos(id)
     )''')
 
+    c.execute('CREATE INDEX IF NOT EXISTS idx_avaliacoes_produto ON avaliacoes (produto_id, aprovado, data)')
+
+    # Resumo das avaliações aprovadas por produto, atualizado na moderação (repositorio.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS avaliacoes_resumo (
+        produto_id INTEGER PRIMARY KEY,
+        quantidade INTEGER NOT NULL DEFAULT 0,
+        soma INTEGER NOT NULL DEFAULT 0,
+        nota_1 INTEGER NOT NULL DEFAULT 0,
+        nota_2 INTEGER NOT NULL DEFAULT 0,
+        nota_3 INTEGER NOT NULL DEFAULT 0,
+        nota_4 INTEGER NOT NULL DEFAULT 0,
+        nota_5 INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('SELECT COUNT(*) FROM avaliacoes_resumo')
+    if c.fetchone()[0] == 0:
+        c.execute('''INSERT INTO avaliacoes_resumo (produto_id, quantidade, soma, nota_1, nota_2, nota_3, nota_4, nota_5)
+                     SELECT produto_id, COUNT(*), SUM(nota), SUM(nota = 1), SUM(nota = 2), SUM(nota = 3),
+                            SUM(nota = 4), SUM(nota = 5)
+                     FROM avaliacoes WHERE aprovado = 1 GROUP BY produto_id''')
+
+    # Fila de emails de saída (enviados em lote pelo agendador)
+    c.execute('''CREATE TABLE IF NOT EXISTS emails_fila (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        destinatario TEXT NOT NULL,
+        assunto TEXT NOT NULL,
+        corpo TEXT NOT NULL,
+        tipo TEXT,
+        status TEXT DEFAULT 'pendente',
+        tentativas INTEGER DEFAULT 0,
+        proxima_tentativa TEXT,
+        erro TEXT,
+        data_criacao TEXT,
+        data_envio TEXT
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_emails_fila_status ON emails_fila (status, proxima_tentativa)')
+
+    # Sessões guardadas no servidor (sessoes.py); o cookie leva só o id
+    c.execute('''CREATE TABLE IF NOT EXISTS sessoes (
+        id TEXT PRIMARY KEY,
+        dados TEXT NOT NULL,
+        expira TEXT NOT NULL
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes (expira)')
+
+    # Produtos relacionados por compras em comum, recalculados pelo agendador (recomendacoes.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS produtos_relacionados (
+        produto_id INTEGER NOT NULL,
+        posicao INTEGER NOT NULL,
+        relacionado_id INTEGER NOT NULL,
+        pontuacao REAL NOT NULL,
+        PRIMARY KEY (produto_id, posicao)
+    )''')
+
+    # Promoções com janela de vigência por produto ou categoria; o agendador
+    # grava o preço resultante em produtos.preco_campanha (promocoes.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS promocoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        produto_id INTEGER,
+        categoria TEXT,
+        tipo TEXT DEFAULT 'percentual',
+        valor REAL NOT NULL,
+        inicio TEXT NOT NULL,
+        fim TEXT,
+        ativo INTEGER DEFAULT 1,
+        data_atualizacao TEXT,
+        FOREIGN KEY (produto_id) REFERENCES produtos(id)
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_promocoes_vigencia ON promocoes (ativo, inicio, fim)')
+
     # Criar admin padrão se não existir
     c.execute('SELECT COUNT(*) FROM usuarios WHERE tipo = "admin"')
     if c.fetchone()[0] == 0:
@@ -217,6 +432,12 @@ def init_db():
         ('estoque_alerta', '5', 'Alertar quando estoque abaixo de', 'numero'),
         ('carrinho_abandono_horas', '24', 'Marcar carrinho como abandonado após (horas)', 'numero'),
         ('openai_api_key', '', 'Chave API do OpenAI para assistente IA', 'senha'),
+        ('catalogo_versao', '0', 'Versão do catálogo (incrementada a cada alteração de produto)', 'numero'),
+        ('limite_login', '10/60', 'Tentativas de login por IP (requisições/segundos)', 'limite'),
+        ('limite_api_chat', '6/60', 'Mensagens ao chat por usuário ou IP (requisições/segundos)', 'limite'),
+        ('limite_calcular_roi', '30/60', 'Simulações da calculadora por usuário ou IP (requisições/segundos)', 'limite'),
+        ('limite_buscar_produtos', '60/60', 'Buscas rápidas de produtos por usuário ou IP (requisições/segundos)', 'limite'),
+        ('limite_validar_cupom', '10/60', 'Validações de cupom por usuário ou IP (requisições/segundos)', 'limite'),
     ]
     
     for config in configs_padrao:
@@ -343,13 +564,16 @@ def init_db():
                   ('BEMVINDO10', 'Desconto de 10% para novos clientes', 'percentual', 10, 500, 100, 1, 
                    datetime.now().strftime('%Y-%m-%d'), '2025-12-31'))
 
-    conn.commit()
-    conn.close()
+    if proprio:
+        conn.commit()
+        conn.close()
     print("Banco de dados inicializado com sucesso!")
 
-def migrate_db():
+def migrate_db(conn=None):
     """Atualiza estrutura do banco existente sem perder dados"""
-    conn = sqlite3.connect('solarpro.db')
+    proprio = conn is None
+    if proprio:
+        conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
     # Adicionar colunas novas se não existirem
@@ -377,9 +601,36 @@ def migrate_db():
     try:
         c.execute('ALTER TABLE produtos ADD COLUMN custo REAL DEFAULT 0')
     except: pass
+    try:
+        c.execute('ALTER TABLE produtos ADD COLUMN data_atualizacao TEXT')
+    except: pass
+    try:
+        c.execute('ALTER TABLE carrinhos ADD COLUMN versao INTEGER DEFAULT 0')
+    except: pass
+    try:
+        c.execute('ALTER TABLE pedidos ADD COLUMN mercadopago_preference_id TEXT')
+    except: pass
+    try:
+        c.execute('ALTER TABLE pedidos ADD COLUMN mercadopago_init_point TEXT')
+    except: pass
+    try:
+        c.execute('ALTER TABLE pedidos ADD COLUMN mercadopago_sandbox_init_point TEXT')
+    except: pass
+    try:
+        c.execute('ALTER TABLE produtos ADD COLUMN sku TEXT')
+    except: pass
+    try:
+        c.execute('ALTER TABLE produtos ADD COLUMN preco_campanha REAL')
+    except: pass
+    try:
+        c.execute('ALTER TABLE produtos ADD COLUMN promocao_id INTEGER')
+    except: pass
+    # Código do fornecedor usado pela importação em lote (importacao.py); NULLs não conflitam
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_sku ON produtos (sku)')
     
-    conn.commit()
-    conn.close()
+    if proprio:
+        conn.commit()
+        conn.close()
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta
+
+from database import get_db_connection
+
+# Limite de envios por minuto do provedor SMTP
+EMAIL_MAX_POR_MINUTO = int(os.environ.get('EMAIL_MAX_POR_MINUTO', 30))
+EMAIL_MAX_TENTATIVAS = 5
+EMAIL_LOTE = 100
+
+
+class EmailService:
+    """Fila persistente de emails de saída.
+
+    As rotas apenas gravam na tabela emails_fila (de preferência na mesma
+    transação do pedido/contato). O envio acontece no agendador, em lotes
+    que reaproveitam uma única conexão SMTP.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.mail = None
+
+    def init_app(self, app, mail):
+        self.app = app
+        self.mail = mail
+
+    def enfileirar(self, destinatario, assunto, corpo, tipo=None, conn=None):
+        """Grava o email na fila. Se conn for informado, não faz commit."""
+        if not destinatario:
+            return
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conexao = conn or get_db_connection()
+        conexao.execute('''INSERT INTO emails_fila (destinatario, assunto, corpo, tipo, status, proxima_tentativa, data_criacao)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                        (destinatario, assunto, corpo, tipo, 'pendente', agora, agora))
+        if conn is None:
+            conexao.commit()
+            conexao.close()
+
+    def _vagas_no_minuto(self, conn):
+        um_minuto_atras = (datetime.now() - timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+        enviados = conn.execute('''SELECT COUNT(*) FROM emails_fila
+                                   WHERE status = 'enviado' AND data_envio >= ?''', (um_minuto_atras,)).fetchone()[0]
+        return max(0, EMAIL_MAX_POR_MINUTO - enviados)
+
+    def enviar_pendentes(self):
+        """Envia um lote da fila respeitando o limite por minuto. Retorna quantos foram enviados."""
+        if self.mail is None or not self.app.config.get('MAIL_SERVER'):
+            return 0
+
+        from flask_mail import Message
+
+        conn = get_db_connection()
+        vagas = min(self._vagas_no_minuto(conn), EMAIL_LOTE)
+        if vagas == 0:
+            conn.close()
+            return 0
+
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        emails = conn.execute('''SELECT * FROM emails_fila
+                                 WHERE status = 'pendente' AND proxima_tentativa <= ?
+                                 ORDER BY id LIMIT ?''', (agora, vagas)).fetchall()
+        if not emails:
+            conn.close()
+            return 0
+
+        enviados = 0
+        try:
+            with self.mail.connect() as conexao_smtp:
+                for email in emails:
+                    try:
+                        msg = Message(email['assunto'], recipients=[email['destinatario']], body=email['corpo'])
+                        conexao_smtp.send(msg)
+                    except Exception as e:
+                        self._registrar_falha(conn, email, e)
+                        continue
+                    conn.execute('''UPDATE emails_fila SET status = 'enviado', tentativas = tentativas + 1,
+                                    data_envio = ?, erro = NULL WHERE id = ?''',
+                                 (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), email['id']))
+                    enviados += 1
+        except Exception as e:
+            # Falha ao conectar no SMTP: o lote inteiro fica para a próxima execução
+            print(f"[Email] Erro de conexão SMTP: {e}")
+
+        conn.commit()
+        conn.close()
+
+        if enviados:
+            print(f"[Email] {enviados} email(s) enviado(s)")
+        return enviados
+
+    def _registrar_falha(self, conn, email, erro):
+        tentativas = email['tentativas'] + 1
+        if tentativas >= EMAIL_MAX_TENTATIVAS:
+            status = 'falhou'
+            proxima = None
+        else:
+            # Backoff exponencial: 2, 4, 8, 16... minutos
+            status = 'pendente'
+            proxima = (datetime.now() + timedelta(minutes=2 ** tentativas)).strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute('''UPDATE emails_fila SET status = ?, tentativas = ?, proxima_tentativa = ?, erro = ?
+                        WHERE id = ?''', (status, tentativas, proxima, str(erro)[:500], email['id']))
+        print(f"[Email] Falha ao enviar email {email['id']} (tentativa {tentativas}): {erro}")
+
+    def get_status(self):
+        conn = get_db_connection()
+        contagens = conn.execute('SELECT status, COUNT(*) AS total FROM emails_fila GROUP BY status').fetchall()
+        conn.close()
+        return {c['status']: c['total'] for c in contagens}
+
+
+email_service = EmailService()
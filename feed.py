@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import metricas
+from catalogo import versao_catalogo, preco_efetivo
+from database import get_db_connection
+
+# Diretório dos arquivos gerados (servidos por /feeds/<arquivo>)
+FEEDS_DIR = os.environ.get('FEEDS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'feeds'))
+# Intervalo (segundos) da tarefa que verifica se os feeds precisam ser refeitos
+FEED_INTERVALO = int(os.environ.get('FEED_INTERVALO', 300))
+FEED_LOTE = 500
+
+ARQUIVOS_FEED = ('produtos.xml', 'produtos.jsonl')
+ARQUIVO_ESTADO = '.estado.json'
+
+
+def _preco(valor):
+    return f'{float(valor):.2f} BRL'
+
+
+class GeradorFeed:
+    """Feeds do catálogo (XML no formato do Google Merchant e JSONL) em disco.
+
+    Os arquivos são escritos em streaming, lote a lote do cursor, então a
+    memória não cresce com o catálogo. A geração só acontece quando muda a
+    versão do catálogo ou a disponibilidade (estoque zerado/reposto, que não
+    altera a versão); e um arquivo só é substituído se o conteúdo mudou, para
+    a ETag e o Last-Modified servidos ficarem estáveis.
+    """
+
+    def __init__(self, diretorio=FEEDS_DIR):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self.ultima_geracao = None
+        self.ultima_duracao = None
+
+    def caminho(self, arquivo):
+        return os.path.join(self.diretorio, arquivo)
+
+    def _assinatura(self, conn):
+        """Versão do catálogo + resumo de quais produtos têm estoque"""
+        row = conn.execute('''SELECT COUNT(*) AS total,
+                                     COALESCE(SUM(CASE WHEN estoque > 0 THEN id ELSE 0 END), 0) AS soma,
+                                     COALESCE(SUM(CASE WHEN estoque > 0 THEN id * id ELSE 0 END), 0) AS soma_quadrados
+                              FROM produtos WHERE ativo = 1''').fetchone()
+        return f"{versao_catalogo()}:{row['total']}:{row['soma']}:{row['soma_quadrados']}"
+
+    def _estado(self):
+        try:
+            with open(self.caminho(ARQUIVO_ESTADO)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _atualizados(self, assinatura):
+        if self._estado().get('assinatura') != assinatura:
+            return False
+        return all(os.path.exists(self.caminho(arquivo)) for arquivo in ARQUIVOS_FEED)
+
+    def _produtos(self, conn):
+        cursor = conn.execute('''SELECT id, nome, descricao, preco, preco_promocional, preco_campanha, potencia_watts,
+                                        estoque, imagem, categoria
+                                 FROM produtos WHERE ativo = 1 ORDER BY id''')
+        while True:
+            lote = cursor.fetchmany(FEED_LOTE)
+            if not lote:
+                break
+            yield from lote
+
+    def _item(self, p, site_url):
+        # Mesmo caminho de product_image_url, com o endereço público da loja
+        imagem = f"{site_url}/static/images/products/{p['imagem']}" if p['imagem'] else None
+        return {
+            'id': p['id'],
+            'titulo': p['nome'],
+            'descricao': p['descricao'] or '',
+            'link': f"{site_url}/produto/{p['id']}",
+            'imagem': imagem,
+            'preco': float(p['preco']),
+            'preco_efetivo': preco_efetivo(p),
+            'disponivel': (p['estoque'] or 0) > 0,
+            'categoria': p['categoria'],
+            'potencia_watts': p['potencia_watts'],
+        }
+
+    def _escrever(self, arquivo, linhas):
+        """Grava em um temporário e só troca o arquivo se o conteúdo mudou"""
+        destino = self.caminho(arquivo)
+        temporario = f'{destino}.{os.getpid()}.tmp'
+        novo = hashlib.sha1()
+        try:
+            with open(temporario, 'w', encoding='utf-8') as f:
+                for linha in linhas:
+                    f.write(linha)
+                    novo.update(linha.encode('utf-8'))
+        except Exception:
+            os.remove(temporario)
+            raise
+
+        if os.path.exists(destino):
+            atual = hashlib.sha1()
+            with open(destino, 'rb') as f:
+                for bloco in iter(lambda: f.read(65536), b''):
+                    atual.update(bloco)
+            if atual.digest() == novo.digest():
+                os.remove(temporario)
+                return False
+        os.replace(temporario, destino)
+        return True
+
+    def _linhas_xml(self, conn, site_url, loja_nome):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+        yield f'<title>{escape(loja_nome)}</title>\n<link>{escape(site_url)}</link>\n'
+        for p in self._produtos(conn):
+            item = self._item(p, site_url)
+            partes = [
+                '<item>',
+                f"<g:id>{item['id']}</g:id>",
+                f"<title>{escape(item['titulo'])}</title>",
+                f"<description>{escape(item['descricao'])}</description>",
+                f"<link>{escape(item['link'])}</link>",
+            ]
+            if item['imagem']:
+                partes.append(f"<g:image_link>{escape(item['imagem'])}</g:image_link>")
+            partes.append(f"<g:price>{_preco(item['preco'])}</g:price>")
+            if item['preco_efetivo'] < item['preco']:
+                partes.append(f"<g:sale_price>{_preco(item['preco_efetivo'])}</g:sale_price>")
+            partes.append(f"<g:availability>{'in_stock' if item['disponivel'] else 'out_of_stock'}</g:availability>")
+            partes.append('<g:condition>new</g:condition>')
+            if item['categoria']:
+                partes.append(f"<g:product_type>{escape(item['categoria'])}</g:product_type>")
+            partes.append('</item>\n')
+            yield ''.join(partes)
+        yield '</channel>\n</rss>\n'
+
+    def _linhas_jsonl(self, conn, site_url):
+        for p in self._produtos(conn):
+            yield json.dumps(self._item(p, site_url), ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    def gerar(self, site_url, loja_nome='SolarPro', forcar=False):
+        """Refaz os feeds se o catálogo mudou. Retorna os arquivos substituídos."""
+        with self._lock:
+            os.makedirs(self.diretorio, exist_ok=True)
+            conn = get_db_connection()
+            try:
+                assinatura = self._assinatura(conn)
+                if not forcar and self._atualizados(assinatura):
+                    return []
+
+                inicio = time.perf_counter()
+                with metricas.cronometrar('feed_geracao_segundos', 'Duração da geração dos feeds de produtos'):
+                    alterados = []
+                    if self._escrever('produtos.xml', self._linhas_xml(conn, site_url, loja_nome)):
+                        alterados.append('produtos.xml')
+                    if self._escrever('produtos.jsonl', self._linhas_jsonl(conn, site_url)):
+                        alterados.append('produtos.jsonl')
+            finally:
+                conn.close()
+
+            with open(self.caminho(ARQUIVO_ESTADO), 'w') as f:
+                json.dump({'assinatura': assinatura, 'gerado_em': datetime.now().isoformat()}, f)
+            self.ultima_geracao = datetime.now()
+            self.ultima_duracao = time.perf_counter() - inicio
+            if alterados:
+                print(f"[Feed] {', '.join(alterados)} atualizado(s) em {self.ultima_duracao:.2f}s")
+            return alterados
+
+    def get_status(self):
+        return {
+            'diretorio': self.diretorio,
+            'estado': self._estado(),
+            'ultima_duracao': self.ultima_duracao
+        }
+
+
+feed = GeradorFeed()
@@ -0,0 +1,174 @@
+import csv
+import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+
+from catalogo import versao_catalogo, mapa_precos
+from database import get_db_connection
+
+DIRETORIO_DADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Tabelas de CEP: faixas não sobrepostas, ordenadas pelo início.
+# cep_cidades.csv pode ser substituído por uma base mais completa no mesmo formato.
+ARQUIVO_CEP_UF = os.path.join(DIRETORIO_DADOS, 'cep_uf.csv')
+ARQUIVO_CEP_CIDADES = os.path.join(DIRETORIO_DADOS, 'cep_cidades.csv')
+
+# Zona -> (valor base R$, valor por kg R$, prazo em dias úteis), a partir de São Paulo
+TABELA_ZONAS = {
+    1: (80.0, 1.20, 2),    # Grande São Paulo
+    2: (120.0, 1.80, 4),   # Interior de SP
+    3: (180.0, 2.50, 6),   # Sudeste e Sul
+    4: (250.0, 3.50, 9),   # Centro-Oeste e Nordeste
+    5: (320.0, 4.50, 12),  # Norte
+}
+
+# Usado quando as especificações do produto não trazem peso nem dimensões
+PESO_PADRAO_CATEGORIA = {
+    'Kit Completo': 300.0,
+    'Inversor': 15.0,
+}
+PESO_PADRAO = 25.0
+
+# Fator de cubagem rodoviária (kg por m³)
+FATOR_CUBAGEM = 300.0
+
+
+class TabelaFaixas:
+    """Faixas de CEP carregadas em arrays paralelos para busca com bisect"""
+
+    def __init__(self, caminho, colunas):
+        self.inicios = []
+        self.fins = []
+        self.dados = []
+        if not os.path.exists(caminho):
+            return
+        with open(caminho, encoding='utf-8') as arquivo:
+            linhas = sorted(csv.DictReader(arquivo), key=lambda l: int(l['inicio']))
+        for linha in linhas:
+            self.inicios.append(int(linha['inicio']))
+            self.fins.append(int(linha['fim']))
+            self.dados.append({c: linha[c] for c in colunas})
+
+    def buscar(self, cep):
+        indice = bisect_right(self.inicios, cep) - 1
+        if indice >= 0 and cep <= self.fins[indice]:
+            return self.dados[indice]
+        return None
+
+
+_tabelas = {}
+_lock = threading.Lock()
+_pesos = None
+_pesos_versao = None
+
+
+def _tabela(nome):
+    if nome not in _tabelas:
+        with _lock:
+            if nome not in _tabelas:
+                if nome == 'uf':
+                    _tabelas[nome] = TabelaFaixas(ARQUIVO_CEP_UF, ('uf', 'zona'))
+                else:
+                    _tabelas[nome] = TabelaFaixas(ARQUIVO_CEP_CIDADES, ('cidade', 'uf'))
+    return _tabelas[nome]
+
+
+def normalizar_cep(cep):
+    digitos = re.sub(r'\D', '', str(cep or ''))
+    return int(digitos) if len(digitos) == 8 else None
+
+
+def buscar_cep(cep):
+    """Retorna {'cep', 'uf', 'cidade', 'zona'} a partir da base local, ou None"""
+    numero = normalizar_cep(cep)
+    if numero is None:
+        return None
+    faixa_uf = _tabela('uf').buscar(numero)
+    if not faixa_uf:
+        return None
+    faixa_cidade = _tabela('cidades').buscar(numero)
+    return {
+        'cep': f'{numero:08d}',
+        'uf': faixa_uf['uf'],
+        'cidade': faixa_cidade['cidade'] if faixa_cidade else None,
+        'zona': int(faixa_uf['zona'])
+    }
+
+
+def _numero(texto):
+    encontrado = re.search(r'\d+(?:[.,]\d+)?', str(texto or ''))
+    return float(encontrado.group().replace(',', '.')) if encontrado else None
+
+
+def peso_produto(especificacoes, categoria):
+    """Peso taxável (kg): o maior entre o peso real e o peso cubado das especificações"""
+    try:
+        specs = json.loads(especificacoes) if especificacoes else {}
+    except (json.JSONDecodeError, TypeError):
+        specs = {}
+
+    peso = _numero(specs.get('peso'))
+
+    medidas = [float(m.replace(',', '.')) for m in re.findall(r'\d+(?:[.,]\d+)?', str(specs.get('dimensoes', '')))]
+    if len(medidas) == 3:
+        unidade_m = 0.001 if 'mm' in specs.get('dimensoes', '') else 0.01
+        volume_m3 = medidas[0] * medidas[1] * medidas[2] * unidade_m ** 3
+        peso = max(peso or 0, volume_m3 * FATOR_CUBAGEM)
+
+    return peso or PESO_PADRAO_CATEGORIA.get(categoria, PESO_PADRAO)
+
+
+def _mapa_pesos():
+    """{produto_id: peso_kg}, reconstruído quando a versão do catálogo muda"""
+    global _pesos, _pesos_versao
+    versao = versao_catalogo()
+    if _pesos is None or _pesos_versao != versao:
+        conn = get_db_connection()
+        produtos = conn.execute('SELECT id, especificacoes, categoria FROM produtos WHERE ativo = 1').fetchall()
+        conn.close()
+        _pesos = {p['id']: peso_produto(p['especificacoes'], p['categoria']) for p in produtos}
+        _pesos_versao = versao
+    return _pesos
+
+
+@lru_cache(maxsize=4096)
+def _cotar(prefixo_cep, assinatura, frete_gratis_acima, versao):
+    # As faixas da tabela de UF têm granularidade de 5 dígitos
+    faixa_uf = _tabela('uf').buscar(int(prefixo_cep) * 1000)
+    zona = int(faixa_uf['zona'])
+    pesos = _mapa_pesos()
+    precos = mapa_precos()
+
+    peso_total = sum(pesos.get(produto_id, PESO_PADRAO) * quantidade for produto_id, quantidade in assinatura)
+    subtotal = sum(precos[produto_id]['preco'] * quantidade
+                   for produto_id, quantidade in assinatura if produto_id in precos)
+
+    base, por_kg, prazo = TABELA_ZONAS[zona]
+    gratis = frete_gratis_acima > 0 and subtotal >= frete_gratis_acima
+    valor = 0.0 if gratis else round(base + por_kg * peso_total, 2)
+
+    return {
+        'valor': valor,
+        'prazo_dias': prazo,
+        'zona': zona,
+        'uf': faixa_uf['uf'],
+        'peso_kg': round(peso_total, 1),
+        'gratis': gratis
+    }
+
+
+def cotar_frete(cep, quantidades, frete_gratis_acima=0):
+    """Cota o frete para {produto_id: quantidade} até o CEP informado.
+
+    O resultado é memorizado por (prefixo do CEP, itens do carrinho), e a
+    versão do catálogo entra na chave para que mudanças de produto valham.
+    Retorna None se o CEP não for reconhecido.
+    """
+    local = buscar_cep(cep)
+    if not local:
+        return None
+    assinatura = tuple(sorted((int(p), int(q)) for p, q in quantidades.items() if int(q) > 0))
+    return dict(_cotar(local['cep'][:5], assinatura, float(frete_gratis_acima or 0), versao_catalogo()))
@@ -1,8 +1,14 @@
 import os
-import google.generativeai as genai
 from datetime import datetime
 import time
 
+import metricas
+
+def _genai():
+    # Import tardio: o SDK do Google é pesado e só é necessário na primeira pergunta
+    import google.generativeai as genai
+    return genai
+
 class GeminiService:
     def __init__(self):
         self.api_keys = []
@@ -23,13 +29,12 @@ class GeminiService:
         self.failed_keys = set()
         self.last_rotation = datetime.now()
         self.model_name = 'gemini-2.0-flash'
-        
-        if self.api_keys:
-            self._configure_current_key()
+        self.configurado = False
     
     def _configure_current_key(self):
         if self.api_keys:
-            genai.configure(api_key=self.api_keys[self.current_key_index])
+            _genai().configure(api_key=self.api_keys[self.current_key_index])
+            self.configurado = True
             print(f"[Gemini] Usando chave {self.current_key_index + 1} de {len(self.api_keys)}")
     
     def _rotate_key(self):
@@ -73,10 +78,17 @@ Se não souber a resposta, indique que o cliente pode entrar em contato pelo tel
         
         full_prompt = f"{system_prompt}\n\nCliente: {prompt}\n\nAssistente:"
         
+        if not self.configurado:
+            self._configure_current_key()
+        genai = _genai()
+        
         for attempt in range(max_retries):
             try:
                 model = genai.GenerativeModel(self.model_name)
-                response = model.generate_content(full_prompt)
+                with metricas.cronometrar('gemini_latencia_segundos',
+                                          'Latência das chamadas ao Gemini',
+                                          modelo=self.model_name):
+                    response = model.generate_content(full_prompt)
                 
                 if response and response.text:
                     self.failed_keys.discard(self.current_key_index)
@@ -0,0 +1,145 @@
+"""Configuração do Gunicorn (Procfile: gunicorn -c gunicorn.conf.py app:app).
+
+Perfis (GUNICORN_PERFIL):
+    gthread (padrão)  cores + 1 workers com GUNICORN_THREADS threads (padrão 4). Uma
+                      chamada lenta ao Gemini ou ao Mercado Pago ocupa uma thread,
+                      não o worker inteiro.
+    gevent            cores + 1 workers com até GUNICORN_CONEXOES conexões cada
+                      (requer o pacote gevent; sem ele cai para gthread).
+    sync              2 * cores + 1 workers de uma requisição por vez (o antigo Procfile).
+
+WEB_CONCURRENCY fixa o número de workers em qualquer perfil. Resultados
+comparativos em benchmarks/resultados/perfis_gunicorn.md.
+"""
+import os
+import threading
+import time
+
+# Avisa o app.py que o agendador deve ser iniciado em cada worker (post_fork),
+# não no processo mestre durante o preload
+os.environ['SOLARPRO_PRELOAD'] = '1' if os.environ.get('GUNICORN_PRELOAD', '1') == '1' else '0'
+
+CORES = os.cpu_count() or 1
+PERFIL = os.environ.get('GUNICORN_PERFIL', 'gthread')
+INTERVALO_OCUPACAO = int(os.environ.get('GUNICORN_INTERVALO_OCUPACAO', 60))
+
+if PERFIL == 'gevent':
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("[Gunicorn] gevent não instalado, usando o perfil gthread")
+        PERFIL = 'gthread'
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+if PERFIL == 'sync':
+    worker_class = 'sync'
+    workers = int(os.environ.get('WEB_CONCURRENCY', 2 * CORES + 1))
+    threads = 1
+elif PERFIL == 'gevent':
+    worker_class = 'gevent'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CORES + 1))
+    worker_connections = int(os.environ.get('GUNICORN_CONEXOES', 100))
+    threads = 1
+else:
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', CORES + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Nos perfis assíncronos o timeout só vigia o loop do worker, não cada requisição;
+# chamadas externas têm seus próprios timeouts nos serviços
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla workers periodicamente (vazamentos de memória em SDKs), com jitter
+# para que não reiniciem todos ao mesmo tempo
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max(1, max_requests // 10)
+
+# Carrega o app uma vez no mestre: templates compilados, tabelas de CEP e
+# migrações de schema ficam prontos antes do fork e são compartilhados
+preload_app = os.environ['SOLARPRO_PRELOAD'] == '1'
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """Inicializa o que não sobrevive ao fork, já dentro do worker.
+
+    Threads (agendador, pool de hashes de senha) não são copiadas pelo fork e
+    o lock de arquivo do agendador seria herdado do mestre. Conexões ao banco
+    são abertas por requisição e o pool do PostgreSQL é criado por processo;
+    os SDKs do Gemini e do Mercado Pago só são importados no primeiro uso.
+    """
+    if preload_app and os.environ.get('AGENDADOR_ATIVO', '1') == '1':
+        from agendador import agendador
+        agendador.iniciar()
+    worker.ocupacao = Ocupacao(threads)
+
+
+class Ocupacao:
+    """Fração do tempo em que o worker esteve atendendo requisições, por janela"""
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self._lock = threading.Lock()
+        self._inicio_janela = time.monotonic()
+        self._ocupado = 0.0
+        self._em_andamento = {}
+        self._requisicoes = 0
+        self._pico = 0
+
+    def iniciar(self, chave):
+        with self._lock:
+            self._em_andamento[chave] = time.monotonic()
+            self._pico = max(self._pico, len(self._em_andamento))
+
+    def finalizar(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            inicio = self._em_andamento.pop(chave, None)
+            if inicio is not None:
+                self._ocupado += agora - max(inicio, self._inicio_janela)
+                self._requisicoes += 1
+            if agora - self._inicio_janela < INTERVALO_OCUPACAO:
+                return None
+            # Requisições ainda em andamento contam até o fim da janela
+            ocupado = self._ocupado + sum(agora - max(i, self._inicio_janela) for i in self._em_andamento.values())
+            fracao = ocupado / ((agora - self._inicio_janela) * self.capacidade)
+            resumo = (fracao, self._requisicoes, self._pico)
+            self._inicio_janela = agora
+            self._ocupado = 0.0
+            self._requisicoes = 0
+            self._pico = len(self._em_andamento)
+            return resumo
+
+    def em_andamento(self):
+        with self._lock:
+            return len(self._em_andamento)
+
+
+def pre_request(worker, req):
+    worker.ocupacao.iniciar(id(req))
+
+
+def post_request(worker, req, environ, resp):
+    resumo = worker.ocupacao.finalizar(id(req))
+    if resumo is None:
+        return
+    fracao, requisicoes, pico = resumo
+    import metricas
+    metricas.histograma('gunicorn_ocupacao_worker', 'Fração do tempo do worker atendendo requisições',
+                        buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 1.0)).observar(fracao)
+    worker.log.info(f"[Gunicorn] Worker {worker.pid}: ocupação {fracao:.0%}, {requisicoes} requisições, "
+                    f"pico de {pico}/{worker.ocupacao.capacidade} simultâneas")
+    if fracao > 0.9:
+        worker.log.warning(f"[Gunicorn] Worker {worker.pid} saturado; considere mais workers/threads")
+
+
+def worker_abort(worker):
+    # Timeout do worker: registra o que estava em andamento antes de o mestre matá-lo
+    worker.log.warning(f"[Gunicorn] Worker {worker.pid} abortado por timeout "
+                       f"com {worker.ocupacao.em_andamento()} requisição(ões) em andamento")
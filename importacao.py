@@ -0,0 +1,373 @@
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+from catalogo import invalidar_catalogo
+from database import get_db_connection
+
+# Linhas validadas, comparadas e gravadas por transação
+LOTE_IMPORTACAO = int(os.environ.get('IMPORTACAO_LOTE', 500))
+# Erros guardados no resultado (os demais só entram na contagem)
+IMPORTACAO_MAX_ERROS = 100
+
+
+def _texto(valor):
+    valor = str(valor).strip()
+    return valor or None
+
+
+def _objeto_json(valor):
+    """Especificações: objeto do JSONL vira texto JSON; texto (CSV) precisa ser um objeto JSON válido"""
+    if isinstance(valor, dict):
+        return json.dumps(valor)
+    valor = str(valor).strip()
+    # Produto e frete (peso, dimensões) leem as especificações com json.loads como dicionário
+    if not isinstance(json.loads(valor), dict):
+        raise ValueError('não é um objeto JSON')
+    return valor
+
+
+def _numero(valor):
+    """Aceita 1234.56, 1234,56 e 1.234,56 (planilhas em português)"""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    valor = str(valor).strip().replace('R$', '').strip()
+    if ',' in valor:
+        valor = valor.replace('.', '').replace(',', '.')
+    return float(valor)
+
+
+def _inteiro(valor):
+    numero = _numero(valor)
+    if numero != int(numero):
+        raise ValueError('não é inteiro')
+    return int(numero)
+
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return int(valor)
+    valor = str(valor).strip().lower()
+    if valor in ('1', 'sim', 's', 'true', 'verdadeiro', 'ativo'):
+        return 1
+    if valor in ('0', 'nao', 'não', 'n', 'false', 'falso', 'inativo'):
+        return 0
+    raise ValueError('use 1/0 ou sim/não')
+
+
+# Coluna -> (conversor, obrigatória ao criar, valor padrão ao criar)
+CAMPOS = {
+    'sku': (_texto, False, None),
+    'nome': (_texto, True, None),
+    'descricao': (_texto, False, None),
+    'custo': (_numero, False, 0),
+    'preco': (_numero, True, None),
+    'preco_promocional': (_numero, False, None),
+    'potencia_watts': (_inteiro, True, None),
+    'eficiencia': (_numero, True, None),
+    'garantia': (_inteiro, True, None),
+    'estoque': (_inteiro, False, 0),
+    'estoque_minimo': (_inteiro, False, 5),
+    'imagem': (_texto, False, None),
+    'categoria': (_texto, False, None),
+    'especificacoes': (_objeto_json, False, None),
+    'ativo': (_booleano, False, 1),
+    'destaque': (_booleano, False, 0),
+}
+# Colunas que não podem ser apagadas por uma célula vazia
+NAO_NULOS = {nome for nome, (_, obrigatoria, padrao) in CAMPOS.items() if obrigatoria or padrao is not None}
+
+
+def ler_csv(arquivo):
+    """Registros de um CSV (arquivo binário ou texto) como (número da linha, dicionário), sem carregar tudo.
+
+    O separador (',' ou ';', comum em planilhas exportadas em português) é
+    detectado pelo cabeçalho. O número é a linha do arquivo onde o registro
+    começa (o cabeçalho é a linha 1), contando linhas em branco e campos
+    entre aspas com quebra de linha.
+    """
+    if not isinstance(arquivo, io.TextIOBase):
+        arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    cabecalho = arquivo.readline()
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    leitor = csv.reader(itertools.chain([cabecalho], arquivo), delimiter=separador)
+    colunas = [coluna.strip().lower() for coluna in next(leitor, [])]
+    fim_anterior = leitor.line_num
+    for celulas in leitor:
+        numero = fim_anterior + 1
+        fim_anterior = leitor.line_num
+        if not celulas:
+            continue
+        # Como no csv.DictReader: células além do cabeçalho são descartadas e as que faltam ficam None
+        yield numero, {coluna: celulas[i] if i < len(celulas) else None for i, coluna in enumerate(colunas)}
+
+
+def ler_jsonl(arquivo):
+    """(número da linha, objeto) de cada linha; linhas em branco são ignoradas e JSON inválido vira erro da linha"""
+    if not isinstance(arquivo, io.TextIOBase):
+        arquivo = io.TextIOWrapper(arquivo, encoding='utf-8-sig')
+    for numero, texto in enumerate(arquivo, start=1):
+        if not texto.strip():
+            continue
+        try:
+            objeto = json.loads(texto)
+        except ValueError as e:
+            yield numero, ValueError(f'JSON inválido: {e}')
+            continue
+        if not isinstance(objeto, dict):
+            yield numero, ValueError('cada linha deve ser um objeto JSON')
+            continue
+        yield numero, {str(chave).strip().lower(): valor for chave, valor in objeto.items()}
+
+
+def ler_arquivo(arquivo, nome):
+    """Escolhe o leitor pela extensão (.jsonl/.ndjson ou CSV)"""
+    if nome.lower().endswith(('.jsonl', '.ndjson')):
+        return ler_jsonl(arquivo)
+    return ler_csv(arquivo)
+
+
+class ImportacaoInterrompida(Exception):
+    """Leitura ou gravação falhou no meio do arquivo; resultado traz o que já tinha sido gravado"""
+
+    def __init__(self, mensagem, resultado):
+        super().__init__(mensagem)
+        self.resultado = resultado
+
+
+class ImportadorProdutos:
+    """Cria e atualiza produtos em lote a partir de uma planilha de fornecedor.
+
+    Cada linha é identificada pelo sku ou, se o sku não existir no banco, pelo
+    id (o que permite atribuir skus a produtos já cadastrados); sem nenhum
+    dos dois, vira um produto novo. Só as colunas presentes no arquivo
+    são aplicadas, e uma célula vazia apaga o valor (exceto em colunas
+    obrigatórias). As linhas são lidas em lotes de LOTE_IMPORTACAO: os
+    produtos existentes do lote vêm em uma consulta IN, só as linhas que
+    realmente mudam são gravadas (executemany, uma transação por lote), e no
+    fim há um único registro em logs_admin e uma única invalidação do catálogo.
+    """
+
+    def __init__(self, lote=LOTE_IMPORTACAO):
+        self.lote = lote
+
+    def _converter(self, linha):
+        """(valores convertidos, colunas ignoradas) ou ValueError com a mensagem da linha"""
+        if isinstance(linha, ValueError):
+            raise linha
+        valores = {}
+        ignoradas = set()
+        for coluna, valor in linha.items():
+            if coluna == 'id':
+                if valor not in (None, ''):
+                    try:
+                        valores['id'] = _inteiro(valor)
+                    except ValueError:
+                        raise ValueError(f'id inválido: {valor!r}')
+                continue
+            if coluna not in CAMPOS:
+                ignoradas.add(coluna)
+                continue
+            if valor is None or str(valor).strip() == '':
+                if coluna in NAO_NULOS:
+                    raise ValueError(f'{coluna} não pode ficar vazio')
+                valores[coluna] = None
+                continue
+            try:
+                valores[coluna] = CAMPOS[coluna][0](valor)
+            except (TypeError, ValueError):
+                raise ValueError(f'{coluna} inválido: {valor!r}')
+
+        if valores.get('preco') is not None and valores['preco'] <= 0:
+            raise ValueError('preco deve ser maior que zero')
+        for coluna in ('estoque', 'estoque_minimo', 'custo'):
+            if valores.get(coluna) is not None and valores[coluna] < 0:
+                raise ValueError(f'{coluna} não pode ser negativo')
+        return valores, ignoradas
+
+    def _existentes(self, c, chave, valores):
+        if not valores:
+            return {}
+        placeholders = ', '.join('?' for _ in valores)
+        colunas = ', '.join(['id'] + [coluna for coluna in CAMPOS if coluna != 'id'])
+        linhas = c.execute(f'SELECT {colunas} FROM produtos WHERE {chave} IN ({placeholders})',
+                           list(valores)).fetchall()
+        return {row[chave]: dict(row) for row in linhas}
+
+    def _processar_lote(self, c, lote, resultado):
+        """Compara o lote com o banco e grava só as criações e alterações"""
+        com_sku = [valores['sku'] for _, valores in lote if valores.get('sku')]
+        com_id = [valores['id'] for _, valores in lote if 'id' in valores]
+        por_sku = self._existentes(c, 'sku', com_sku)
+        por_id = self._existentes(c, 'id', com_id)
+
+        agora = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        insercoes = {}
+        atualizacoes = {}
+        for numero, valores in lote:
+            atual = por_sku.get(valores['sku']) if valores.get('sku') else None
+            if atual is None and 'id' in valores:
+                # Com sku novo e id, o sku é atribuído ao produto existente
+                atual = por_id.get(valores['id'])
+                if atual is None:
+                    self._erro(resultado, numero, f'produto #{valores["id"]} não encontrado')
+                    continue
+
+            if atual is None:
+                faltando = [coluna for coluna, (_, obrigatoria, _) in CAMPOS.items()
+                            if obrigatoria and valores.get(coluna) is None]
+                if faltando:
+                    self._erro(resultado, numero, f'produto novo sem {", ".join(faltando)}')
+                    continue
+                novo = {coluna: valores.get(coluna, padrao) for coluna, (_, _, padrao) in CAMPOS.items()}
+                if not self._promocao_valida(novo):
+                    self._erro(resultado, numero, 'preco_promocional deve ser menor que o preco')
+                    continue
+                colunas = tuple(novo)
+                insercoes.setdefault(colunas, []).append(tuple(novo.values()) + (agora, agora))
+                resultado['criados'] += 1
+                continue
+
+            mudancas = {coluna: valor for coluna, valor in valores.items()
+                        if coluna != 'id' and atual.get(coluna) != valor}
+            if not mudancas:
+                resultado['inalterados'] += 1
+                continue
+            if not self._promocao_valida({**atual, **mudancas}):
+                self._erro(resultado, numero, 'preco_promocional deve ser menor que o preco')
+                continue
+            # Mesmas colunas alteradas = mesmo UPDATE, então o executemany agrupa por elas
+            colunas = tuple(sorted(mudancas))
+            atualizacoes.setdefault(colunas, []).append(
+                tuple(mudancas[coluna] for coluna in colunas) + (agora, atual['id']))
+            resultado['atualizados'] += 1
+
+        for colunas, parametros in insercoes.items():
+            placeholders = ', '.join('?' for _ in range(len(colunas) + 2))
+            c.executemany(f'''INSERT INTO produtos ({', '.join(colunas)}, data_cadastro, data_atualizacao)
+                              VALUES ({placeholders})''', parametros)
+        for colunas, parametros in atualizacoes.items():
+            atribuicoes = ', '.join(f'{coluna} = ?' for coluna in colunas)
+            c.executemany(f'UPDATE produtos SET {atribuicoes}, data_atualizacao = ? WHERE id = ?', parametros)
+
+    def _promocao_valida(self, produto):
+        promocional = produto.get('preco_promocional')
+        return promocional is None or promocional < produto['preco']
+
+    def _erro(self, resultado, numero, mensagem):
+        resultado['erros'] += 1
+        if len(resultado['mensagens']) < IMPORTACAO_MAX_ERROS:
+            resultado['mensagens'].append((numero, mensagem))
+
+    def importar(self, linhas, simular=False, usuario_id=None, ip=None, origem=''):
+        """Importa as linhas ((número, dicionário) de ler_arquivo) e retorna o resumo.
+
+        Com simular, tudo é validado e comparado mas nenhuma transação é
+        confirmada. Se a leitura ou um lote falhar no meio do arquivo, os lotes
+        já confirmados continuam valendo: o catálogo é invalidado, o log
+        registra a interrupção e ImportacaoInterrompida traz o resumo parcial.
+        """
+        inicio = time.perf_counter()
+        resultado = {'lidas': 0, 'criados': 0, 'atualizados': 0, 'inalterados': 0, 'erros': 0,
+                     'mensagens': [], 'colunas_ignoradas': set(), 'simulacao': simular, 'interrompida': None}
+        vistos = set()
+        lotes_gravados = 0
+        conn = get_db_connection()
+        try:
+            lote = []
+            for numero, linha in linhas:
+                resultado['lidas'] += 1
+                try:
+                    valores, ignoradas = self._converter(linha)
+                except ValueError as e:
+                    self._erro(resultado, numero, str(e))
+                    continue
+                resultado['colunas_ignoradas'] |= ignoradas
+
+                # Duas linhas para o mesmo produto: a segunda seria comparada com o estado antigo
+                chave = ('sku', valores['sku']) if valores.get('sku') else ('id', valores.get('id'))
+                if chave[1] is not None:
+                    if chave in vistos:
+                        self._erro(resultado, numero, f'{chave[0]} {chave[1]} repetido no arquivo')
+                        continue
+                    vistos.add(chave)
+
+                lote.append((numero, valores))
+                if len(lote) >= self.lote:
+                    self._gravar(conn, lote, resultado, simular)
+                    lotes_gravados += 1
+                    lote = []
+            if lote:
+                self._gravar(conn, lote, resultado, simular)
+                lotes_gravados += 1
+            if not simular:
+                self._finalizar(conn, resultado, usuario_id, ip, origem, inicio)
+        except Exception as e:
+            leitura = isinstance(e, (UnicodeDecodeError, csv.Error))
+            resultado['interrompida'] = f"{'não foi possível ler o arquivo' if leitura else 'erro ao gravar'}: {e}"
+            conn.rollback()
+            # Também cobre a falha do registro final: com algum lote confirmado, invalidação e log são refeitos
+            if not simular and lotes_gravados:
+                self._finalizar(conn, resultado, usuario_id, ip, origem, inicio)
+            conn.close()
+            print(f"[Importação] Interrompida após {lotes_gravados} lote(s) gravado(s): {e}")
+            raise ImportacaoInterrompida(resultado['interrompida'], self._resumo(resultado, inicio)) from e
+        conn.close()
+
+        self._resumo(resultado, inicio)
+        print(f"[Importação] {self.descrever(resultado, origem)} em {resultado['duracao']:.2f}s"
+              f"{' (simulação)' if simular else ''}")
+        return resultado
+
+    def _finalizar(self, conn, resultado, usuario_id, ip, origem, inicio):
+        """Uma invalidação do catálogo e um registro em logs_admin para a importação inteira"""
+        resultado['duracao'] = time.perf_counter() - inicio
+        detalhes = self.descrever(resultado, origem)
+        if resultado['interrompida']:
+            detalhes += f" (interrompida, {resultado['interrompida']})"
+        try:
+            if resultado['criados'] or resultado['atualizados']:
+                invalidar_catalogo(conn)
+            conn.execute('''INSERT INTO logs_admin (usuario_id, acao, detalhes, ip, data)
+                            VALUES (?, ?, ?, ?, ?)''',
+                         (usuario_id, 'Importação de produtos', detalhes, ip,
+                          datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+        except Exception:
+            if not resultado['interrompida']:
+                raise
+            # O banco continua indisponível: o erro original é o que importa para quem chamou
+            conn.rollback()
+            print(f"[Importação] Não foi possível registrar a importação interrompida: {detalhes}")
+
+    def _resumo(self, resultado, inicio):
+        resultado['duracao'] = time.perf_counter() - inicio
+        resultado['colunas_ignoradas'] = sorted(resultado['colunas_ignoradas'])
+        resultado['mensagens'].sort()
+        return resultado
+
+    def _gravar(self, conn, lote, resultado, simular):
+        # Contagens do lote só valem se ele for confirmado
+        contagens = {chave: resultado[chave] for chave in ('criados', 'atualizados', 'inalterados')}
+        try:
+            self._processar_lote(conn, lote, resultado)
+            if simular:
+                conn.rollback()
+            else:
+                conn.commit()
+        except Exception:
+            resultado.update(contagens)
+            raise
+
+    def descrever(self, resultado, origem=''):
+        texto = (f"{resultado['lidas']} linha(s): {resultado['criados']} criado(s), "
+                 f"{resultado['atualizados']} atualizado(s), {resultado['inalterados']} inalterado(s), "
+                 f"{resultado['erros']} erro(s)")
+        return f'{origem}: {texto}' if origem else texto
+
+
+importador = ImportadorProdutos()
@@ -0,0 +1,68 @@
+"""Importa ou atualiza produtos em lote a partir de um CSV ou JSONL de fornecedor.
+
+Uso:
+    python importar_produtos.py tabela_fornecedor.csv --simular       # só valida e mostra o que mudaria
+    python importar_produtos.py tabela_fornecedor.csv --admin admin@solarpro.com
+    python importar_produtos.py precos.jsonl --lote 1000
+
+Colunas aceitas: id, sku e as de importacao.CAMPOS (nome, preco, estoque, ...).
+As mesmas regras da importação em /admin/produtos/importar; o registro em
+logs_admin fica no nome do admin informado em --admin.
+"""
+import argparse
+import os
+import sys
+
+from database import get_db_connection, preparar_banco
+from importacao import ImportacaoInterrompida, ImportadorProdutos, LOTE_IMPORTACAO, ler_arquivo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('arquivo', help='arquivo .csv, .jsonl ou - para a entrada padrão (CSV)')
+    parser.add_argument('--simular', action='store_true', help='valida e compara sem gravar nada')
+    parser.add_argument('--admin', metavar='EMAIL', help='admin registrado em logs_admin')
+    parser.add_argument('--lote', type=int, default=LOTE_IMPORTACAO)
+    args = parser.parse_args()
+
+    preparar_banco()
+    usuario_id = None
+    if args.admin:
+        conn = get_db_connection()
+        admin = conn.execute("SELECT id FROM usuarios WHERE email = ? AND tipo = 'admin'", (args.admin,)).fetchone()
+        conn.close()
+        if not admin:
+            raise SystemExit(f'Admin {args.admin} não encontrado')
+        usuario_id = admin['id']
+
+    if args.arquivo == '-':
+        linhas = ler_arquivo(sys.stdin.buffer, 'stdin.csv')
+        origem = 'stdin'
+    else:
+        if not os.path.exists(args.arquivo):
+            raise SystemExit(f'Arquivo {args.arquivo} não encontrado')
+        linhas = ler_arquivo(open(args.arquivo, 'rb'), args.arquivo)
+        origem = os.path.basename(args.arquivo)
+
+    try:
+        resultado = ImportadorProdutos(lote=args.lote).importar(
+            linhas, simular=args.simular, usuario_id=usuario_id, ip='cli', origem=origem)
+    except ImportacaoInterrompida as e:
+        resultado = e.resultado
+        print(f"  interrompida: {e}")
+        if not args.simular:
+            print(f"  {resultado['criados']} criado(s) e {resultado['atualizados']} atualizado(s) "
+                  f"antes da falha foram mantidos")
+
+    for numero, mensagem in resultado['mensagens']:
+        print(f"  linha {numero}: {mensagem}")
+    if resultado['erros'] > len(resultado['mensagens']):
+        print(f"  ... e mais {resultado['erros'] - len(resultado['mensagens'])} erro(s)")
+    if resultado['colunas_ignoradas']:
+        print(f"  colunas ignoradas: {', '.join(resultado['colunas_ignoradas'])}")
+    if resultado['erros'] or resultado['interrompida']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
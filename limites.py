@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+
+from repositorio import get_configs
+
+# 'memoria' (cada worker com seus baldes) ou 'sqlite' (baldes compartilhados entre workers em um arquivo)
+LIMITE_ARMAZENAMENTO = os.environ.get('LIMITE_ARMAZENAMENTO', 'memoria')
+LIMITE_SQLITE = os.environ.get('LIMITE_SQLITE', '/tmp/solarpro_limites.db')
+# De quanto em quanto tempo (segundos) os limites são relidos de configuracoes
+LIMITE_RECARGA = 30
+# Baldes parados há mais que isso (segundos) são descartados
+LIMITE_OCIOSO = 3600
+LIMITE_MAX_BALDES = 100000
+
+# Descarte de carga: com o proxy enviando X-Request-Start, requisições que
+# esperaram na fila mais que isso (ms) são recusadas nas rotas descartáveis
+FILA_MAX_MS = float(os.environ.get('FILA_MAX_MS', 2000))
+
+# Endpoint -> (chave em configuracoes, métodos limitados, limite padrão "requisições/segundos")
+REGRAS = {
+    'login': ('limite_login', ('POST',), '10/60'),
+    'api_chat': ('limite_api_chat', ('POST',), '6/60'),
+    'calcular_roi': ('limite_calcular_roi', ('POST',), '30/60'),
+    'api_buscar_produtos': ('limite_buscar_produtos', ('GET',), '60/60'),
+    'validar_cupom': ('limite_validar_cupom', ('POST',), '10/60'),
+}
+
+# Rotas que podem ser recusadas com 503 quando o servidor está atrasado
+ENDPOINTS_DESCARTAVEIS = {
+    'api_chat', 'api_chat_recomendacao', 'api_chat_economia', 'calcular_roi',
+    'api_buscar_produtos', 'api_produtos', 'feed_produtos', 'sitemap_indice', 'sitemap_arquivo',
+}
+
+
+def interpretar_limite(valor):
+    """'10/60' -> (capacidade 10, reposição de 10/60 fichas por segundo); '0' ou vazio desliga"""
+    try:
+        quantidade, _, segundos = str(valor).partition('/')
+        quantidade = float(quantidade)
+        segundos = float(segundos or 60)
+    except ValueError:
+        return None
+    if quantidade <= 0 or segundos <= 0:
+        return None
+    return quantidade, quantidade / segundos
+
+
+def _consumir(tokens, atualizado, capacidade, taxa, agora):
+    """Balde de fichas: repõe pelo tempo passado e tenta tirar uma.
+
+    Retorna (permitido, fichas restantes, segundos até a próxima ficha).
+    """
+    if tokens is None:
+        tokens = capacidade
+    else:
+        tokens = min(capacidade, tokens + (agora - atualizado) * taxa)
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, (1 - tokens) / taxa
+
+
+class ArmazenamentoMemoria:
+    def __init__(self):
+        self._baldes = {}
+        self._lock = threading.Lock()
+
+    def consumir(self, chave, capacidade, taxa):
+        agora = time.monotonic()
+        with self._lock:
+            tokens, atualizado = self._baldes.get(chave, (None, agora))
+            permitido, tokens, espera = _consumir(tokens, atualizado, capacidade, taxa, agora)
+            if len(self._baldes) >= LIMITE_MAX_BALDES:
+                self._baldes = {k: v for k, v in self._baldes.items() if agora - v[1] < LIMITE_OCIOSO}
+            self._baldes[chave] = (tokens, agora)
+        return permitido, espera
+
+
+class ArmazenamentoSQLite:
+    """Baldes em um arquivo SQLite à parte (não o banco da loja), compartilhado pelos workers"""
+
+    def __init__(self, caminho=LIMITE_SQLITE):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._operacoes = 0
+
+    def _conexao(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=1, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''CREATE TABLE IF NOT EXISTS baldes (
+                chave TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                atualizado REAL NOT NULL
+            )''')
+            self._local.conn = conn
+        return conn
+
+    def consumir(self, chave, capacidade, taxa):
+        conn = self._conexao()
+        agora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, atualizado FROM baldes WHERE chave = ?', (chave,)).fetchone()
+            tokens, atualizado = row if row else (None, agora)
+            permitido, tokens, espera = _consumir(tokens, atualizado, capacidade, taxa, agora)
+            conn.execute('INSERT OR REPLACE INTO baldes (chave, tokens, atualizado) VALUES (?, ?, ?)',
+                         (chave, tokens, agora))
+            self._operacoes += 1
+            if self._operacoes % 1000 == 0:
+                conn.execute('DELETE FROM baldes WHERE atualizado < ?', (agora - LIMITE_OCIOSO,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return permitido, espera
+
+
+class LimitadorRequisicoes:
+    """Limites por rota com balde de fichas, por usuário logado ou por IP.
+
+    Os limites ficam em configuracoes (limite_* = "requisições/segundos") e são
+    relidos a cada LIMITE_RECARGA segundos; a verificação em si não toca no
+    banco da loja, então um 429 sai sem nenhuma consulta.
+    """
+
+    def __init__(self, armazenamento=None):
+        if armazenamento is None:
+            armazenamento = ArmazenamentoSQLite() if LIMITE_ARMAZENAMENTO == 'sqlite' else ArmazenamentoMemoria()
+        self.armazenamento = armazenamento
+        self._limites = {}
+        self._carregado_em = None
+        self.recusadas = {}
+
+    def _limite(self, endpoint):
+        agora = time.monotonic()
+        if self._carregado_em is None or agora - self._carregado_em >= LIMITE_RECARGA:
+            self._carregado_em = agora
+            self._carregar()
+        return self._limites.get(endpoint)
+
+    def _carregar(self):
+        try:
+            configs = get_configs(*(chave for chave, _, _ in REGRAS.values()))
+        except Exception as e:
+            print(f"[Limites] Erro ao ler configurações, usando os padrões: {e}")
+            configs = {}
+        self._limites = {
+            endpoint: interpretar_limite(configs.get(chave) or padrao)
+            for endpoint, (chave, _, padrao) in REGRAS.items()
+        }
+
+    def verificar(self, endpoint, metodo, identidade):
+        """Segundos até poder tentar de novo, ou 0 se a requisição pode seguir"""
+        regra = REGRAS.get(endpoint)
+        if regra is None or metodo not in regra[1]:
+            return 0
+        limite = self._limite(endpoint)
+        if limite is None:
+            return 0
+        capacidade, taxa = limite
+        try:
+            permitido, espera = self.armazenamento.consumir(f'{endpoint}:{identidade}', capacidade, taxa)
+        except sqlite3.Error as e:
+            # Armazenamento compartilhado indisponível: não derruba a rota por causa disso
+            print(f"[Limites] Erro no armazenamento: {e}")
+            return 0
+        if permitido:
+            return 0
+        self.recusadas[endpoint] = self.recusadas.get(endpoint, 0) + 1
+        return max(1, int(espera + 0.999))
+
+    def recarregar(self):
+        """Força a releitura dos limites (após salvar as configurações)"""
+        self._carregado_em = None
+
+    def get_status(self):
+        return {
+            'armazenamento': type(self.armazenamento).__name__,
+            'limites': {endpoint: self._limites.get(endpoint) for endpoint in REGRAS},
+            'recusadas': dict(self.recusadas)
+        }
+
+
+def tempo_na_fila_ms(cabecalho, agora=None):
+    """Tempo de espera na fila a partir de X-Request-Start ('t=1700000000.123', em s, ms ou µs)"""
+    if not cabecalho:
+        return None
+    try:
+        valor = float(cabecalho.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    agora = time.time() if agora is None else agora
+    # Normaliza para segundos conforme a ordem de grandeza
+    while valor > agora * 10:
+        valor /= 1000
+    return max(0.0, (agora - valor) * 1000)
+
+
+limitador = LimitadorRequisicoes()
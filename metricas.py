@@ -0,0 +1,151 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Limites superiores (em segundos) dos buckets de latência
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Buckets para contagens (ex.: consultas SQL por requisição)
+BUCKETS_CONTAGEM = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Consultas acima deste tempo são registradas no log com o texto do SQL
+SQL_LENTO_MS = float(os.environ.get('SQL_LENTO_MS', 100))
+
+
+class Histograma:
+    """Histograma cumulativo simples, seguro para uso entre threads"""
+
+    def __init__(self, nome, descricao='', rotulos=None, buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = dict(rotulos or {})
+        self.buckets = tuple(buckets)
+        self.contagens = [0] * (len(self.buckets) + 1)
+        self.soma = 0.0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            self.contagens[indice] += 1
+            self.soma += valor
+            self.total += 1
+
+    def snapshot(self):
+        with self._lock:
+            contagens = list(self.contagens)
+            soma = self.soma
+            total = self.total
+
+        acumulado = 0
+        buckets = []
+        for limite, contagem in zip(self.buckets, contagens):
+            acumulado += contagem
+            buckets.append((limite, acumulado))
+
+        return {
+            'nome': self.nome,
+            'rotulos': self.rotulos,
+            'buckets': buckets,
+            'soma': soma,
+            'total': total,
+            'media': (soma / total) if total else 0
+        }
+
+
+_histogramas = {}
+_lock_registro = threading.Lock()
+
+
+def histograma(nome, descricao='', buckets=BUCKETS_PADRAO, **rotulos):
+    """Retorna (criando se necessário) o histograma para nome + rótulos"""
+    chave = (nome, tuple(sorted(rotulos.items())))
+    hist = _histogramas.get(chave)
+    if hist is None:
+        with _lock_registro:
+            hist = _histogramas.get(chave)
+            if hist is None:
+                hist = Histograma(nome, descricao, rotulos, buckets)
+                _histogramas[chave] = hist
+    return hist
+
+
+@contextmanager
+def cronometrar(nome, descricao='', **rotulos):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma(nome, descricao, **rotulos).observar(time.perf_counter() - inicio)
+
+
+def resumo():
+    return [h.snapshot() for h in list(_histogramas.values())]
+
+
+# ---------- SQL por requisição ----------
+
+_requisicao = threading.local()
+
+
+def iniciar_requisicao():
+    _requisicao.consultas = 0
+    _requisicao.tempo_sql = 0.0
+
+
+def finalizar_requisicao():
+    """Retorna (consultas, segundos em SQL) acumulados desde iniciar_requisicao()"""
+    consultas = getattr(_requisicao, 'consultas', 0)
+    tempo_sql = getattr(_requisicao, 'tempo_sql', 0.0)
+    _requisicao.consultas = 0
+    _requisicao.tempo_sql = 0.0
+    return consultas, tempo_sql
+
+
+def registrar_sql(duracao, nova_consulta=True):
+    if hasattr(_requisicao, 'consultas'):
+        if nova_consulta:
+            _requisicao.consultas += 1
+        _requisicao.tempo_sql += duracao
+
+
+def registrar_sql_lento(sql, quantidade_parametros, duracao):
+    sql_compacto = re.sub(r'\s+', ' ', sql).strip()
+    print(f"[SQL lento] {duracao * 1000:.1f} ms ({quantidade_parametros} parâmetros): {sql_compacto}")
+
+
+# ---------- Exportação no formato Prometheus ----------
+
+def _formatar_rotulos(rotulos, extra=None):
+    itens = list(rotulos.items()) + (list(extra.items()) if extra else [])
+    if not itens:
+        return ''
+    partes = []
+    for chave, valor in itens:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{chave}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def exportar_prometheus():
+    linhas = []
+    por_nome = {}
+    for hist in list(_histogramas.values()):
+        por_nome.setdefault(hist.nome, []).append(hist)
+
+    for nome in sorted(por_nome):
+        hists = por_nome[nome]
+        linhas.append(f'# HELP {nome} {hists[0].descricao or nome}')
+        linhas.append(f'# TYPE {nome} histogram')
+        for hist in hists:
+            dados = hist.snapshot()
+            for limite, acumulado in dados['buckets']:
+                linhas.append(f'{nome}_bucket{_formatar_rotulos(hist.rotulos, {"le": limite})} {acumulado}')
+            linhas.append(f'{nome}_bucket{_formatar_rotulos(hist.rotulos, {"le": "+Inf"})} {dados["total"]}')
+            linhas.append(f'{nome}_sum{_formatar_rotulos(hist.rotulos)} {dados["soma"]}')
+            linhas.append(f'{nome}_count{_formatar_rotulos(hist.rotulos)} {dados["total"]}')
+
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,115 @@
+import threading
+
+import metricas
+
+# Tamanho do pool de conexões keep-alive com a API do Mercado Pago
+POOL_CONEXOES = 10
+
+
+def _criar_http_client():
+    """Cria um HttpClient do SDK que reaproveita sessões HTTP (keep-alive).
+
+    O HttpClient padrão do SDK abre um requests.Session novo a cada chamada,
+    pagando handshake TLS toda vez. Aqui as sessões ficam abertas e são
+    reutilizadas, uma por configuração de retry.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util import Retry
+    from mercadopago.http import HttpClient
+
+    try:
+        from mercadopago.config.defaults import DEFAULT_RETRY_ON
+    except ImportError:
+        DEFAULT_RETRY_ON = [429, 500, 502, 503, 504]
+
+    class HttpClientPersistente(HttpClient):
+        def __init__(self):
+            self._sessoes = {}
+            self._lock = threading.Lock()
+
+        def _sessao(self, maxretries, retry_on, backoff_factor):
+            retry_on = tuple(retry_on if retry_on is not None else DEFAULT_RETRY_ON)
+            chave = (maxretries, retry_on, backoff_factor)
+            with self._lock:
+                sessao = self._sessoes.get(chave)
+                if sessao is None:
+                    retry = Retry(total=maxretries,
+                                  status_forcelist=retry_on,
+                                  backoff_factor=backoff_factor if backoff_factor is not None else 0)
+                    sessao = requests.Session()
+                    sessao.mount('https://', HTTPAdapter(max_retries=retry,
+                                                         pool_connections=POOL_CONEXOES,
+                                                         pool_maxsize=POOL_CONEXOES))
+                    self._sessoes[chave] = sessao
+                return sessao
+
+        def request(self, method, url, maxretries=None, retry_on=None, backoff_factor=None, **kwargs):
+            from mercadopago.errors.exceptions import MPServerError
+
+            sessao = self._sessao(maxretries, retry_on, backoff_factor)
+            api_result = sessao.request(method, url, **kwargs)
+            response = {'status': api_result.status_code, 'response': None}
+
+            if api_result.status_code != 204 and api_result.content:
+                try:
+                    response['response'] = api_result.json()
+                except ValueError as exc:
+                    raise MPServerError(api_result.status_code,
+                                        {'message': 'Invalid JSON in response body',
+                                         'error': 'invalid_response'}) from exc
+            return response
+
+        def fechar(self):
+            with self._lock:
+                for sessao in self._sessoes.values():
+                    sessao.close()
+                self._sessoes.clear()
+
+    return HttpClientPersistente()
+
+
+class MercadoPagoService:
+    def __init__(self):
+        self._sdk = None
+        self._http_client = None
+        self._access_token = None
+        self._lock = threading.Lock()
+
+    def _obter_sdk(self, access_token):
+        """Retorna o SDK em cache, recriando apenas se o token mudou"""
+        with self._lock:
+            if self._sdk is None or access_token != self._access_token:
+                import mercadopago
+
+                if self._http_client is not None:
+                    self._http_client.fechar()
+
+                self._http_client = _criar_http_client()
+                self._sdk = mercadopago.SDK(access_token, http_client=self._http_client)
+                self._access_token = access_token
+                print("[MercadoPago] Cliente SDK criado")
+            return self._sdk
+
+    def criar_preferencia(self, access_token, preference_data):
+        sdk = self._obter_sdk(access_token)
+
+        with metricas.cronometrar('mercadopago_latencia_segundos',
+                                  'Latência das chamadas à API do Mercado Pago',
+                                  operacao='preference_create'):
+            resposta = sdk.preference().create(preference_data)
+
+        if resposta.get('status') not in (200, 201):
+            print(f"[MercadoPago] Erro ao criar preferência: {resposta}")
+            raise ValueError(f"Mercado Pago retornou status {resposta.get('status')}")
+
+        return resposta['response']
+
+    def get_status(self):
+        return {
+            'configurado': self._sdk is not None,
+            'latencias': [h for h in metricas.resumo() if h['nome'] == 'mercadopago_latencia_segundos']
+        }
+
+
+pagamento_service = MercadoPagoService()
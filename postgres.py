@@ -0,0 +1,487 @@
+"""Backend PostgreSQL opcional (ativado quando DATABASE_URL aponta para postgres://).
+
+As rotas continuam escrevendo SQL no dialeto do SQLite com placeholders "?".
+Este módulo entrega uma conexão com a mesma interface de sqlite3 (execute,
+executemany, fetchone/fetchall, commit, close, linhas acessíveis por índice e
+por nome), traduzindo o SQL na primeira vez que cada comando é visto:
+
+    ?                    -> %s
+    "texto"              -> 'texto'   (o SQLite aceita aspas duplas como literal)
+    LIKE                 -> ILIKE     (LIKE do SQLite ignora maiúsculas/minúsculas)
+    INSERT OR IGNORE     -> INSERT ... ON CONFLICT DO NOTHING
+
+strftime() e datetime() do SQLite são criadas como funções no schema do
+PostgreSQL (ver FUNCOES_COMPATIBILIDADE), então as consultas de relatório
+não precisam de versões separadas.
+
+O schema não é mantido à mão: é derivado de init_db/migrate_db, executados
+em um SQLite em memória, e aplicado com CREATE TABLE / ADD COLUMN IF NOT
+EXISTS. Requer psycopg e psycopg_pool (pip install -r requirements-postgres.txt).
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+import metricas
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+
+# Chave do advisory lock usado para que só um worker migre o schema por vez
+LOCK_SCHEMA = 7265019
+
+TIPOS = {
+    'INTEGER': 'BIGINT',
+    'REAL': 'DOUBLE PRECISION',
+    'TEXT': 'TEXT',
+}
+
+FUNCOES_COMPATIBILIDADE = r"""
+CREATE OR REPLACE FUNCTION _sqlite_instante(valor TEXT) RETURNS TIMESTAMP AS $$
+    SELECT CASE WHEN valor IS NULL OR valor = '' THEN NULL
+                WHEN lower(valor) = 'now' THEN localtimestamp(0)
+                ELSE valor::timestamp END
+$$ LANGUAGE SQL STABLE;
+
+CREATE OR REPLACE FUNCTION strftime(formato TEXT, valor TEXT) RETURNS TEXT AS $$
+    SELECT to_char(_sqlite_instante(valor),
+                   replace(replace(replace(replace(replace(replace(replace(formato,
+                       '%Y', 'YYYY'), '%m', 'MM'), '%d', 'DD'), '%H', 'HH24'), '%M', 'MI'), '%S', 'SS'), '%W', 'IW'))
+$$ LANGUAGE SQL STABLE;
+
+CREATE OR REPLACE FUNCTION datetime(valor TEXT) RETURNS TEXT AS $$
+    SELECT to_char(_sqlite_instante(valor), 'YYYY-MM-DD HH24:MI:SS')
+$$ LANGUAGE SQL STABLE;
+
+CREATE OR REPLACE FUNCTION datetime(valor TEXT, modificador TEXT) RETURNS TEXT AS $$
+    SELECT to_char(_sqlite_instante(valor) + modificador::interval, 'YYYY-MM-DD HH24:MI:SS')
+$$ LANGUAGE SQL STABLE;
+"""
+
+
+def _psycopg():
+    # Import tardio: só necessário quando o PostgreSQL estiver configurado
+    import psycopg
+    return psycopg
+
+
+def configurado(url=None):
+    url = url if url is not None else os.environ.get('DATABASE_URL', '')
+    return url.startswith(('postgres://', 'postgresql://'))
+
+
+# ---------- Tradução de SQL ----------
+
+_RE_LIKE = re.compile(r'(?<![\w])LIKE(?![\w])', re.IGNORECASE)
+_RE_INSERT_IGNORE = re.compile(r'^\s*INSERT\s+OR\s+IGNORE\s+INTO', re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def traduzir_sql(sql, com_parametros=True):
+    """Converte um comando do dialeto SQLite usado no projeto para PostgreSQL"""
+    partes = []
+    i = 0
+    tamanho = len(sql)
+    while i < tamanho:
+        caractere = sql[i]
+        if caractere in ("'", '"'):
+            fim = i + 1
+            while fim < tamanho:
+                if sql[fim] == caractere:
+                    if fim + 1 < tamanho and sql[fim + 1] == caractere:
+                        fim += 2
+                        continue
+                    break
+                fim += 1
+            conteudo = sql[i + 1:fim]
+            if caractere == '"':
+                conteudo = conteudo.replace('""', '"').replace("'", "''")
+            if com_parametros:
+                conteudo = conteudo.replace('%', '%%')
+            partes.append("'" + conteudo + "'")
+            i = fim + 1
+            continue
+
+        fim = i
+        while fim < tamanho and sql[fim] not in ("'", '"'):
+            fim += 1
+        trecho = sql[i:fim]
+        if com_parametros:
+            trecho = trecho.replace('%', '%%').replace('?', '%s')
+        partes.append(_RE_LIKE.sub('ILIKE', trecho))
+        i = fim
+
+    traduzido = ''.join(partes)
+    if _RE_INSERT_IGNORE.match(traduzido):
+        traduzido = _RE_INSERT_IGNORE.sub('INSERT INTO', traduzido, count=1).rstrip().rstrip(';')
+        traduzido += ' ON CONFLICT DO NOTHING'
+    return traduzido
+
+
+# ---------- Linhas e cursores ----------
+
+class Linha:
+    """Linha de resultado com acesso por índice e por nome, como sqlite3.Row"""
+
+    __slots__ = ('_valores', '_indices')
+
+    def __init__(self, valores, indices):
+        self._valores = valores
+        self._indices = indices
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            return self._valores[self._indices[chave]]
+        return self._valores[chave]
+
+    def __iter__(self):
+        return iter(self._valores)
+
+    def __len__(self):
+        return len(self._valores)
+
+    def keys(self):
+        return list(self._indices)
+
+    def __repr__(self):
+        return f'Linha({dict(zip(self._indices, self._valores))})'
+
+
+def _fabrica_linhas(cursor):
+    descricao = cursor.description
+    if not descricao:
+        return lambda valores: valores
+    indices = {coluna.name: i for i, coluna in enumerate(descricao)}
+    return lambda valores: Linha(valores, indices)
+
+
+class CursorPostgres:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._sql = None
+        self._duracao = 0.0
+
+    def _medir(self, inicio, nova_consulta):
+        duracao = time.perf_counter() - inicio
+        metricas.registrar_sql(duracao, nova_consulta)
+        self._duracao = duracao if nova_consulta else self._duracao + duracao
+        if self._duracao * 1000 >= metricas.SQL_LENTO_MS and self._sql is not None:
+            metricas.registrar_sql_lento(self._sql, 0, self._duracao)
+            self._sql = None
+
+    def execute(self, sql, parametros=()):
+        parametros = tuple(parametros) if parametros else None
+        inicio = time.perf_counter()
+        try:
+            self._cursor.execute(traduzir_sql(sql, parametros is not None), parametros)
+        finally:
+            self._sql = sql
+            self._medir(inicio, True)
+        return self
+
+    def executemany(self, sql, sequencia):
+        inicio = time.perf_counter()
+        try:
+            self._cursor.executemany(traduzir_sql(sql, True), [tuple(p) for p in sequencia])
+        finally:
+            self._sql = sql
+            self._medir(inicio, True)
+        return self
+
+    def _buscar(self, metodo, *args):
+        if self._cursor.description is None:
+            return [] if metodo != 'fetchone' else None
+        inicio = time.perf_counter()
+        try:
+            return getattr(self._cursor, metodo)(*args)
+        finally:
+            self._medir(inicio, False)
+
+    def fetchone(self):
+        return self._buscar('fetchone')
+
+    def fetchall(self):
+        return self._buscar('fetchall')
+
+    def fetchmany(self, tamanho=1):
+        return self._buscar('fetchmany', tamanho)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexaoPostgres:
+    """Conexão emprestada do pool, com a interface usada pelo projeto em sqlite3"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = pool.getconn()
+        self.row_factory = None  # Ignorado: as linhas já aceitam índice e nome
+
+    def cursor(self):
+        return CursorPostgres(self._conn.cursor(row_factory=_fabrica_linhas))
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._conn is None:
+            return
+        # Como no sqlite3, fechar sem commit descarta a transação em aberto
+        self._conn.rollback()
+        self._pool.putconn(self._conn)
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        if tipo is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+# ---------- Pool ----------
+
+_pool = None
+_pool_pid = None
+_lock_pool = threading.Lock()
+
+
+def _configurar_conexao(conn):
+    # SUM/AVG de inteiros retornam NUMERIC; o código espera float como no SQLite
+    from psycopg.types.numeric import FloatLoader
+    conn.adapters.register_loader('numeric', FloatLoader)
+
+
+def obter_pool(url=None):
+    """Pool de conexões do processo atual (recriado após fork do Gunicorn)"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock_pool:
+            if _pool is None or _pool_pid != os.getpid():
+                from psycopg_pool import ConnectionPool
+                _pool = ConnectionPool(url or os.environ['DATABASE_URL'], min_size=DB_POOL_MIN,
+                                       max_size=DB_POOL_MAX, configure=_configurar_conexao,
+                                       name='solarpro', open=True)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def get_connection(url=None):
+    return ConexaoPostgres(obter_pool(url))
+
+
+# ---------- Schema ----------
+
+def _schema_sqlite():
+    """Executa init_db/migrate_db em um SQLite em memória e retorna a conexão resultante"""
+    import database
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    database.init_db(conn)
+    database.migrate_db(conn)
+    return conn
+
+
+def _tabelas(conn_sqlite):
+    return [row['name'] for row in conn_sqlite.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid")]
+
+
+def _colunas(conn_sqlite, tabela):
+    return conn_sqlite.execute(f'PRAGMA table_info({tabela})').fetchall()
+
+
+def _tipo(coluna):
+    return TIPOS.get((coluna['type'] or 'TEXT').upper(), 'TEXT')
+
+
+def _chave_identidade(colunas):
+    """Coluna INTEGER PRIMARY KEY única (o rowid do SQLite), que vira IDENTITY no PostgreSQL"""
+    chave = [c for c in colunas if c['pk']]
+    if len(chave) == 1 and _tipo(chave[0]) == 'BIGINT':
+        return chave[0]['name']
+    return None
+
+
+def _definicao_coluna(coluna, identidade=None):
+    if coluna['name'] == identidade:
+        return f"{coluna['name']} BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY"
+    definicao = f"{coluna['name']} {_tipo(coluna)}"
+    if coluna['notnull']:
+        definicao += ' NOT NULL'
+    if coluna['dflt_value'] is not None:
+        definicao += f" DEFAULT {traduzir_sql(coluna['dflt_value'], False)}"
+    return definicao
+
+
+def _restricoes_unicas(conn_sqlite, tabela):
+    restricoes = []
+    for indice in conn_sqlite.execute(f'PRAGMA index_list({tabela})').fetchall():
+        if indice['origin'] == 'u':
+            colunas = [c['name'] for c in conn_sqlite.execute(f"PRAGMA index_info({indice['name']})")]
+            restricoes.append(colunas)
+    return restricoes
+
+
+def gerar_schema():
+    """Lista de comandos DDL do PostgreSQL equivalentes ao schema atual do SQLite.
+
+    Tudo com IF NOT EXISTS: reaplicar sobre um banco existente só cria o que
+    falta (tabelas, colunas novas do migrate_db e índices). Chaves
+    estrangeiras não são criadas, pois o SQLite não as aplica e bases
+    antigas podem ter registros órfãos.
+    """
+    conn_sqlite = _schema_sqlite()
+    comandos = []
+    for tabela in _tabelas(conn_sqlite):
+        colunas = _colunas(conn_sqlite, tabela)
+        identidade = _chave_identidade(colunas)
+        definicoes = [_definicao_coluna(c, identidade) for c in colunas]
+        chave = [c['name'] for c in sorted(colunas, key=lambda c: c['pk']) if c['pk']]
+        if chave and identidade is None:
+            # Chave de texto ou composta
+            definicoes.append(f"PRIMARY KEY ({', '.join(chave)})")
+        for unicas in _restricoes_unicas(conn_sqlite, tabela):
+            definicoes.append(f"UNIQUE ({', '.join(unicas)})")
+        comandos.append(f"CREATE TABLE IF NOT EXISTS {tabela} (\n    " + ',\n    '.join(definicoes) + '\n)')
+        for coluna in colunas:
+            if not coluna['pk']:
+                comandos.append(f'ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS {_definicao_coluna(coluna)}')
+
+    for row in conn_sqlite.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"):
+        comandos.append(re.sub(r'CREATE\s+(UNIQUE\s+)?INDEX\s+(?!IF NOT EXISTS)', r'CREATE \1INDEX IF NOT EXISTS ',
+                               row['sql'], flags=re.IGNORECASE))
+
+    comandos.append('CREATE TABLE IF NOT EXISTS schema_versao (versao INTEGER NOT NULL)')
+    comandos.append(FUNCOES_COMPATIBILIDADE)
+    conn_sqlite.close()
+    return comandos
+
+
+def _valor_coluna(valor, tipo):
+    # O SQLite aceita qualquer valor em qualquer coluna; o COPY do PostgreSQL não
+    if valor is None:
+        return None
+    if tipo == 'TEXT':
+        return str(valor)
+    if isinstance(valor, str):
+        valor = valor.strip().replace(',', '.')
+        if not valor:
+            return None
+        valor = float(valor)
+    return int(valor) if tipo == 'BIGINT' else float(valor)
+
+
+def copiar_tabelas(conn_sqlite, conn_pg, tabelas=None, substituir=False):
+    """Copia as linhas das tabelas do SQLite com COPY e ajusta as sequências de id.
+
+    Retorna {tabela: linhas copiadas}. Tabelas que já têm dados no destino são
+    puladas, a não ser que substituir=True (TRUNCATE antes da cópia).
+    """
+    conn_sqlite.row_factory = sqlite3.Row
+    destino = conn_pg.cursor()
+    copiadas = {}
+    for tabela in tabelas or _tabelas(conn_sqlite):
+        colunas_pg = {row[0] for row in destino.execute(
+            'SELECT column_name FROM information_schema.columns WHERE table_name = %s', (tabela,))}
+        if not colunas_pg:
+            print(f"[Postgres] Tabela {tabela} não existe no destino, pulando")
+            continue
+        colunas = [c for c in _colunas(conn_sqlite, tabela) if c['name'] in colunas_pg]
+        nomes = [c['name'] for c in colunas]
+        tipos = [_tipo(c) for c in colunas]
+
+        if substituir:
+            destino.execute(f'TRUNCATE {tabela}')
+        elif destino.execute(f'SELECT EXISTS (SELECT 1 FROM {tabela})').fetchone()[0]:
+            print(f"[Postgres] Tabela {tabela} já tem dados, pulando")
+            continue
+
+        total = 0
+        with destino.copy(f"COPY {tabela} ({', '.join(nomes)}) FROM STDIN") as copia:
+            for linha in conn_sqlite.execute(f"SELECT {', '.join(nomes)} FROM {tabela}"):
+                copia.write_row([_valor_coluna(v, t) for v, t in zip(linha, tipos)])
+                total += 1
+
+        if _chave_identidade(colunas) == 'id':
+            destino.execute(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), "
+                            f"COALESCE((SELECT MAX(id) FROM {tabela}), 0) + 1, false)")
+        copiadas[tabela] = total
+        print(f"[Postgres] {tabela}: {total} linha(s)")
+    return copiadas
+
+
+def _versao_schema(conn):
+    if conn.execute("SELECT to_regclass('schema_versao')").fetchone()[0] is None:
+        return 0
+    return conn.execute('SELECT MAX(versao) FROM schema_versao').fetchone()[0] or 0
+
+
+def aplicar_schema(conn, schema_version):
+    """Cria/atualiza tabelas, colunas, índices e funções e grava a versão (sem commit)"""
+    for comando in gerar_schema():
+        conn.execute(comando)
+    conn.execute('DELETE FROM schema_versao')
+    conn.execute('INSERT INTO schema_versao (versao) VALUES (%s)', (schema_version,))
+
+
+def preparar_banco(schema_version, url=None):
+    """Equivalente de database.preparar_banco para o PostgreSQL.
+
+    Aplica o schema derivado do SQLite quando a versão gravada estiver
+    desatualizada; em um banco vazio também copia os dados iniciais do
+    init_db (admin padrão, configurações e produtos de exemplo).
+    """
+    psycopg = _psycopg()
+    with psycopg.connect(url or os.environ['DATABASE_URL']) as conn:
+        if _versao_schema(conn) >= schema_version:
+            return False
+
+        # Os demais workers esperam aqui até o primeiro terminar a migração
+        conn.execute('SELECT pg_advisory_xact_lock(%s)', (LOCK_SCHEMA,))
+        if _versao_schema(conn) >= schema_version:
+            conn.rollback()
+            return False
+
+        novo = conn.execute("SELECT to_regclass('usuarios')").fetchone()[0] is None
+        aplicar_schema(conn, schema_version)
+        if novo:
+            conn_sqlite = _schema_sqlite()
+            copiar_tabelas(conn_sqlite, conn)
+            conn_sqlite.close()
+        conn.commit()
+        print(f"[Postgres] Schema atualizado para a versão {schema_version}")
+        return True
@@ -0,0 +1,149 @@
+from flask import g, has_request_context
+
+from catalogo import preco_efetivo
+from database import get_db_connection
+from frete import cotar_frete
+from repositorio import get_config
+
+QUANTIDADE_MAXIMA_ITEM = 999
+
+SQL_CUPOM_VALIDO = '''SELECT * FROM cupons WHERE codigo = ? AND ativo = 1
+                      AND (data_inicio IS NULL OR date(data_inicio) <= date('now'))
+                      AND (data_fim IS NULL OR date(data_fim) >= date('now'))
+                      AND (quantidade_total IS NULL OR quantidade_usada < quantidade_total)'''
+
+
+class ServicoPrecos:
+    """Preço efetivo, itens, cupom e frete de carrinhos e pedidos calculados em um só lugar.
+
+    Carrinho e validação de cupom usam o mapa de preços em memória
+    (catalogo.mapa_precos). O checkout lê preço e estoque do banco com uma
+    única consulta IN, guardada na requisição (g) para quem precisar de novo,
+    então o número de consultas não depende do tamanho do carrinho.
+    """
+
+    def produtos(self, ids, conn=None):
+        """{id: produto} dos produtos ativos entre ids (preço efetivo e estoque)"""
+        memo = g.setdefault('precos_produtos', {}) if has_request_context() else {}
+        faltando = [produto_id for produto_id in ids if produto_id not in memo]
+        if faltando:
+            conexao = conn or get_db_connection()
+            placeholders = ', '.join('?' for _ in faltando)
+            linhas = conexao.execute(f'''SELECT id, nome, preco, preco_promocional, preco_campanha, estoque, imagem
+                                         FROM produtos WHERE ativo = 1 AND id IN ({placeholders})''',
+                                     faltando).fetchall()
+            if conn is None:
+                conexao.close()
+            for produto_id in faltando:
+                memo[produto_id] = None
+            for p in linhas:
+                memo[p['id']] = {
+                    'nome': p['nome'],
+                    'preco': preco_efetivo(p),
+                    'imagem': p['imagem'],
+                    'estoque': p['estoque'] or 0
+                }
+        return {produto_id: memo[produto_id] for produto_id in ids if memo[produto_id] is not None}
+
+    def itens(self, quantidades, produtos, limitar=True):
+        """Itens válidos e subtotal em uma passada.
+
+        Retorna ([(produto_id, produto, quantidade)], subtotal, ids ausentes).
+        Quantidades <= 0 são ignoradas; com limitar, as demais são limitadas a
+        QUANTIDADE_MAXIMA_ITEM (carrinho). O checkout não limita: a quantidade
+        pedida vai inteira para a verificação de estoque.
+        """
+        itens = []
+        subtotal = 0
+        ausentes = []
+        for produto_id, quantidade in quantidades.items():
+            if quantidade <= 0:
+                continue
+            produto = produtos.get(produto_id)
+            if produto is None:
+                ausentes.append(produto_id)
+                continue
+            if limitar:
+                quantidade = min(quantidade, QUANTIDADE_MAXIMA_ITEM)
+            itens.append((produto_id, produto, quantidade))
+            subtotal += produto['preco'] * quantidade
+        return itens, subtotal, ausentes
+
+    def aplicar_cupom(self, codigo, subtotal, conn=None):
+        """(cupom, desconto, erro) para o código sobre o subtotal; cupom None se não se aplica"""
+        if not codigo:
+            return None, 0, None
+        conexao = conn or get_db_connection()
+        cupom = conexao.execute(SQL_CUPOM_VALIDO, (codigo,)).fetchone()
+        if conn is None:
+            conexao.close()
+
+        if not cupom:
+            return None, 0, 'Cupom inválido ou expirado'
+        if subtotal < cupom['valor_minimo']:
+            return None, 0, f'Valor mínimo: R$ {cupom["valor_minimo"]:.2f}'
+        if cupom['tipo'] == 'percentual':
+            desconto = subtotal * (cupom['valor'] / 100)
+        else:
+            desconto = cupom['valor']
+        # Desconto fixo maior que o subtotal não deixa o pedido negativo
+        return cupom, min(desconto, subtotal), None
+
+    def orcamento(self, quantidades, cupom_codigo='', cep=None, conn=None):
+        """Itens, subtotal, desconto, frete e total de um pedido com os preços e o estoque do banco.
+
+        Em 'erro' vem o primeiro problema que impede o pedido (produto
+        inexistente, estoque insuficiente, CEP inválido); um cupom que não se
+        aplica não impede, só fica em 'erro_cupom'.
+        """
+        produtos = self.produtos(list(quantidades), conn)
+        itens, subtotal, ausentes = self.itens(quantidades, produtos, limitar=False)
+        resultado = {
+            'itens': [{
+                'id': produto_id,
+                'nome': produto['nome'],
+                'quantidade': quantidade,
+                'preco_unitario': produto['preco'],
+                'subtotal': produto['preco'] * quantidade
+            } for produto_id, produto, quantidade in itens],
+            'subtotal': subtotal,
+            'desconto': 0,
+            'cupom': None,
+            'erro_cupom': None,
+            'frete': 0,
+            'prazo_dias': None,
+            'total': subtotal,
+            'erro': None
+        }
+
+        if ausentes:
+            resultado['erro'] = 'Produto não encontrado'
+            return resultado
+        for produto_id, produto, quantidade in itens:
+            if produto['estoque'] < quantidade:
+                resultado['erro'] = f'Estoque insuficiente para {produto["nome"]}'
+                return resultado
+
+        cupom, desconto, erro_cupom = self.aplicar_cupom(cupom_codigo, subtotal, conn)
+        resultado.update(cupom=cupom, desconto=desconto, erro_cupom=erro_cupom)
+
+        if cep is not None:
+            cotacao = cotar_frete(cep, {produto_id: quantidade for produto_id, _, quantidade in itens},
+                                  get_config('frete_gratis_acima', '0', conn=conn))
+            if not cotacao:
+                resultado['erro'] = 'CEP inválido'
+                return resultado
+            resultado['frete'] = cotacao['valor']
+            resultado['prazo_dias'] = cotacao['prazo_dias']
+
+        resultado['total'] = subtotal - desconto + resultado['frete']
+        return resultado
+
+
+def descricao_cupom(cupom):
+    if cupom['tipo'] == 'percentual':
+        return f'{cupom["valor"]}% de desconto'
+    return f'R$ {cupom["valor"]:.2f} de desconto'
+
+
+precos = ServicoPrecos()
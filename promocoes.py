@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from catalogo import invalidar_catalogo
+from database import get_db_connection
+
+# Intervalo (segundos) da tarefa que aplica as promoções; é a precisão do início e fim das janelas
+PROMOCOES_INTERVALO = int(os.environ.get('PROMOCOES_INTERVALO', 30))
+
+TIPOS_PROMOCAO = {
+    'percentual': 'Percentual (%)',
+    'fixo': 'Desconto fixo (R$)',
+    'preco': 'Preço final (R$)',
+}
+
+
+def _formatar(momento):
+    return momento.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def preco_promocao(promocao, preco):
+    """Preço com a promoção aplicada, ou None se ela não reduz o preço de tabela"""
+    if promocao['tipo'] == 'percentual':
+        novo = preco * (1 - promocao['valor'] / 100)
+    elif promocao['tipo'] == 'fixo':
+        novo = preco - promocao['valor']
+    else:
+        novo = promocao['valor']
+    novo = round(novo, 2)
+    if novo <= 0 or novo >= preco:
+        return None
+    return novo
+
+
+class AgendaPromocoes:
+    """Aplica as promoções com janela de vigência gravando o preço em produtos.preco_campanha.
+
+    As regras (produto, categoria ou a loja inteira, com início e fim) são
+    avaliadas só aqui, pelo agendador, nunca por requisição: o preço de
+    campanha fica na linha do produto e catalogo.preco_efetivo só escolhe o
+    menor entre tabela, promocional manual e campanha. O promocional manual
+    não é tocado, então nada precisa ser restaurado quando a campanha acaba.
+
+    Cada execução compara uma assinatura (versão do catálogo e alterações em
+    promocoes) e a próxima fronteira de janela já conhecida; sem mudança e
+    antes da fronteira, não faz nada além de duas leituras. Quando algum
+    preço muda, grava só os produtos afetados (executemany) e invalida o
+    catálogo uma vez, na mesma transação.
+    """
+
+    def __init__(self):
+        self._assinatura = None
+        self._proxima_fronteira = None
+        self._lock = threading.Lock()
+        self.ultima_duracao = None
+        self.ultima_alteracao = None
+        self.alterados = 0
+
+    def _assinatura_atual(self, conn):
+        versao = conn.execute("SELECT valor FROM configuracoes WHERE chave = 'catalogo_versao'").fetchone()
+        promocoes = conn.execute('''SELECT COUNT(*) AS total, MAX(data_atualizacao) AS alterada
+                                    FROM promocoes''').fetchone()
+        return (versao['valor'] if versao else None, promocoes['total'], promocoes['alterada'])
+
+    def _precos(self, conn, momento):
+        """{produto_id: (preco_campanha, promocao_id)} desejados e a próxima fronteira de janela"""
+        vigentes = conn.execute('''SELECT id, produto_id, categoria, tipo, valor FROM promocoes
+                                   WHERE ativo = 1 AND inicio <= ? AND (fim IS NULL OR fim > ?)''',
+                                (momento, momento)).fetchall()
+        proxima = conn.execute('''SELECT MIN(momento) AS proxima FROM (
+                                      SELECT inicio AS momento FROM promocoes WHERE ativo = 1 AND inicio > ?
+                                      UNION ALL
+                                      SELECT fim AS momento FROM promocoes WHERE ativo = 1 AND fim > ?
+                                  ) AS fronteiras''', (momento, momento)).fetchone()['proxima']
+
+        por_produto = {}
+        por_categoria = {}
+        gerais = []
+        for promocao in vigentes:
+            if promocao['produto_id']:
+                por_produto.setdefault(promocao['produto_id'], []).append(promocao)
+            elif promocao['categoria']:
+                por_categoria.setdefault(promocao['categoria'], []).append(promocao)
+            else:
+                gerais.append(promocao)
+
+        desejados = {}
+        if vigentes:
+            for p in conn.execute('SELECT id, preco, categoria FROM produtos'):
+                melhor = None
+                for promocao in por_produto.get(p['id'], []) + por_categoria.get(p['categoria'], []) + gerais:
+                    preco = preco_promocao(promocao, p['preco'])
+                    # Vale a de menor preço; no empate, a mais antiga
+                    if preco is not None and (melhor is None or (preco, promocao['id']) < melhor):
+                        melhor = (preco, promocao['id'])
+                if melhor:
+                    desejados[p['id']] = melhor
+        return desejados, proxima
+
+    def aplicar(self, forcar=False):
+        """Atualiza os preços de campanha se uma janela abriu/fechou ou algo mudou; retorna quantos mudaram"""
+        with self._lock:
+            agora = datetime.now()
+            conn = get_db_connection()
+            try:
+                assinatura = self._assinatura_atual(conn)
+                if (not forcar and assinatura == self._assinatura
+                        and (self._proxima_fronteira is None or agora < self._proxima_fronteira)):
+                    return 0
+
+                inicio = time.perf_counter()
+                desejados, proxima = self._precos(conn, _formatar(agora))
+                atuais = conn.execute('''SELECT id, preco_campanha, promocao_id FROM produtos
+                                         WHERE promocao_id IS NOT NULL''').fetchall()
+                alteracoes = [(None, None, p['id']) for p in atuais if p['id'] not in desejados]
+                atuais = {p['id']: (p['preco_campanha'], p['promocao_id']) for p in atuais}
+                alteracoes += [(preco, promocao_id, produto_id)
+                               for produto_id, (preco, promocao_id) in desejados.items()
+                               if atuais.get(produto_id) != (preco, promocao_id)]
+
+                if alteracoes:
+                    conn.executemany('UPDATE produtos SET preco_campanha = ?, promocao_id = ? WHERE id = ?',
+                                     alteracoes)
+                    invalidar_catalogo(conn)
+                    conn.commit()
+            finally:
+                conn.close()
+
+            # A própria invalidação muda a versão: a próxima execução confere de novo e não encontra diferença
+            self._assinatura = assinatura
+            self._proxima_fronteira = datetime.strptime(proxima, '%Y-%m-%d %H:%M:%S') if proxima else None
+            self.ultima_duracao = time.perf_counter() - inicio
+            if alteracoes:
+                self.alterados += len(alteracoes)
+                self.ultima_alteracao = time.time()
+                print(f"[Promoções] {len(desejados)} produto(s) em campanha, {len(alteracoes)} preço(s) "
+                      f"alterado(s) em {self.ultima_duracao:.2f}s")
+            return len(alteracoes)
+
+    def get_status(self):
+        return {
+            'proxima_fronteira': _formatar(self._proxima_fronteira) if self._proxima_fronteira else None,
+            'alterados': self.alterados,
+            'ultima_duracao': self.ultima_duracao,
+            'ultima_alteracao': self.ultima_alteracao
+        }
+
+
+agenda_promocoes = AgendaPromocoes()
@@ -0,0 +1,183 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+import time
+
+from database import get_db_connection
+from replica import replica
+
+# Intervalo (segundos) da tarefa que recalcula as recomendações
+RECOMENDACOES_INTERVALO = int(os.environ.get('RECOMENDACOES_INTERVALO', 3600))
+# Recomendações guardadas por produto (a página mostra as primeiras ativas)
+RECOMENDACOES_TOP_K = int(os.environ.get('RECOMENDACOES_TOP_K', 8))
+# Peso de dois produtos na mesma lista de desejos, em relação a comprados no mesmo pedido
+PESO_LISTA_DESEJOS = float(os.environ.get('RECOMENDACOES_PESO_DESEJOS', 0.5))
+# Cestas maiores que isso são ignoradas: geram muitos pares e quase nenhum sinal
+CESTA_MAXIMA = 50
+# Puxa para baixo a similaridade de pares vistos poucas vezes
+ENCOLHIMENTO = 2.0
+LOTE_PEDIDOS = 1000
+
+
+def _ids_cesta(produtos_json):
+    """Ids distintos dos itens de um pedido (formatos 'id' e 'produto_id')"""
+    try:
+        itens = json.loads(produtos_json) if produtos_json else []
+    except (TypeError, ValueError):
+        return []
+    ids = set()
+    for item in itens:
+        try:
+            ids.add(int(item.get('id') or item.get('produto_id')))
+        except (AttributeError, TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+
+class Coocorrencias:
+    """Matriz esparsa item x item (dicionário de dicionários) e a frequência de cada item"""
+
+    def __init__(self):
+        self.pares = {}
+        self.itens = {}
+
+    def adicionar(self, ids, peso=1.0):
+        if len(ids) > CESTA_MAXIMA:
+            return
+        for i in ids:
+            self.itens[i] = self.itens.get(i, 0) + peso
+        for posicao, i in enumerate(ids):
+            linha_i = self.pares.setdefault(i, {})
+            for j in ids[posicao + 1:]:
+                linha_i[j] = linha_i.get(j, 0) + peso
+                linha_j = self.pares.setdefault(j, {})
+                linha_j[i] = linha_j.get(i, 0) + peso
+
+
+class Recomendador:
+    """"Produtos relacionados" a partir de compras e listas de desejos em comum.
+
+    A similaridade entre dois produtos é o cosseno entre as cestas em que
+    aparecem (pedidos e listas de desejos), atenuada para pares raros. Os
+    RECOMENDACOES_TOP_K mais similares de cada produto ficam na tabela
+    produtos_relacionados, e a página do produto só faz uma busca pela chave.
+
+    Os pedidos são contados de forma incremental: cada execução lê apenas os
+    pedidos novos desde a anterior (no mesmo processo). As listas de desejos,
+    que podem perder itens, são relidas inteiras. A tabela só é regravada
+    quando o resultado muda.
+    """
+
+    def __init__(self, top_k=RECOMENDACOES_TOP_K):
+        self.top_k = top_k
+        self._pedidos = Coocorrencias()
+        self._ultimo_pedido = 0
+        self._assinatura = None
+        self._lock = threading.Lock()
+        self.ultima_duracao = None
+        self.ultima_atualizacao = None
+
+    def _contar_pedidos(self, conn):
+        """Acumula as cestas dos pedidos novos; retorna quantos foram lidos"""
+        cursor = conn.execute('''SELECT id, produtos_json FROM pedidos
+                                 WHERE id > ? AND status_pedido != 'cancelado' ORDER BY id''',
+                              (self._ultimo_pedido,))
+        total = 0
+        while True:
+            lote = cursor.fetchmany(LOTE_PEDIDOS)
+            if not lote:
+                break
+            for pedido in lote:
+                # Pedidos de um só item também contam: entram na frequência do produto
+                self._pedidos.adicionar(_ids_cesta(pedido['produtos_json']))
+                self._ultimo_pedido = pedido['id']
+            total += len(lote)
+        return total
+
+    def _contar_desejos(self, conn):
+        desejos = Coocorrencias()
+        cesta = []
+        usuario_atual = None
+        for row in conn.execute('SELECT usuario_id, produto_id FROM lista_desejos ORDER BY usuario_id, produto_id'):
+            if row['usuario_id'] != usuario_atual:
+                desejos.adicionar(cesta, PESO_LISTA_DESEJOS)
+                cesta = []
+                usuario_atual = row['usuario_id']
+            cesta.append(row['produto_id'])
+        desejos.adicionar(cesta, PESO_LISTA_DESEJOS)
+        return desejos
+
+    def _similares(self, ativos, desejos):
+        """{produto_id: [(relacionado_id, pontuação)]} com os top_k de cada produto ativo"""
+        resultado = {}
+        for i in ativos:
+            linha_pedidos = self._pedidos.pares.get(i, {})
+            linha_desejos = desejos.pares.get(i, {})
+            if not linha_pedidos and not linha_desejos:
+                continue
+            n_i = self._pedidos.itens.get(i, 0) + desejos.itens.get(i, 0)
+            candidatos = []
+            for j in linha_pedidos.keys() | linha_desejos.keys():
+                if j not in ativos:
+                    continue
+                c = linha_pedidos.get(j, 0) + linha_desejos.get(j, 0)
+                n_j = self._pedidos.itens.get(j, 0) + desejos.itens.get(j, 0)
+                candidatos.append((c / math.sqrt(n_i * n_j) * c / (c + ENCOLHIMENTO), j))
+            melhores = heapq.nlargest(self.top_k, candidatos)
+            resultado[i] = [(j, round(pontuacao, 6)) for pontuacao, j in melhores]
+        return resultado
+
+    def atualizar(self):
+        """Conta os pedidos novos e regrava a tabela se as recomendações mudaram"""
+        with self._lock:
+            inicio = time.perf_counter()
+            # Varreduras longas vão para a cópia de leitura, quando houver
+            leitura = replica.conexao()
+            try:
+                novos = self._contar_pedidos(leitura)
+                desejos = self._contar_desejos(leitura)
+                ativos = {row['id'] for row in leitura.execute('SELECT id FROM produtos WHERE ativo = 1')}
+            finally:
+                leitura.close()
+
+            similares = self._similares(ativos, desejos)
+            assinatura = hashlib.sha1(json.dumps(sorted(similares.items())).encode()).hexdigest()
+            if assinatura == self._assinatura:
+                self.ultima_duracao = time.perf_counter() - inicio
+                return False
+
+            linhas = [(produto_id, relacionado_id, posicao, pontuacao)
+                      for produto_id, lista in similares.items()
+                      for posicao, (relacionado_id, pontuacao) in enumerate(lista)]
+            conn = get_db_connection()
+            try:
+                conn.execute('DELETE FROM produtos_relacionados')
+                conn.executemany('''INSERT INTO produtos_relacionados (produto_id, relacionado_id, posicao, pontuacao)
+                                    VALUES (?, ?, ?, ?)''', linhas)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+            self._assinatura = assinatura
+            self.ultima_duracao = time.perf_counter() - inicio
+            self.ultima_atualizacao = time.time()
+            print(f"[Recomendações] {len(similares)} produto(s) com relacionados, {novos} pedido(s) novo(s), "
+                  f"{len(linhas)} linha(s) gravada(s) em {self.ultima_duracao:.2f}s")
+            return True
+
+    def get_status(self):
+        return {
+            'ultimo_pedido': self._ultimo_pedido,
+            'produtos_com_pares': len(self._pedidos.pares),
+            'ultima_duracao': self.ultima_duracao,
+            'ultima_atualizacao': self.ultima_atualizacao
+        }
+
+
+recomendador = Recomendador()
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import database
+import metricas
+
+# Idade máxima (segundos) da cópia para que ainda seja usada nas leituras
+REPLICA_MAX_ATRASO = float(os.environ.get('REPLICA_MAX_ATRASO', 300))
+# Intervalo (segundos) da tarefa que atualiza a cópia
+REPLICA_INTERVALO = int(os.environ.get('REPLICA_INTERVALO', 60))
+
+
+class ReplicaLeitura:
+    """Cópia somente leitura do banco para relatórios e telas do admin.
+
+    O painel e o assistente fazem varreduras completas em pedidos e usuários;
+    rodando no arquivo principal elas disputam o lock com o checkout. A cópia
+    é feita com a API de backup do SQLite em um arquivo temporário e trocada
+    com os.replace, então leitores nunca veem uma cópia pela metade.
+
+    Se a cópia não existir ou estiver mais velha que REPLICA_MAX_ATRASO (por
+    exemplo, com o agendador desligado), as leituras voltam para o banco
+    principal. No PostgreSQL as leituras sempre vão para o banco principal.
+    """
+
+    def __init__(self, caminho=None, max_atraso=REPLICA_MAX_ATRASO):
+        self._caminho = caminho
+        self.max_atraso = max_atraso
+        self.ultima_duracao = None
+
+    @property
+    def caminho(self):
+        # Derivado de DB_PATH na hora do uso, para acompanhar SOLARPRO_DB
+        if self._caminho:
+            return self._caminho
+        return os.environ.get('SOLARPRO_DB_REPLICA') or os.path.splitext(database.DB_PATH)[0] + '.replica.db'
+
+    def atraso(self):
+        """Segundos desde a última atualização da cópia, ou None se ela não existir"""
+        try:
+            return max(0.0, time.time() - os.path.getmtime(self.caminho))
+        except OSError:
+            return None
+
+    def atualizar(self):
+        if database.usando_postgres():
+            return False
+
+        temporario = f'{self.caminho}.{os.getpid()}.tmp'
+        inicio = time.perf_counter()
+        origem = sqlite3.connect(database.DB_PATH, timeout=30)
+        destino = sqlite3.connect(temporario)
+        try:
+            with metricas.cronometrar('replica_atualizacao_segundos', 'Duração da cópia do banco de leitura'):
+                # Cópia em um único passo: com passos menores o SQLite reinicia
+                # o backup a cada escrita no banco principal. Com o banco em WAL
+                # (database.preparar_banco) o passo único lê um retrato
+                # consistente sem impedir as escritas do checkout
+                origem.backup(destino)
+                # A cópia herda o modo WAL, que não abre em mode=ro sem o arquivo -shm
+                destino.execute('PRAGMA journal_mode = DELETE')
+        except Exception:
+            destino.close()
+            os.remove(temporario)
+            raise
+        finally:
+            origem.close()
+        destino.close()
+        os.replace(temporario, self.caminho)
+        self.ultima_duracao = time.perf_counter() - inicio
+        return True
+
+    def _usar_copia(self, max_atraso=None):
+        if database.usando_postgres():
+            return False
+        atraso = self.atraso()
+        limite = self.max_atraso if max_atraso is None else max_atraso
+        return atraso is not None and atraso <= limite
+
+    def conexao(self, max_atraso=None):
+        """Conexão de leitura: a cópia, se estiver em dia, ou o banco principal"""
+        if not self._usar_copia(max_atraso):
+            return database.get_db_connection()
+        conn = sqlite3.connect(f'file:{self.caminho}?mode=ro', uri=True,
+                               factory=database.ConexaoInstrumentada)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def atualizada_em(self, max_atraso=None):
+        """Momento dos dados que conexao() retornaria (None = banco principal, tempo real)"""
+        if not self._usar_copia(max_atraso):
+            return None
+        return datetime.fromtimestamp(os.path.getmtime(self.caminho))
+
+    def get_status(self):
+        return {
+            'caminho': self.caminho,
+            'atraso_segundos': self.atraso(),
+            'max_atraso_segundos': self.max_atraso,
+            'ultima_duracao': self.ultima_duracao
+        }
+
+
+replica = ReplicaLeitura()
@@ -0,0 +1,265 @@
+"""Consultas compartilhadas entre as rotas.
+
+O SQL aqui é portável entre SQLite e PostgreSQL (ver postgres.py). Todas as
+funções aceitam uma conexão já aberta em `conn` para participar da transação
+de quem chama; sem ela, abrem, fazem commit (nas escritas) e fecham a própria.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+from database import get_db_connection
+
+
+@contextmanager
+def _conexao(conn=None, escrita=False):
+    if conn is not None:
+        yield conn
+        return
+    conexao = get_db_connection()
+    try:
+        yield conexao
+        if escrita:
+            conexao.commit()
+    finally:
+        conexao.close()
+
+
+def _agora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ---------- Configurações ----------
+
+def get_config(chave, default='', conn=None):
+    with _conexao(conn) as c:
+        config = c.execute('SELECT valor FROM configuracoes WHERE chave = ?', (chave,)).fetchone()
+    return config['valor'] if config else default
+
+
+def get_configs(*chaves, conn=None):
+    """Busca várias configurações em uma única consulta"""
+    placeholders = ', '.join('?' for _ in chaves)
+    with _conexao(conn) as c:
+        configs = c.execute(f'SELECT chave, valor FROM configuracoes WHERE chave IN ({placeholders})',
+                            chaves).fetchall()
+    return {cfg['chave']: cfg['valor'] for cfg in configs}
+
+
+def set_config(chave, valor, conn=None):
+    with _conexao(conn, escrita=True) as c:
+        c.execute('''INSERT INTO configuracoes (chave, valor, data_atualizacao) VALUES (?, ?, ?)
+                     ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor,
+                                                       data_atualizacao = excluded.data_atualizacao''',
+                  (chave, valor, _agora()))
+
+
+def configuracoes_loja(conn=None):
+    """Todas as configurações loja_* (usadas nos templates)"""
+    with _conexao(conn) as c:
+        configs = c.execute("SELECT chave, valor FROM configuracoes WHERE chave LIKE 'loja_%'").fetchall()
+    return {cfg['chave']: cfg['valor'] for cfg in configs}
+
+
+# ---------- Usuários ----------
+
+def buscar_usuario(usuario_id, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('SELECT * FROM usuarios WHERE id = ? AND ativo = 1', (usuario_id,)).fetchone()
+
+
+def buscar_usuario_por_email(email, apenas_ativos=True, conn=None):
+    sql = 'SELECT * FROM usuarios WHERE email = ?'
+    if apenas_ativos:
+        sql += ' AND ativo = 1'
+    with _conexao(conn) as c:
+        return c.execute(sql, (email,)).fetchone()
+
+
+def criar_usuario(nome, email, telefone, senha_hash, tipo='cliente', conn=None):
+    """Insere o usuário e retorna o id"""
+    with _conexao(conn, escrita=True) as c:
+        return c.execute('''INSERT INTO usuarios (nome, email, telefone, senha_hash, tipo, data_cadastro)
+                            VALUES (?, ?, ?, ?, ?, ?) RETURNING id''',
+                         (nome, email, telefone, senha_hash, tipo, _agora())).fetchone()[0]
+
+
+def registrar_acesso(usuario_id, conn=None):
+    with _conexao(conn, escrita=True) as c:
+        c.execute('UPDATE usuarios SET ultimo_acesso = ? WHERE id = ?', (_agora(), usuario_id))
+
+
+def atualizar_senha_hash(usuario_id, senha_hash, conn=None):
+    with _conexao(conn, escrita=True) as c:
+        c.execute('UPDATE usuarios SET senha_hash = ? WHERE id = ?', (senha_hash, usuario_id))
+
+
+def atualizar_perfil(usuario_id, dados, conn=None):
+    with _conexao(conn, escrita=True) as c:
+        c.execute('''UPDATE usuarios SET nome = ?, telefone = ?, cpf = ?, endereco = ?, cidade = ?, estado = ?, cep = ?
+                     WHERE id = ?''',
+                  (dados.get('nome'), dados.get('telefone'), dados.get('cpf'), dados.get('endereco'),
+                   dados.get('cidade'), dados.get('estado'), dados.get('cep'), usuario_id))
+
+
+# ---------- Produtos ----------
+
+def produtos_para_listagem(conn=None):
+    """Colunas usadas nos cards da listagem e na API, sem especificações nem galeria"""
+    with _conexao(conn) as c:
+        return c.execute('''SELECT p.id, nome, descricao, preco, preco_promocional, preco_campanha, potencia_watts, eficiencia,
+                                   garantia, estoque, imagem, categoria, vendas,
+                                   r.quantidade AS avaliacoes, r.soma AS avaliacoes_soma
+                            FROM produtos p LEFT JOIN avaliacoes_resumo r ON r.produto_id = p.id
+                            WHERE ativo = 1 ORDER BY p.id''').fetchall()
+
+
+def buscar_produto(produto_id, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('SELECT * FROM produtos WHERE id = ? AND ativo = 1', (produto_id,)).fetchone()
+
+
+def produtos_destaque(limite=6, conn=None):
+    """Produtos em destaque em ordem aleatória, completando com os demais se faltarem"""
+    with _conexao(conn) as c:
+        produtos = c.execute('SELECT * FROM produtos WHERE ativo = 1 AND destaque = 1 ORDER BY RANDOM() LIMIT ?',
+                             (limite,)).fetchall()
+        if len(produtos) < limite:
+            produtos = c.execute('SELECT * FROM produtos WHERE ativo = 1 ORDER BY RANDOM() LIMIT ?',
+                                 (limite,)).fetchall()
+    return produtos
+
+
+def produtos_relacionados(categoria, produto_id, limite=4, conn=None):
+    """Comprados junto (tabela produtos_relacionados), completando com a mesma categoria"""
+    with _conexao(conn) as c:
+        relacionados = c.execute('''SELECT p.* FROM produtos_relacionados r
+                                      JOIN produtos p ON p.id = r.relacionado_id
+                                      WHERE r.produto_id = ? AND p.ativo = 1
+                                      ORDER BY r.posicao LIMIT ?''', (produto_id, limite)).fetchall()
+        if len(relacionados) >= limite:
+            return relacionados
+        excluir = [produto_id] + [p['id'] for p in relacionados]
+        placeholders = ', '.join('?' for _ in excluir)
+        return relacionados + c.execute(f'''SELECT * FROM produtos WHERE categoria = ? AND ativo = 1
+                                            AND id NOT IN ({placeholders}) LIMIT ?''',
+                                         (categoria, *excluir, limite - len(relacionados))).fetchall()
+
+
+def na_lista_desejos(usuario_id, produto_id, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('SELECT id FROM lista_desejos WHERE usuario_id = ? AND produto_id = ?',
+                         (usuario_id, produto_id)).fetchone() is not None
+
+
+def lista_desejos(usuario_id, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('''SELECT p.* FROM lista_desejos ld
+                            JOIN produtos p ON ld.produto_id = p.id
+                            WHERE ld.usuario_id = ? AND p.ativo = 1''', (usuario_id,)).fetchall()
+
+
+# ---------- Avaliações ----------
+
+def resumo_avaliacoes(produto_id, conn=None):
+    """Quantidade, soma e histograma das avaliações aprovadas (None se não houver nenhuma)"""
+    with _conexao(conn) as c:
+        resumo = c.execute('SELECT * FROM avaliacoes_resumo WHERE produto_id = ?', (produto_id,)).fetchone()
+    if not resumo or not resumo['quantidade']:
+        return None
+    return {
+        'quantidade': resumo['quantidade'],
+        'media': resumo['soma'] / resumo['quantidade'],
+        'notas': {nota: resumo[f'nota_{nota}'] for nota in range(5, 0, -1)}
+    }
+
+
+def avaliacoes_aprovadas(produto_id, limite=10, inicio=0, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('''SELECT a.*, u.nome AS usuario_nome FROM avaliacoes a
+                            JOIN usuarios u ON a.usuario_id = u.id
+                            WHERE a.produto_id = ? AND a.aprovado = 1 ORDER BY a.data DESC, a.id DESC
+                            LIMIT ? OFFSET ?''',
+                         (produto_id, limite, inicio)).fetchall()
+
+
+def _somar_ao_resumo(c, produto_id, nota, sinal):
+    """Soma (sinal=1) ou retira (sinal=-1) uma avaliação aprovada do resumo do produto"""
+    c.execute('INSERT OR IGNORE INTO avaliacoes_resumo (produto_id) VALUES (?)', (produto_id,))
+    histograma = f', nota_{nota} = nota_{nota} + ?' if nota in (1, 2, 3, 4, 5) else ''
+    parametros = (sinal, sinal * nota) + ((sinal,) if histograma else ()) + (produto_id,)
+    c.execute(f'''UPDATE avaliacoes_resumo SET quantidade = quantidade + ?, soma = soma + ?{histograma}
+                   WHERE produto_id = ?''', parametros)
+
+
+def moderar_avaliacao(avaliacao_id, aprovado, conn=None):
+    """Aprova ou reprova, ajustando o resumo só se o estado mudou. Retorna o produto_id, ou None."""
+    aprovado = 1 if aprovado else 0
+    with _conexao(conn, escrita=True) as c:
+        avaliacao = c.execute('SELECT produto_id, nota FROM avaliacoes WHERE id = ?', (avaliacao_id,)).fetchone()
+        if not avaliacao:
+            return None
+        cursor = c.execute('UPDATE avaliacoes SET aprovado = ? WHERE id = ? AND COALESCE(aprovado, 0) != ?',
+                           (aprovado, avaliacao_id, aprovado))
+        if cursor.rowcount:
+            _somar_ao_resumo(c, avaliacao['produto_id'], avaliacao['nota'], 1 if aprovado else -1)
+        return avaliacao['produto_id']
+
+
+def remover_avaliacao(avaliacao_id, conn=None):
+    with _conexao(conn, escrita=True) as c:
+        avaliacao = c.execute('SELECT produto_id, nota, aprovado FROM avaliacoes WHERE id = ?',
+                              (avaliacao_id,)).fetchone()
+        if not avaliacao:
+            return None
+        c.execute('DELETE FROM avaliacoes WHERE id = ?', (avaliacao_id,))
+        if avaliacao['aprovado']:
+            _somar_ao_resumo(c, avaliacao['produto_id'], avaliacao['nota'], -1)
+        return avaliacao['produto_id']
+
+
+def recalcular_resumos_avaliacoes(conn=None):
+    """Refaz todos os resumos a partir de avaliacoes (corrige alterações feitas fora da moderação)"""
+    with _conexao(conn, escrita=True) as c:
+        c.execute('DELETE FROM avaliacoes_resumo')
+        cursor = c.execute('''INSERT INTO avaliacoes_resumo
+                                  (produto_id, quantidade, soma, nota_1, nota_2, nota_3, nota_4, nota_5)
+                              SELECT produto_id, COUNT(*), SUM(nota),
+                                     SUM(CASE WHEN nota = 1 THEN 1 ELSE 0 END), SUM(CASE WHEN nota = 2 THEN 1 ELSE 0 END),
+                                     SUM(CASE WHEN nota = 3 THEN 1 ELSE 0 END), SUM(CASE WHEN nota = 4 THEN 1 ELSE 0 END),
+                                     SUM(CASE WHEN nota = 5 THEN 1 ELSE 0 END)
+                              FROM avaliacoes WHERE aprovado = 1 GROUP BY produto_id''')
+        return cursor.rowcount
+
+
+def avaliacoes_para_moderar(aprovado, limite=50, inicio=0, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('''SELECT a.*, u.nome AS usuario_nome, p.nome AS produto_nome FROM avaliacoes a
+                            JOIN usuarios u ON a.usuario_id = u.id
+                            LEFT JOIN produtos p ON a.produto_id = p.id
+                            WHERE COALESCE(a.aprovado, 0) = ? ORDER BY a.data DESC, a.id DESC
+                            LIMIT ? OFFSET ?''', (aprovado, limite, inicio)).fetchall()
+
+
+# ---------- Carrinho e pedidos ----------
+
+def buscar_carrinho_ativo(usuario_id, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('''SELECT id, produtos_json, total, versao FROM carrinhos
+                            WHERE usuario_id = ? AND status IN ('ativo', 'abandonado')''',
+                         (usuario_id,)).fetchone()
+
+
+def pedidos_do_usuario(usuario_id, limite=None, conn=None):
+    sql = 'SELECT * FROM pedidos WHERE usuario_id = ? ORDER BY data DESC'
+    params = [usuario_id]
+    if limite:
+        sql += ' LIMIT ?'
+        params.append(limite)
+    with _conexao(conn) as c:
+        return c.execute(sql, params).fetchall()
+
+
+def buscar_pedido_do_usuario(pedido_id, usuario_id, conn=None):
+    with _conexao(conn) as c:
+        return c.execute('SELECT * FROM pedidos WHERE id = ? AND usuario_id = ?',
+                         (pedido_id, usuario_id)).fetchone()
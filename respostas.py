@@ -0,0 +1,104 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+# Corpos JSON a partir desse tamanho (bytes) são comprimidos com gzip
+GZIP_MINIMO = int(os.environ.get('GZIP_MINIMO', 1024))
+GZIP_NIVEL = 6
+# Quantos corpos comprimidos (por ETag) ficam guardados para reaproveitar
+GZIP_CACHE_TAMANHO = 64
+
+_gzip_cache = OrderedDict()
+_gzip_lock = threading.Lock()
+
+
+def json_compacto(dados):
+    """Serializa sem espaços nem indentação, em UTF-8"""
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def campos_pedidos(validos=None):
+    """Campos de ?fields=id,preco como tupla, ou None se o parâmetro não veio.
+
+    Com `validos`, a tupla segue a ordem de `validos` (a mesma lista de campos
+    gera sempre a mesma ETag) e campos desconhecidos levantam ValueError.
+    """
+    valor = request.args.get('fields', '')
+    campos = tuple(c.strip() for c in valor.split(',') if c.strip())
+    if not campos:
+        return None
+    if validos is not None:
+        desconhecidos = [c for c in campos if c not in validos]
+        if desconhecidos:
+            raise ValueError(f"Campos inválidos: {', '.join(desconhecidos)}. "
+                             f"Disponíveis: {', '.join(validos)}")
+        campos = tuple(c for c in validos if c in campos)
+    return campos
+
+
+def filtrar_campos(itens, campos):
+    """Mantém só os campos pedidos em cada dicionário da lista"""
+    if not campos:
+        return itens
+    return [{c: item[c] for c in campos if c in item} for item in itens]
+
+
+def _comprimir(corpo, etag=None):
+    if etag is None:
+        return gzip.compress(corpo, GZIP_NIVEL)
+    with _gzip_lock:
+        comprimido = _gzip_cache.get(etag)
+        if comprimido is not None:
+            _gzip_cache.move_to_end(etag)
+            return comprimido
+    comprimido = gzip.compress(corpo, GZIP_NIVEL)
+    with _gzip_lock:
+        _gzip_cache[etag] = comprimido
+        while len(_gzip_cache) > GZIP_CACHE_TAMANHO:
+            _gzip_cache.popitem(last=False)
+    return comprimido
+
+
+def nao_modificado(etag):
+    """Resposta 304 se o If-None-Match do cliente já tem essa ETag, senão None"""
+    if etag is None or not request.if_none_match:
+        return None
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(f'{etag}-gz'):
+        resposta = Response(status=304)
+        resposta.set_etag(etag)
+        resposta.headers['Vary'] = 'Accept-Encoding'
+        return resposta
+    return None
+
+
+def resposta_json(corpo, etag=None, privado=False, status=200):
+    """Resposta JSON a partir de bytes já serializados.
+
+    Com `etag`, responde 304 quando o cliente já tem essa versão e marca a
+    resposta para revalidação (Cache-Control: no-cache). Corpos grandes vão
+    com gzip se o cliente aceitar; a versão comprimida recebe a ETag com
+    sufixo -gz, e as duas formas valem no If-None-Match.
+    """
+    if not isinstance(corpo, bytes):
+        corpo = json_compacto(corpo)
+
+    resposta = nao_modificado(etag) if status == 200 else None
+    if resposta is not None:
+        return resposta
+
+    comprimir = len(corpo) >= GZIP_MINIMO and 'gzip' in request.accept_encodings
+    if comprimir:
+        corpo = _comprimir(corpo, etag)
+
+    resposta = Response(corpo, status=status, mimetype='application/json')
+    if comprimir:
+        resposta.headers['Content-Encoding'] = 'gzip'
+    resposta.headers['Vary'] = 'Accept-Encoding'
+    if etag is not None:
+        resposta.set_etag(f'{etag}-gz' if comprimir else etag)
+        resposta.headers['Cache-Control'] = 'private, no-cache' if privado else 'no-cache'
+    return resposta
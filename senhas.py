@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import metricas
+
+# Método/custo dos hashes novos, no formato do werkzeug (escolha com benchmarks/custo_senha.py).
+# Hashes de login com outro método são refeitos com este na próxima entrada do usuário.
+SENHA_METODO = os.environ.get('SENHA_METODO', 'scrypt:32768:8:1')
+# Hashes calculados ao mesmo tempo por processo e quantos podem esperar na fila
+SENHA_WORKERS = int(os.environ.get('SENHA_WORKERS', 2))
+SENHA_FILA = int(os.environ.get('SENHA_FILA', 8))
+# Tempo máximo (segundos) que uma requisição espera pelo resultado
+SENHA_TIMEOUT = float(os.environ.get('SENHA_TIMEOUT', 10))
+
+# Falhas de login permitidas por janela, por IP e por email
+LOGIN_JANELA = int(os.environ.get('LOGIN_JANELA', 900))
+LOGIN_MAX_FALHAS_IP = int(os.environ.get('LOGIN_MAX_FALHAS_IP', 20))
+LOGIN_MAX_FALHAS_EMAIL = int(os.environ.get('LOGIN_MAX_FALHAS_EMAIL', 5))
+# Acima disso as chaves sem falhas recentes são descartadas
+LIMITADOR_MAX_CHAVES = 50000
+
+
+class SenhasOcupado(Exception):
+    """Fila de hashes cheia: a requisição deve ser recusada, não enfileirada"""
+
+
+class ServicoSenhas:
+    """Calcula hashes de senha em um pool limitado de threads.
+
+    scrypt e pbkdf2 são caros de propósito. Rodando direto na requisição, uma
+    rajada de logins ocupa todos os workers e a loja inteira fica lenta. Aqui
+    no máximo SENHA_WORKERS hashes rodam ao mesmo tempo por processo (o
+    hashlib libera o GIL, então as outras threads seguem atendendo), com até
+    SENHA_FILA esperando; além disso o pedido é recusado na hora com
+    SenhasOcupado em vez de acumular.
+    """
+
+    def __init__(self, metodo=SENHA_METODO, workers=SENHA_WORKERS, fila=SENHA_FILA, timeout=SENHA_TIMEOUT):
+        self.metodo = metodo
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='senhas')
+        self._vagas = threading.BoundedSemaphore(workers + fila)
+        self._prefixo = None
+        self._hash_ficticio = None
+
+    def _executar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            print("[Senhas] Fila de hashes cheia, pedido recusado")
+            raise SenhasOcupado()
+
+        def tarefa():
+            with metricas.cronometrar('senha_hash_segundos', 'Tempo de cálculo de hashes de senha'):
+                return funcao(*args)
+
+        try:
+            futuro = self._executor.submit(tarefa)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturesTimeout:
+            raise SenhasOcupado()
+
+    def gerar(self, senha):
+        return self._executar(generate_password_hash, senha, self.metodo)
+
+    def verificar(self, senha_hash, senha):
+        """Confere a senha; sem hash (email inexistente) gasta o mesmo tempo e retorna False"""
+        if not senha_hash:
+            # Mesmo custo de um usuário existente, para o tempo de resposta não revelar quais emails existem
+            self._executar(check_password_hash, self._ficticio(), senha)
+            return False
+        return self._executar(check_password_hash, senha_hash, senha)
+
+    def precisa_atualizar(self, senha_hash):
+        """True se o hash foi gerado com outro método/custo que o configurado"""
+        return senha_hash.split('$', 1)[0] != self._prefixo_atual()
+
+    def _prefixo_atual(self):
+        if self._prefixo is None:
+            # O werkzeug completa os parâmetros omitidos ('scrypt' -> 'scrypt:32768:8:1')
+            self._prefixo = self._ficticio().split('$', 1)[0]
+        return self._prefixo
+
+    def _ficticio(self):
+        if self._hash_ficticio is None:
+            self._hash_ficticio = generate_password_hash(os.urandom(16).hex(), self.metodo)
+        return self._hash_ficticio
+
+
+class LimitadorTentativas:
+    """Conta falhas por chave (IP, email) numa janela deslizante, em memória do processo"""
+
+    def __init__(self, janela=LOGIN_JANELA):
+        self.janela = janela
+        self._falhas = {}
+        self._lock = threading.Lock()
+
+    def _recentes(self, chave, agora):
+        falhas = self._falhas.get(chave)
+        if falhas is None:
+            return None
+        while falhas and falhas[0] <= agora - self.janela:
+            falhas.popleft()
+        if not falhas:
+            del self._falhas[chave]
+            return None
+        return falhas
+
+    def bloqueado(self, chave, limite):
+        """Segundos até liberar a chave, ou 0 se ainda pode tentar"""
+        agora = time.monotonic()
+        with self._lock:
+            falhas = self._recentes(chave, agora)
+            if falhas is None or len(falhas) < limite:
+                return 0
+            return int(falhas[-limite] + self.janela - agora) + 1
+
+    def registrar_falha(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._falhas) >= LIMITADOR_MAX_CHAVES:
+                for antiga in list(self._falhas):
+                    self._recentes(antiga, agora)
+            self._recentes(chave, agora)
+            self._falhas.setdefault(chave, deque()).append(agora)
+
+    def limpar(self, chave):
+        with self._lock:
+            self._falhas.pop(chave, None)
+
+
+senhas = ServicoSenhas()
+tentativas_login = LimitadorTentativas()
@@ -0,0 +1,246 @@
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask.sessions import SessionInterface, SecureCookieSession, NullSession, session_json_serializer
+from itsdangerous import Signer, BadSignature
+
+from database import get_db_connection
+
+# 'banco' (tabela sessoes, compartilhada entre workers), 'memoria' (dicionário do
+# processo: só com um worker ou balanceador com sessão fixa) ou 'cookie' (sessão
+# inteira no cookie assinado, o padrão do Flask)
+SESSAO_ARMAZENAMENTO = os.environ.get('SESSAO_ARMAZENAMENTO', 'banco')
+# A validade no servidor só é regravada quando a última renovação tem mais que isso (segundos)
+SESSAO_RENOVAR = int(os.environ.get('SESSAO_RENOVAR', 3600))
+SESSAO_LIMPEZA = int(os.environ.get('SESSAO_LIMPEZA', 900))
+SESSAO_MAX_MEMORIA = 50000
+LOTE_SESSOES = 1000
+
+# Caminhos que nunca usam a sessão: arquivos estáticos, feeds e sitemaps
+CAMINHOS_SEM_SESSAO = ('/static/', '/feeds/', '/sitemaps/', '/robots.txt', '/sitemap.xml', '/favicon.ico')
+
+
+def _formatar(momento):
+    return momento.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SessaoServidor(SecureCookieSession):
+    """Sessão cujos dados ficam no servidor; o cookie leva só o id assinado"""
+
+    def __init__(self, initial=None, sid=None, expira=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expira = expira
+        self.usuario_original = self.get('_user_id')
+
+
+class ArmazenamentoBanco:
+    """Sessões na tabela sessoes do banco da loja (SQLite ou PostgreSQL)"""
+
+    def carregar(self, sid, agora):
+        conn = get_db_connection()
+        row = conn.execute('SELECT dados, expira FROM sessoes WHERE id = ? AND expira > ?',
+                           (sid, _formatar(agora))).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return row['dados'], datetime.strptime(row['expira'], '%Y-%m-%d %H:%M:%S')
+
+    def gravar(self, sid, dados, expira):
+        conn = get_db_connection()
+        conn.execute('''INSERT INTO sessoes (id, dados, expira) VALUES (?, ?, ?)
+                        ON CONFLICT (id) DO UPDATE SET dados = excluded.dados, expira = excluded.expira''',
+                     (sid, dados, _formatar(expira)))
+        conn.commit()
+        conn.close()
+
+    def renovar(self, sid, expira):
+        conn = get_db_connection()
+        conn.execute('UPDATE sessoes SET expira = ? WHERE id = ?', (_formatar(expira), sid))
+        conn.commit()
+        conn.close()
+
+    def remover(self, sid):
+        conn = get_db_connection()
+        conn.execute('DELETE FROM sessoes WHERE id = ?', (sid,))
+        conn.commit()
+        conn.close()
+
+    def limpar_expiradas(self, agora):
+        """Apaga em lotes para não segurar o lock de escrita do SQLite por muito tempo"""
+        conn = get_db_connection()
+        total = 0
+        while True:
+            cursor = conn.execute('''DELETE FROM sessoes WHERE id IN (
+                                         SELECT id FROM sessoes WHERE expira <= ? LIMIT ?)''',
+                                  (_formatar(agora), LOTE_SESSOES))
+            conn.commit()
+            total += cursor.rowcount
+            if cursor.rowcount < LOTE_SESSOES:
+                break
+        conn.close()
+        return total
+
+    def contar(self):
+        conn = get_db_connection()
+        total = conn.execute('SELECT COUNT(*) AS total FROM sessoes').fetchone()['total']
+        conn.close()
+        return total
+
+
+class ArmazenamentoMemoria:
+    """Sessões em um dicionário do processo: perdidas ao reiniciar e invisíveis para os outros workers"""
+
+    def __init__(self, maximo=SESSAO_MAX_MEMORIA):
+        self.maximo = maximo
+        self._sessoes = {}
+        self._lock = threading.Lock()
+
+    def carregar(self, sid, agora):
+        item = self._sessoes.get(sid)
+        if item is None or item[1] <= agora:
+            return None
+        return item[0], item[1]
+
+    def gravar(self, sid, dados, expira):
+        with self._lock:
+            if sid not in self._sessoes and len(self._sessoes) >= self.maximo:
+                self._limpar(datetime.now())
+                if len(self._sessoes) >= self.maximo:
+                    # Sem espaço: descarta a que vence primeiro
+                    del self._sessoes[min(self._sessoes, key=lambda s: self._sessoes[s][1])]
+            self._sessoes[sid] = (dados, expira)
+
+    def renovar(self, sid, expira):
+        with self._lock:
+            item = self._sessoes.get(sid)
+            if item is not None:
+                self._sessoes[sid] = (item[0], expira)
+
+    def remover(self, sid):
+        with self._lock:
+            self._sessoes.pop(sid, None)
+
+    def _limpar(self, agora):
+        antes = len(self._sessoes)
+        self._sessoes = {s: item for s, item in self._sessoes.items() if item[1] > agora}
+        return antes - len(self._sessoes)
+
+    def limpar_expiradas(self, agora):
+        with self._lock:
+            return self._limpar(agora)
+
+    def contar(self):
+        return len(self._sessoes)
+
+
+class InterfaceSessoes(SessionInterface):
+    """Sessões no servidor, identificadas por um id aleatório assinado no cookie.
+
+    O cookie fica com ~70 bytes em vez de carregar flashes e os dados do
+    flask_login em toda requisição. Caminhos estáticos (CAMINHOS_SEM_SESSAO)
+    não carregam a sessão. Só há escrita quando a sessão muda ou quando a
+    validade precisa ser renovada (no máximo uma vez por SESSAO_RENOVAR), e
+    visitantes que nunca gravaram nada na sessão não geram nenhuma consulta.
+    """
+
+    def __init__(self, armazenamento=None):
+        if armazenamento is None:
+            armazenamento = ArmazenamentoMemoria() if SESSAO_ARMAZENAMENTO == 'memoria' else ArmazenamentoBanco()
+        self.armazenamento = armazenamento
+        self.removidas = 0
+
+    def _assinador(self, app):
+        return Signer(app.secret_key, salt='sessao-servidor', key_derivation='hmac')
+
+    def open_session(self, app, request):
+        if request.path.startswith(CAMINHOS_SEM_SESSAO):
+            return NullSession()
+        if not app.secret_key:
+            return None
+
+        valor = request.cookies.get(self.get_cookie_name(app))
+        if not valor:
+            return SessaoServidor()
+        try:
+            sid = self._assinador(app).unsign(valor).decode()
+        except BadSignature:
+            # Cookie de sessão antigo (formato do Flask) ou adulterado: começa outra sessão
+            return SessaoServidor()
+
+        item = self.armazenamento.carregar(sid, datetime.now())
+        if item is None:
+            return SessaoServidor()
+        dados, expira = item
+        try:
+            return SessaoServidor(session_json_serializer.loads(dados), sid=sid, expira=expira)
+        except ValueError:
+            return SessaoServidor()
+
+    def save_session(self, app, session, response):
+        nome = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        caminho = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified:
+                if session.sid:
+                    self.armazenamento.remover(session.sid)
+                response.delete_cookie(nome, domain=dominio, path=caminho,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        agora = datetime.now()
+        expira = agora + app.permanent_session_lifetime
+        novo_usuario = session.get('_user_id') != session.usuario_original
+
+        if session.modified or session.sid is None or novo_usuario:
+            if novo_usuario and session.sid:
+                # Login/logout troca o id, para um id obtido antes do login não valer depois dele
+                self.armazenamento.remover(session.sid)
+                session.sid = None
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(24)
+            self.armazenamento.gravar(session.sid, session_json_serializer.dumps(dict(session)), expira)
+        elif agora - (session.expira - app.permanent_session_lifetime) > timedelta(seconds=SESSAO_RENOVAR):
+            self.armazenamento.renovar(session.sid, expira)
+        elif not (session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']):
+            # Nada mudou e o cookie do navegador continua valendo
+            return
+
+        response.set_cookie(
+            nome,
+            self._assinador(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=dominio,
+            path=caminho,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def limpar_expiradas(self):
+        inicio = time.perf_counter()
+        total = self.armazenamento.limpar_expiradas(datetime.now())
+        self.removidas += total
+        if total:
+            print(f"[Sessões] {total} sessão(ões) expirada(s) removida(s) em {time.perf_counter() - inicio:.2f}s")
+        return total
+
+    def get_status(self):
+        return {
+            'armazenamento': type(self.armazenamento).__name__,
+            'sessoes': self.armazenamento.contar(),
+            'removidas': self.removidas
+        }
+
+
+sessoes = InterfaceSessoes() if SESSAO_ARMAZENAMENTO != 'cookie' else None
@@ -0,0 +1,213 @@
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+import metricas
+from catalogo import versao_catalogo
+from database import get_db_connection
+
+# Diretório dos arquivos gerados (servidos por /sitemap.xml e /sitemaps/<arquivo>)
+SITEMAP_DIR = os.environ.get('SITEMAP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'sitemaps'))
+# Intervalo (segundos) da tarefa que verifica se os sitemaps precisam ser refeitos
+SITEMAP_INTERVALO = int(os.environ.get('SITEMAP_INTERVALO', 900))
+# Limite do protocolo: 50.000 URLs por arquivo
+URLS_POR_ARQUIVO = 50000
+SITEMAP_LOTE = 1000
+
+ARQUIVO_INDICE = 'sitemap.xml'
+ARQUIVO_ESTADO = '.estado.json'
+
+# Páginas institucionais e de campanha: (caminho, prioridade, frequência)
+PAGINAS = (
+    ('/', '1.0', 'daily'),
+    ('/produtos', '0.9', 'daily'),
+    ('/calculadora', '0.7', 'monthly'),
+    ('/sobre', '0.5', 'monthly'),
+    ('/contato', '0.5', 'yearly'),
+    ('/solucao-empresas', '0.6', 'monthly'),
+    ('/sistema-completo', '0.6', 'monthly'),
+    ('/parceria-gratuita', '0.6', 'monthly'),
+)
+
+CABECALHO_URLSET = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+
+
+def _lastmod(data):
+    """'2024-05-01 10:00:00' -> '2024-05-01' (formato W3C aceito pelo protocolo)"""
+    return data[:10] if data else None
+
+
+def _url(loc, lastmod=None, prioridade=None, frequencia=None):
+    partes = [f'<url><loc>{escape(loc)}</loc>']
+    if lastmod:
+        partes.append(f'<lastmod>{lastmod}</lastmod>')
+    if frequencia:
+        partes.append(f'<changefreq>{frequencia}</changefreq>')
+    if prioridade:
+        partes.append(f'<priority>{prioridade}</priority>')
+    partes.append('</url>\n')
+    return ''.join(partes)
+
+
+class GeradorSitemap:
+    """Índice de sitemaps + arquivos .xml.gz de até 50 mil URLs cada.
+
+    Gerado em segundo plano e só quando o catálogo ou os projetos mudam; os
+    robôs recebem arquivos prontos em vez de disparar consultas. Produtos são
+    lidos em lotes e gravados direto no gzip, sem montar a lista em memória.
+    """
+
+    def __init__(self, diretorio=SITEMAP_DIR):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self.ultima_duracao = None
+
+    def caminho(self, arquivo):
+        return os.path.join(self.diretorio, arquivo)
+
+    def _assinatura(self, conn):
+        projetos = conn.execute('SELECT COUNT(*) AS total, MAX(data) AS ultima FROM projetos').fetchone()
+        return f"{versao_catalogo()}:{projetos['total']}:{projetos['ultima']}"
+
+    def _estado(self):
+        try:
+            with open(self.caminho(ARQUIVO_ESTADO)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _gravar(self, arquivo, linhas):
+        """Grava comprimido em um temporário e troca de uma vez"""
+        destino = self.caminho(arquivo)
+        temporario = f'{destino}.{os.getpid()}.tmp'
+        # mtime fixo: o mesmo conteúdo gera o mesmo .gz
+        with gzip.GzipFile(temporario, 'wb', compresslevel=9, mtime=0) as arquivo_gz:
+            for linha in linhas:
+                arquivo_gz.write(linha.encode('utf-8'))
+        os.replace(temporario, destino)
+
+    def _paginas(self, conn, site_url):
+        ultima_produto = conn.execute('''SELECT MAX(COALESCE(data_atualizacao, data_cadastro)) AS ultima
+                                         FROM produtos WHERE ativo = 1''').fetchone()['ultima']
+        ultimo_projeto = conn.execute('SELECT MAX(data) AS ultima FROM projetos').fetchone()['ultima']
+        # A home mostra destaques e os últimos projetos; /sobre lista os projetos
+        lastmods = {
+            '/': _lastmod(max(filter(None, (ultima_produto, ultimo_projeto)), default=None)),
+            '/produtos': _lastmod(ultima_produto),
+            '/sobre': _lastmod(ultimo_projeto),
+        }
+
+        yield CABECALHO_URLSET
+        for caminho, prioridade, frequencia in PAGINAS:
+            yield _url(f'{site_url}{caminho}', lastmods.get(caminho), prioridade, frequencia)
+
+        categorias = conn.execute('''SELECT categoria, MAX(COALESCE(data_atualizacao, data_cadastro)) AS ultima
+                                     FROM produtos WHERE ativo = 1 AND categoria IS NOT NULL
+                                     GROUP BY categoria ORDER BY categoria''').fetchall()
+        for c in categorias:
+            yield _url(f"{site_url}/produtos?categoria={quote(c['categoria'])}", _lastmod(c['ultima']), '0.8', 'weekly')
+        yield '</urlset>\n'
+
+    def _arquivos_produtos(self, conn, site_url):
+        """Grava sitemap-produtos-N.xml.gz; retorna [(arquivo, lastmod)]"""
+        cursor = conn.execute('''SELECT id, COALESCE(data_atualizacao, data_cadastro) AS atualizado
+                                 FROM produtos WHERE ativo = 1 ORDER BY id''')
+        gerados = []
+        fim = False
+
+        def urls(pedaco):
+            nonlocal fim
+            yield CABECALHO_URLSET
+            escritos = 0
+            while escritos < URLS_POR_ARQUIVO:
+                lote = cursor.fetchmany(min(SITEMAP_LOTE, URLS_POR_ARQUIVO - escritos))
+                if not lote:
+                    fim = True
+                    break
+                for p in lote:
+                    lastmod = _lastmod(p['atualizado'])
+                    if lastmod and (pedaco['lastmod'] is None or lastmod > pedaco['lastmod']):
+                        pedaco['lastmod'] = lastmod
+                    yield _url(f"{site_url}/produto/{p['id']}", lastmod, '0.8', 'weekly')
+                escritos += len(lote)
+            pedaco['urls'] = escritos
+            yield '</urlset>\n'
+
+        while not fim:
+            arquivo = f'sitemap-produtos-{len(gerados) + 1}.xml.gz'
+            pedaco = {'lastmod': None, 'urls': 0}
+            self._gravar(arquivo, urls(pedaco))
+            if pedaco['urls'] == 0 and gerados:
+                # Catálogo múltiplo exato de URLS_POR_ARQUIVO: o último ficou vazio
+                os.remove(self.caminho(arquivo))
+                break
+            gerados.append((arquivo, pedaco['lastmod']))
+        return gerados
+
+    def _indice(self, site_url, arquivos):
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+        for arquivo, lastmod in arquivos:
+            partes = [f'<sitemap><loc>{escape(site_url)}/sitemaps/{arquivo}</loc>']
+            if lastmod:
+                partes.append(f'<lastmod>{lastmod}</lastmod>')
+            partes.append('</sitemap>\n')
+            yield ''.join(partes)
+        yield '</sitemapindex>\n'
+
+    def gerar(self, site_url, forcar=False):
+        """Refaz os sitemaps se o catálogo ou os projetos mudaram"""
+        with self._lock:
+            os.makedirs(self.diretorio, exist_ok=True)
+            conn = get_db_connection()
+            try:
+                assinatura = self._assinatura(conn)
+                estado = self._estado()
+                if (not forcar and estado.get('assinatura') == assinatura and estado.get('site_url') == site_url
+                        and os.path.exists(self.caminho(ARQUIVO_INDICE))):
+                    return False
+
+                inicio = time.perf_counter()
+                with metricas.cronometrar('sitemap_geracao_segundos', 'Duração da geração dos sitemaps'):
+                    self._gravar('sitemap-paginas.xml.gz', self._paginas(conn, site_url))
+                    arquivos = [('sitemap-paginas.xml.gz', None)] + self._arquivos_produtos(conn, site_url)
+
+                    # Índice por último (em texto e comprimido), depois de todos os arquivos que ele cita
+                    indice = ''.join(self._indice(site_url, arquivos))
+                    temporario = f'{self.caminho(ARQUIVO_INDICE)}.{os.getpid()}.tmp'
+                    with open(temporario, 'w', encoding='utf-8') as f:
+                        f.write(indice)
+                    self._gravar(ARQUIVO_INDICE + '.gz', [indice])
+                    os.replace(temporario, self.caminho(ARQUIVO_INDICE))
+            finally:
+                conn.close()
+
+            # Catálogo diminuiu: remove os arquivos de produtos que saíram do índice
+            citados = {arquivo for arquivo, _ in arquivos}
+            for caminho in glob.glob(self.caminho('sitemap-produtos-*.xml.gz')):
+                if os.path.basename(caminho) not in citados:
+                    os.remove(caminho)
+
+            with open(self.caminho(ARQUIVO_ESTADO), 'w') as f:
+                json.dump({'assinatura': assinatura, 'site_url': site_url, 'arquivos': len(arquivos),
+                           'gerado_em': datetime.now().isoformat()}, f)
+            self.ultima_duracao = time.perf_counter() - inicio
+            print(f"[Sitemap] {len(arquivos)} arquivo(s) gerado(s) em {self.ultima_duracao:.2f}s")
+            return True
+
+    def get_status(self):
+        return {
+            'diretorio': self.diretorio,
+            'estado': self._estado(),
+            'ultima_duracao': self.ultima_duracao
+        }
+
+
+sitemap = GeradorSitemap()
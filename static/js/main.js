@@ -135,25 +135,82 @@ function addToCart(produtoId, nome, preco, imagem) {
     updateCartBadge();
 
     // Sincronizar com o backend se o usuário estiver logado
-    sincronizarCarrinho();
+    enfileirarOperacaoCarrinho({ op: 'adicionar', id: produtoId, quantidade: 1 });
 
     alert('Produto adicionado ao carrinho!');
 }
 
+// Sincronização do carrinho por operações (delta), agrupando cliques rápidos
+let carrinhoVersao = JSON.parse(localStorage.getItem('solarpro_cart_versao'));
+let operacoesPendentes = [];
+let timerSincronizacao = null;
+
+function enfileirarOperacaoCarrinho(operacao) {
+    const anterior = operacoesPendentes[operacoesPendentes.length - 1];
+
+    // Cliques repetidos em "adicionar" no mesmo produto viram uma única operação
+    if (anterior && anterior.op === 'adicionar' && operacao.op === 'adicionar' && anterior.id === operacao.id) {
+        anterior.quantidade += operacao.quantidade;
+    } else {
+        operacoesPendentes.push(operacao);
+    }
+
+    clearTimeout(timerSincronizacao);
+    timerSincronizacao = setTimeout(sincronizarCarrinho, 400);
+}
+
+async function enviarOperacoesCarrinho(operacoes, keepalive = false) {
+    // keepalive: a requisição termina mesmo com a página sendo descarregada; sem a versão,
+    // o servidor aplica as operações sobre o carrinho atual em vez de responder 409
+    const corpo = keepalive ? { operacoes: operacoes } : { versao: carrinhoVersao, operacoes: operacoes };
+    const response = await fetch('/api/carrinho/itens', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(corpo),
+        keepalive: keepalive
+    });
+    const dados = await response.json();
+    if (dados.versao !== undefined) {
+        carrinhoVersao = dados.versao;
+        localStorage.setItem('solarpro_cart_versao', JSON.stringify(carrinhoVersao));
+    }
+    return response.status;
+}
+
 async function sincronizarCarrinho() {
+    if (operacoesPendentes.length === 0) return;
+    const operacoes = operacoesPendentes;
+    operacoesPendentes = [];
+
     try {
-        await fetch('/api/carrinho', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ produtos: carrinho })
-        });
+        // 409: o carrinho mudou em outra aba/dispositivo; reaplica sobre a versão atual
+        if (await enviarOperacoesCarrinho(operacoes) === 409) {
+            await enviarOperacoesCarrinho(operacoes);
+        }
     } catch (error) {
         console.error('Erro ao sincronizar carrinho:', error);
     }
 }
 
+// Saindo da página (ex.: "adicionar" seguido do link do carrinho) antes dos 400 ms:
+// envia na hora o que ainda está pendente, senão os incrementos se perderiam
+function descarregarOperacoesCarrinho() {
+    if (operacoesPendentes.length === 0) return;
+    clearTimeout(timerSincronizacao);
+    const operacoes = operacoesPendentes;
+    operacoesPendentes = [];
+    enviarOperacoesCarrinho(operacoes, true).catch(error => {
+        console.error('Erro ao sincronizar carrinho:', error);
+    });
+}
+
+window.addEventListener('pagehide', descarregarOperacoesCarrinho);
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') descarregarOperacoesCarrinho();
+});
+
 
 function updateCartDisplay() {
     const cartItems = document.getElementById('cartItems');
@@ -200,6 +257,7 @@ function updateCartDisplay() {
 
 function increaseQuantity(index) {
     carrinho[index].quantidade++;
+    enfileirarOperacaoCarrinho({ op: 'adicionar', id: carrinho[index].id, quantidade: 1 });
     localStorage.setItem('solarpro_cart', JSON.stringify(carrinho));
     updateCartBadge();
     updateCartDisplay();
@@ -208,6 +266,7 @@ function increaseQuantity(index) {
 function decreaseQuantity(index) {
     if (carrinho[index].quantidade > 1) {
         carrinho[index].quantidade--;
+        enfileirarOperacaoCarrinho({ op: 'definir', id: carrinho[index].id, quantidade: carrinho[index].quantidade });
     } else {
         removeItem(index);
         return;
@@ -218,6 +277,7 @@ function decreaseQuantity(index) {
 }
 
 function removeItem(index) {
+    enfileirarOperacaoCarrinho({ op: 'remover', id: carrinho[index].id });
     carrinho.splice(index, 1);
     localStorage.setItem('solarpro_cart', JSON.stringify(carrinho));
     updateCartBadge();
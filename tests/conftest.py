@@ -0,0 +1,128 @@
+import os
+import socketserver
+import sys
+import threading
+import urllib.parse
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import database
+import postgres
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Banco SQLite novo por teste, com schema e dados iniciais"""
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'teste.db'))
+    monkeypatch.setattr(database, 'DATABASE_URL', '')
+    database.preparar_banco()
+    return database.DB_PATH
+
+
+@pytest.fixture
+def aplicacao(banco, monkeypatch):
+    """Módulo app sobre o banco do teste, sem agendador nem pré-compilação de templates"""
+    monkeypatch.setenv('AGENDADOR_ATIVO', '0')
+    monkeypatch.setenv('AQUECER_TEMPLATES', '0')
+    import app
+    import catalogo
+    # Os caches do catálogo são do processo e chaveados pela versão, que se repete entre bancos de teste
+    for nome in ('_versao', '_mapa_precos', '_mapa_precos_versao', '_listagem'):
+        monkeypatch.setattr(catalogo, nome, None)
+    return app
+
+
+@pytest.fixture(scope='session')
+def url_postgres():
+    """Banco PostgreSQL temporário criado a partir de DATABASE_URL (pulado se ela não estiver definida).
+
+    Os testes nunca escrevem no banco da própria DATABASE_URL: criam um banco
+    novo no mesmo servidor, aplicam o schema e o removem no fim da sessão.
+    """
+    url = os.environ.get('DATABASE_URL', '')
+    if not postgres.configurado(url):
+        pytest.skip('DATABASE_URL não aponta para um PostgreSQL')
+    psycopg = pytest.importorskip('psycopg')
+    pytest.importorskip('psycopg_pool')
+
+    nome = f'solarpro_teste_{os.getpid()}'
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f'CREATE DATABASE {nome}')
+    url_teste = urllib.parse.urlsplit(url)._replace(path='/' + nome).geturl()
+    try:
+        postgres.preparar_banco(database.SCHEMA_VERSION, url_teste)
+        yield url_teste
+    finally:
+        if postgres._pool is not None:
+            postgres._pool.close()
+            postgres._pool = None
+        with psycopg.connect(url, autocommit=True) as conn:
+            conn.execute(f'DROP DATABASE IF EXISTS {nome}')
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request, monkeypatch):
+    """Roda o teste no SQLite e, com DATABASE_URL definida, também no PostgreSQL"""
+    if request.param == 'postgres':
+        monkeypatch.setattr(database, 'DATABASE_URL', request.getfixturevalue('url_postgres'))
+    else:
+        request.getfixturevalue('banco')
+    return request.param
+
+
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    """SMTP mínimo: aceita tudo e guarda as mensagens, exceto destinatários que começam com 'recusar'"""
+
+    def _responder(self, linha):
+        self.wfile.write(linha.encode() + b'\r\n')
+
+    def handle(self):
+        self._responder('220 localhost SMTP de teste')
+        destinatarios = []
+        while True:
+            linha = self.rfile.readline().decode('utf-8', 'replace').strip()
+            if not linha:
+                return
+            comando = linha.split(' ', 1)[0].upper()
+            if comando in ('EHLO', 'HELO'):
+                self._responder('250 localhost')
+            elif comando == 'MAIL':
+                destinatarios = []
+                self._responder('250 OK')
+            elif comando == 'RCPT':
+                endereco = linha.split(':', 1)[1].strip(' <>')
+                if endereco.startswith('recusar'):
+                    self._responder('550 Destinatário recusado')
+                else:
+                    destinatarios.append(endereco)
+                    self._responder('250 OK')
+            elif comando == 'DATA':
+                self._responder('354 Fim com <CRLF>.<CRLF>')
+                corpo = []
+                for dado in self.rfile:
+                    if dado in (b'.\r\n', b'.\n'):
+                        break
+                    corpo.append(dado)
+                self.server.mensagens.append((destinatarios, b''.join(corpo)))
+                self._responder('250 OK')
+            elif comando == 'QUIT':
+                self._responder('221 Tchau')
+                return
+            else:
+                # RSET, NOOP e o resto
+                self._responder('250 OK')
+
+
+@pytest.fixture
+def servidor_smtp():
+    """Servidor SMTP local (como `python -m aiosmtpd -n`) numa porta livre; .mensagens guarda o recebido"""
+    servidor = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SessaoSMTP)
+    servidor.daemon_threads = True
+    servidor.mensagens = []
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
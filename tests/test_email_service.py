@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_mail import Mail
+
+from database import get_db_connection
+from email_service import EmailService
+
+
+@pytest.fixture
+def servico(banco, servidor_smtp):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=servidor_smtp.server_address[1],
+                      MAIL_USE_TLS=False, MAIL_DEFAULT_SENDER='contato@solarpro.com')
+    servico = EmailService()
+    servico.init_app(app, Mail(app))
+    with app.app_context():
+        yield servico
+
+
+def _fila():
+    conn = get_db_connection()
+    emails = {e['destinatario']: e for e in conn.execute('SELECT * FROM emails_fila')}
+    conn.close()
+    return emails
+
+
+def test_envia_pendentes_e_marca_enviados(servico, servidor_smtp):
+    servico.enfileirar('cliente@teste.com', 'Pedido #1', 'Recebemos seu pedido', tipo='pedido')
+    servico.enfileirar('outro@teste.com', 'Pagamento aprovado', 'Pagamento confirmado', tipo='pagamento')
+
+    assert servico.enviar_pendentes() == 2
+
+    emails = _fila()
+    assert {e['status'] for e in emails.values()} == {'enviado'}
+    assert all(e['tentativas'] == 1 and e['data_envio'] for e in emails.values())
+    assert sorted(d for destinatarios, _ in servidor_smtp.mensagens for d in destinatarios) == \
+        ['cliente@teste.com', 'outro@teste.com']
+    # Nada mais a enviar
+    assert servico.enviar_pendentes() == 0
+
+
+def test_falha_reagenda_com_backoff_exponencial(servico, servidor_smtp):
+    servico.enfileirar('recusar@teste.com', 'Pedido #2', 'corpo')
+    servico.enfileirar('cliente@teste.com', 'Pedido #3', 'corpo')
+
+    antes = datetime.now()
+    assert servico.enviar_pendentes() == 1
+
+    emails = _fila()
+    assert emails['cliente@teste.com']['status'] == 'enviado'
+    falha = emails['recusar@teste.com']
+    assert falha['status'] == 'pendente'
+    assert falha['tentativas'] == 1
+    assert falha['erro']
+    proxima = datetime.strptime(falha['proxima_tentativa'], '%Y-%m-%d %H:%M:%S')
+    assert timedelta(minutes=2) - timedelta(seconds=2) <= proxima - antes <= timedelta(minutes=2, seconds=2)
+
+    # Antes do horário agendado o email não é tentado de novo
+    assert servico.enviar_pendentes() == 0
+    assert _fila()['recusar@teste.com']['tentativas'] == 1
+
+    # Na segunda falha a espera dobra (2^2 minutos)
+    conn = get_db_connection()
+    conn.execute("UPDATE emails_fila SET proxima_tentativa = '2000-01-01 00:00:00' WHERE destinatario = 'recusar@teste.com'")
+    conn.commit()
+    conn.close()
+    antes = datetime.now()
+    servico.enviar_pendentes()
+    falha = _fila()['recusar@teste.com']
+    assert falha['tentativas'] == 2
+    proxima = datetime.strptime(falha['proxima_tentativa'], '%Y-%m-%d %H:%M:%S')
+    assert timedelta(minutes=4) - timedelta(seconds=2) <= proxima - antes <= timedelta(minutes=4, seconds=2)
+
+
+def test_desiste_apos_maximo_de_tentativas(servico):
+    servico.enfileirar('recusar@teste.com', 'Pedido #4', 'corpo')
+    conn = get_db_connection()
+    conn.execute('UPDATE emails_fila SET tentativas = 4')
+    conn.commit()
+    conn.close()
+
+    servico.enviar_pendentes()
+
+    falha = _fila()['recusar@teste.com']
+    assert falha['status'] == 'falhou'
+    assert falha['tentativas'] == 5
+    assert falha['proxima_tentativa'] is None
@@ -0,0 +1,109 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+import frete
+from database import get_db_connection
+from importacao import ImportacaoInterrompida, ImportadorProdutos, ler_arquivo
+
+
+def _importar(conteudo, nome='produtos.jsonl', **kwargs):
+    return ImportadorProdutos().importar(ler_arquivo(io.BytesIO(conteudo.encode()), nome), **kwargs)
+
+
+def _produto(sku):
+    conn = get_db_connection()
+    produto = conn.execute('SELECT * FROM produtos WHERE sku = ?', (sku,)).fetchone()
+    conn.close()
+    return produto
+
+
+NOVO = {'nome': 'Painel 550W', 'preco': 1000, 'potencia_watts': 550, 'eficiencia': 21.5, 'garantia': 25,
+        'categoria': 'Residencial'}
+
+
+def test_especificacoes_do_jsonl_gravadas_como_json(banco):
+    especificacoes = {'peso': 22, 'dimensoes': '2000x1000x40 mm'}
+    resultado = _importar(json.dumps({'sku': 'PN-550', **NOVO, 'especificacoes': especificacoes}))
+
+    assert (resultado['criados'], resultado['erros']) == (1, 0)
+    produto = _produto('PN-550')
+    assert json.loads(produto['especificacoes']) == especificacoes
+    # Peso cubado de 2000x1000x40 mm (0,08 m³) e não o padrão da categoria
+    assert frete.peso_produto(produto['especificacoes'], produto['categoria']) == 0.08 * frete.FATOR_CUBAGEM
+
+
+def test_especificacoes_invalidas_recusadas(banco):
+    linhas = [{'sku': 'PN-1', **NOVO, 'especificacoes': "{'peso': 22}"},
+              {'sku': 'PN-2', **NOVO, 'especificacoes': '[1, 2]'},
+              {'sku': 'PN-3', **NOVO, 'especificacoes': '{"peso": 22}'}]
+    resultado = _importar('\n'.join(json.dumps(linha) for linha in linhas))
+
+    assert (resultado['criados'], resultado['erros']) == (1, 2)
+    assert all('especificacoes inválido' in mensagem for _, mensagem in resultado['mensagens'])
+    assert json.loads(_produto('PN-3')['especificacoes']) == {'peso': 22}
+
+
+def test_numero_da_linha_vem_do_leitor(banco):
+    jsonl = '\n'.join([json.dumps({'sku': 'J-1', **NOVO}), '', json.dumps({'sku': 'J-2', **NOVO, 'preco': 'x'}),
+                       '{quebrado', json.dumps({'sku': 'J-3', **NOVO, 'garantia': 2.5})])
+    resultado = _importar(jsonl, simular=True)
+    assert [numero for numero, _ in resultado['mensagens']] == [3, 4, 5]
+
+    csv = ('sku;nome;preco;potencia_watts;eficiencia;garantia\n'
+           'C-1;Painel;1000;550;21,5;25\n'
+           '\n'
+           'C-2;"Painel\ncom quebra";-1;550;21,5;25\n'
+           'C-3;Painel;1000;x;21,5;25\n')
+    resultado = _importar(csv, 'produtos.csv', simular=True)
+    assert [numero for numero, _ in resultado['mensagens']] == [4, 6]
+    assert resultado['criados'] == 1
+
+
+class _LoteQueFalha(ImportadorProdutos):
+    """Simula o banco travando no segundo lote"""
+
+    def _processar_lote(self, c, lote, resultado):
+        if lote[0][0] > 3:
+            raise sqlite3.OperationalError('database is locked')
+        super()._processar_lote(c, lote, resultado)
+
+
+def test_falha_no_meio_mantem_lotes_gravados_e_invalida_catalogo(banco):
+    conn = get_db_connection()
+    versao = conn.execute("SELECT valor FROM configuracoes WHERE chave = 'catalogo_versao'").fetchone()['valor']
+    conn.close()
+    linhas = [(numero, {'sku': f'L-{numero}', **NOVO}) for numero in range(2, 7)]
+
+    with pytest.raises(ImportacaoInterrompida) as erro:
+        _LoteQueFalha(lote=2).importar(iter(linhas), usuario_id=1, origem='teste.csv')
+
+    resultado = erro.value.resultado
+    assert 'database is locked' in str(erro.value)
+    # Só o primeiro lote (linhas 2 e 3) foi confirmado
+    assert (resultado['lidas'], resultado['criados']) == (4, 2)
+    assert _produto('L-2') and _produto('L-3') and not _produto('L-4')
+
+    conn = get_db_connection()
+    assert conn.execute("SELECT valor FROM configuracoes WHERE chave = 'catalogo_versao'").fetchone()['valor'] != versao
+    log = conn.execute("SELECT detalhes FROM logs_admin WHERE acao = 'Importação de produtos'").fetchone()
+    conn.close()
+    assert '2 criado(s)' in log['detalhes'] and 'interrompida' in log['detalhes']
+
+
+def test_rota_admin_mostra_importacao_interrompida(aplicacao, monkeypatch):
+    monkeypatch.setattr(aplicacao, 'importador', _LoteQueFalha(lote=2))
+
+    cliente = aplicacao.app.test_client()
+    cliente.post('/login', data={'email': 'admin@solarpro.com', 'senha': 'admin123'})
+    arquivo = '\n'.join(json.dumps({'sku': f'R-{i}', **NOVO}) for i in range(5)).encode()
+    resposta = cliente.post('/admin/produtos/importar',
+                            data={'arquivo': (io.BytesIO(arquivo), 'produtos.jsonl')},
+                            content_type='multipart/form-data')
+
+    assert resposta.status_code == 200
+    pagina = resposta.get_data(as_text=True)
+    assert 'Importação interrompida' in pagina and 'database is locked' in pagina
+    assert _produto('R-0') and not _produto('R-4')
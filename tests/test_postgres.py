@@ -0,0 +1,62 @@
+import pytest
+
+from database import get_db_connection
+from postgres import traduzir_sql
+
+
+@pytest.mark.parametrize('sqlite, esperado', [
+    ('SELECT * FROM produtos WHERE id = ? AND ativo = ?',
+     'SELECT * FROM produtos WHERE id = %s AND ativo = %s'),
+    # ? dentro de literal não é placeholder; % precisa ser escapado para o psycopg
+    ("SELECT * FROM produtos WHERE nome = 'Quanto?' AND id = ?",
+     "SELECT * FROM produtos WHERE nome = 'Quanto?' AND id = %s"),
+    ("SELECT chave FROM configuracoes WHERE chave LIKE 'loja_%' AND valor = ?",
+     "SELECT chave FROM configuracoes WHERE chave ILIKE 'loja_%%' AND valor = %s"),
+    ('SELECT 100 % ? AS resto', 'SELECT 100 %% %s AS resto'),
+    # Aspas duplas são literal no SQLite; aspas simples internas são escapadas
+    ('SELECT * FROM pedidos WHERE status_pedido = "enviado"',
+     "SELECT * FROM pedidos WHERE status_pedido = 'enviado'"),
+    ('''SELECT "it's" AS texto''', "SELECT 'it''s' AS texto"),
+    ("SELECT 'O''Brien' AS nome WHERE 1 = ?", "SELECT 'O''Brien' AS nome WHERE 1 = %s"),
+    # LIKE só como palavra inteira
+    ('SELECT * FROM produtos WHERE nome like ? OR descricao NOT LIKE ?',
+     'SELECT * FROM produtos WHERE nome ILIKE %s OR descricao NOT ILIKE %s'),
+    ('SELECT likes, unlike FROM t WHERE x = ?', 'SELECT likes, unlike FROM t WHERE x = %s'),
+    ("SELECT * FROM t WHERE nota = 'LIKE'", "SELECT * FROM t WHERE nota = 'LIKE'"),
+    ('INSERT OR IGNORE INTO avaliacoes_resumo (produto_id) VALUES (?);',
+     'INSERT INTO avaliacoes_resumo (produto_id) VALUES (%s) ON CONFLICT DO NOTHING'),
+    ('  insert or ignore into lista_desejos (usuario_id, produto_id) VALUES (?, ?)',
+     'INSERT INTO lista_desejos (usuario_id, produto_id) VALUES (%s, %s) ON CONFLICT DO NOTHING'),
+])
+def test_traduzir_sql(sqlite, esperado):
+    assert traduzir_sql(sqlite) == esperado
+
+
+def test_traduzir_sql_sem_parametros_nao_escapa_percentual():
+    # Sem parâmetros o psycopg não interpreta %, então nada é escapado (ex.: DEFAULT do schema)
+    assert traduzir_sql("SELECT * FROM t WHERE a LIKE 'x%'", False) == "SELECT * FROM t WHERE a ILIKE 'x%'"
+    assert traduzir_sql('SELECT ?', False) == 'SELECT ?'
+
+
+@pytest.mark.parametrize('sql, esperado', [
+    ("SELECT strftime('%Y-%m', '2024-03-05 10:20:30')", '2024-03'),
+    ("SELECT strftime('%Y-%m-%d %H:%M:%S', '2024-03-05 10:20:30')", '2024-03-05 10:20:30'),
+    ("SELECT strftime('%d/%m', ?)", '05/03'),
+    ("SELECT datetime('2024-03-05 10:20:30')", '2024-03-05 10:20:30'),
+    ("SELECT datetime('2024-01-31 23:00:00', '+1 day')", '2024-02-01 23:00:00'),
+    ("SELECT datetime('2024-03-01 00:00:00', '-7 days')", '2024-02-23 00:00:00'),
+    ("SELECT datetime(?, '+2 hours')", '2024-03-05 12:20:30'),
+])
+def test_funcoes_de_data_iguais_nos_dois_bancos(backend, sql, esperado):
+    """strftime/datetime do SQLite e as funções de compatibilidade criadas no PostgreSQL"""
+    conn = get_db_connection()
+    parametros = ('2024-03-05 10:20:30',) if '?' in sql else ()
+    assert conn.execute(sql, parametros).fetchone()[0] == esperado
+    conn.close()
+
+
+def test_datetime_now(backend):
+    conn = get_db_connection()
+    agora = conn.execute("SELECT datetime('now')").fetchone()[0]
+    conn.close()
+    assert len(agora) == 19 and agora[4] == '-' and agora[13] == ':'
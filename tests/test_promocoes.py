@@ -0,0 +1,60 @@
+import re
+
+import repositorio
+from catalogo import preco_efetivo
+from database import get_db_connection
+from promocoes import AgendaPromocoes
+
+
+def _campanha_na_loja_inteira(percentual=10):
+    conn = get_db_connection()
+    conn.execute('''INSERT INTO promocoes (nome, tipo, valor, inicio, ativo, data_atualizacao)
+                    VALUES ('Semana Solar', 'percentual', ?, '2000-01-01 00:00:00', 1, '2000-01-01 00:00:00')''',
+                 (percentual,))
+    conn.commit()
+    conn.close()
+    assert AgendaPromocoes().aplicar(forcar=True) > 0
+
+
+def _produtos():
+    conn = get_db_connection()
+    produtos = {p['id']: p for p in conn.execute('SELECT * FROM produtos WHERE ativo = 1')}
+    conn.close()
+    return produtos
+
+
+def test_cards_da_home_usam_preco_de_campanha(aplicacao):
+    _campanha_na_loja_inteira()
+    produtos = _produtos()
+
+    pagina = aplicacao.app.test_client().get('/').get_data(as_text=True)
+
+    cards = re.findall(r'data-id="(\d+)"\s+data-nome="[^"]*"\s+data-preco="([^"]+)"', pagina)
+    assert cards
+    for produto_id, preco in cards:
+        produto = produtos[int(produto_id)]
+        assert float(preco) == preco_efetivo(produto) < produto['preco']
+        assert aplicacao.format_price_filter(preco_efetivo(produto)) in pagina
+
+
+def test_relacionados_e_lista_de_desejos_usam_preco_de_campanha(aplicacao):
+    _campanha_na_loja_inteira()
+    produtos = _produtos()
+    produto = next(iter(produtos.values()))
+    relacionados = repositorio.produtos_relacionados(produto['categoria'], produto['id'])
+    assert relacionados
+
+    cliente = aplicacao.app.test_client()
+    pagina = cliente.get(f"/produto/{produto['id']}").get_data(as_text=True)
+    for rel in relacionados:
+        assert aplicacao.format_price_filter(preco_efetivo(rel)) in pagina
+
+    cliente.post('/login', data={'email': 'admin@solarpro.com', 'senha': 'admin123'})
+    admin = repositorio.buscar_usuario_por_email('admin@solarpro.com')
+    conn = get_db_connection()
+    conn.execute('INSERT INTO lista_desejos (usuario_id, produto_id) VALUES (?, ?)', (admin['id'], produto['id']))
+    conn.commit()
+    conn.close()
+    pagina = cliente.get('/minha-conta').get_data(as_text=True)
+    assert aplicacao.format_price_filter(preco_efetivo(produto)) in pagina
+    assert aplicacao.format_price_filter(produto['preco']) not in pagina
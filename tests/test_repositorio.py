@@ -0,0 +1,137 @@
+import uuid
+
+import repositorio
+from database import get_db_connection
+
+
+def _email():
+    return f'teste-{uuid.uuid4().hex[:12]}@solarpro.com'
+
+
+def _novo_produto(categoria='Teste'):
+    conn = get_db_connection()
+    produto_id = conn.execute('''INSERT INTO produtos (nome, descricao, preco, potencia_watts, eficiencia, garantia,
+                                                       estoque, categoria, ativo)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1) RETURNING id''',
+                              ('Painel Teste', 'descrição', 999.9, 550, 21.5, 25, 10, categoria)).fetchone()[0]
+    conn.commit()
+    conn.close()
+    return produto_id
+
+
+def test_configuracoes(backend):
+    chave = 'loja_teste_' + uuid.uuid4().hex[:8]
+    assert repositorio.get_config(chave, 'padrão') == 'padrão'
+
+    repositorio.set_config(chave, 'um')
+    repositorio.set_config(chave, 'dois')
+
+    assert repositorio.get_config(chave) == 'dois'
+    assert repositorio.get_configs(chave, 'inexistente') == {chave: 'dois'}
+    configs_loja = repositorio.configuracoes_loja()
+    assert configs_loja[chave] == 'dois'
+    assert all(c.startswith('loja_') for c in configs_loja)
+
+
+def test_usuarios(backend):
+    email = _email()
+    usuario_id = repositorio.criar_usuario('Cliente Teste', email, '11999999999', 'hash')
+
+    assert isinstance(usuario_id, int)
+    assert repositorio.buscar_usuario(usuario_id)['email'] == email
+    assert repositorio.buscar_usuario_por_email(email)['id'] == usuario_id
+
+    repositorio.atualizar_senha_hash(usuario_id, 'outro-hash')
+    repositorio.atualizar_perfil(usuario_id, {'nome': 'Novo Nome', 'cidade': 'Campinas', 'estado': 'SP'})
+    usuario = repositorio.buscar_usuario(usuario_id)
+    assert (usuario['senha_hash'], usuario['nome'], usuario['cidade']) == ('outro-hash', 'Novo Nome', 'Campinas')
+
+    conn = get_db_connection()
+    conn.execute('UPDATE usuarios SET ativo = 0 WHERE id = ?', (usuario_id,))
+    conn.commit()
+    conn.close()
+    assert repositorio.buscar_usuario(usuario_id) is None
+    assert repositorio.buscar_usuario_por_email(email) is None
+    assert repositorio.buscar_usuario_por_email(email, apenas_ativos=False)['id'] == usuario_id
+
+
+def test_transacao_de_quem_chama(backend):
+    """Com conn informada, a função não faz commit: rollback desfaz a escrita"""
+    email = _email()
+    conn = get_db_connection()
+    repositorio.criar_usuario('Sem Commit', email, None, 'hash', conn=conn)
+    assert repositorio.buscar_usuario_por_email(email, conn=conn) is not None
+    conn.rollback()
+    conn.close()
+    assert repositorio.buscar_usuario_por_email(email) is None
+
+
+def test_produtos_relacionados(backend):
+    categoria = 'Categoria ' + uuid.uuid4().hex[:8]
+    produto, junto, mesma_categoria = (_novo_produto(categoria) for _ in range(3))
+    conn = get_db_connection()
+    conn.execute('''INSERT INTO produtos_relacionados (produto_id, posicao, relacionado_id, pontuacao)
+                    VALUES (?, ?, ?, ?)''', (produto, 1, junto, 0.5))
+    conn.commit()
+    conn.close()
+
+    relacionados = [p['id'] for p in repositorio.produtos_relacionados(categoria, produto)]
+    # Primeiro os comprados junto, depois a mesma categoria, nunca o próprio produto
+    assert relacionados == [junto, mesma_categoria]
+    assert repositorio.buscar_produto(produto)['categoria'] == categoria
+
+
+def test_resumo_de_avaliacoes(backend):
+    produto_id = _novo_produto()
+    usuario_id = repositorio.criar_usuario('Avaliador', _email(), None, 'hash')
+    conn = get_db_connection()
+    ids = [conn.execute('''INSERT INTO avaliacoes (usuario_id, produto_id, nota, comentario, aprovado, data)
+                           VALUES (?, ?, ?, ?, 0, ?) RETURNING id''',
+                        (usuario_id, produto_id, nota, 'ok', f'2024-01-0{nota} 10:00:00')).fetchone()[0]
+           for nota in (5, 4, 4)]
+    conn.commit()
+    conn.close()
+    assert repositorio.resumo_avaliacoes(produto_id) is None
+
+    for avaliacao_id in ids:
+        assert repositorio.moderar_avaliacao(avaliacao_id, True) == produto_id
+    # Aprovar de novo não soma outra vez
+    repositorio.moderar_avaliacao(ids[0], True)
+    resumo = repositorio.resumo_avaliacoes(produto_id)
+    assert resumo['quantidade'] == 3
+    assert resumo['media'] == 13 / 3
+    assert resumo['notas'] == {5: 1, 4: 2, 3: 0, 2: 0, 1: 0}
+    assert [a['nota'] for a in repositorio.avaliacoes_aprovadas(produto_id)] == [5, 4, 4]
+
+    repositorio.moderar_avaliacao(ids[1], False)
+    repositorio.remover_avaliacao(ids[0])
+    assert repositorio.resumo_avaliacoes(produto_id)['notas'] == {5: 0, 4: 1, 3: 0, 2: 0, 1: 0}
+    assert repositorio.moderar_avaliacao(ids[0], True) is None
+
+    # Recalcular a partir da tabela chega ao mesmo resumo
+    repositorio.recalcular_resumos_avaliacoes()
+    assert repositorio.resumo_avaliacoes(produto_id)['quantidade'] == 1
+
+
+def test_carrinho_e_pedidos(backend):
+    usuario_id = repositorio.criar_usuario('Comprador', _email(), None, 'hash')
+    assert repositorio.buscar_carrinho_ativo(usuario_id) is None
+
+    conn = get_db_connection()
+    conn.execute('''INSERT INTO carrinhos (usuario_id, produtos_json, total, status, versao)
+                    VALUES (?, ?, ?, 'abandonado', 3)''', (usuario_id, '[]', 10.5))
+    for dia in (1, 3, 2):
+        conn.execute('''INSERT INTO pedidos (usuario_id, nome_cliente, email, produtos_json, subtotal, total, data)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (usuario_id, 'Comprador', 'c@teste.com', '[]', dia, dia, f'2024-05-0{dia} 12:00:00'))
+    conn.commit()
+    conn.close()
+
+    carrinho = repositorio.buscar_carrinho_ativo(usuario_id)
+    assert (carrinho['total'], carrinho['versao']) == (10.5, 3)
+
+    pedidos = repositorio.pedidos_do_usuario(usuario_id)
+    assert [p['total'] for p in pedidos] == [3, 2, 1]
+    assert [p['total'] for p in repositorio.pedidos_do_usuario(usuario_id, limite=2)] == [3, 2]
+    assert repositorio.buscar_pedido_do_usuario(pedidos[0]['id'], usuario_id)['total'] == 3
+    assert repositorio.buscar_pedido_do_usuario(pedidos[0]['id'], usuario_id + 1000) is None
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+import repositorio
+
+# Por quanto tempo (segundos) um usuário carregado é reutilizado sem consultar o banco.
+# Alterações feitas por outro worker (ou direto no banco) levam no máximo esse tempo para valer.
+USUARIO_CACHE_TTL = float(os.environ.get('USUARIO_CACHE_TTL', 30))
+USUARIO_CACHE_MAX = int(os.environ.get('USUARIO_CACHE_MAX', 10000))
+
+CAMPOS_USUARIO = ('id', 'nome', 'email', 'tipo', 'telefone', 'cpf', 'endereco', 'cidade', 'estado', 'cep')
+
+
+class User:
+    """Usuário logado, no formato que o flask_login espera.
+
+    Com __slots__ e sem UserMixin (que traz __dict__). A mesma instância é
+    compartilhada entre requisições pelo cache, então não deve ser alterada:
+    depois de gravar no banco, invalide o cache.
+    """
+
+    __slots__ = CAMPOS_USUARIO
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, nome, email, tipo, telefone=None, cpf=None, endereco=None, cidade=None, estado=None, cep=None):
+        self.id = id
+        self.nome = nome
+        self.email = email
+        self.tipo = tipo
+        self.telefone = telefone
+        self.cpf = cpf
+        self.endereco = endereco
+        self.cidade = cidade
+        self.estado = estado
+        self.cep = cep
+
+    @classmethod
+    def da_linha(cls, row):
+        return cls(*(row[campo] for campo in CAMPOS_USUARIO))
+
+    def get_id(self):
+        return str(self.id)
+
+    def is_admin(self):
+        return self.tipo == 'admin'
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class CacheUsuarios:
+    """Usuários por id com validade curta, para o user_loader não ir ao banco a cada requisição.
+
+    Guarda também a ausência (usuário inexistente ou inativo), para um cookie
+    antigo não gerar uma consulta por requisição.
+    """
+
+    def __init__(self, ttl=USUARIO_CACHE_TTL, maximo=USUARIO_CACHE_MAX):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._itens = {}
+        self._lock = threading.Lock()
+
+    def obter(self, usuario_id):
+        try:
+            usuario_id = int(usuario_id)
+        except (TypeError, ValueError):
+            return None
+
+        item = self._itens.get(usuario_id)
+        if item is not None and item[1] > time.monotonic():
+            return item[0]
+
+        row = repositorio.buscar_usuario(usuario_id)
+        usuario = User.da_linha(row) if row else None
+        self._guardar(usuario_id, usuario)
+        return usuario
+
+    def guardar(self, usuario):
+        """Coloca no cache um usuário recém-carregado (login, cadastro)"""
+        self._guardar(usuario.id, usuario)
+
+    def _guardar(self, usuario_id, usuario):
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._itens) >= self.maximo:
+                self._itens = {k: v for k, v in self._itens.items() if v[1] > agora}
+                if len(self._itens) >= self.maximo:
+                    self._itens.clear()
+            self._itens[usuario_id] = (usuario, agora + self.ttl)
+
+    def invalidar(self, usuario_id=None):
+        """Descarta um usuário (após perfil, status ou tipo alterados) ou todos"""
+        with self._lock:
+            if usuario_id is None:
+                self._itens.clear()
+            else:
+                self._itens.pop(int(usuario_id), None)
+
+    def get_status(self):
+        return {'usuarios': len(self._itens), 'ttl': self.ttl, 'maximo': self.maximo}
+
+
+cache_usuarios = CacheUsuarios()